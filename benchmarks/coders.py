@@ -0,0 +1,91 @@
+import argparse
+import json
+import timeit
+import uuid
+from datetime import datetime, timedelta
+
+from coders import CODERS, COMPRESSORS, build_coder
+
+
+def queries_payload(rows: int) -> dict:
+    now = datetime.now()
+    user_id = uuid.uuid4()
+    return {"status": "success", "data": [{
+        "link_id": 1,
+        "user_id": user_id,
+        "short_code": "example",
+        "original_link": "https://www.google.com/search?q=shorten",
+        "accessed_at": now - timedelta(minutes=i)
+    } for i in range(rows)]}
+
+
+def expired_stats_payload(rows: int) -> dict:
+    now = datetime.now()
+    return {"status": "success", "data": [{
+        "short_url": f"http://localhost/links/code{i}",
+        "original_url": f"https://example.com/page/{i}",
+        "created_at": now - timedelta(days=2),
+        "clicks": i,
+        "last_accessed": now - timedelta(hours=i),
+        "expires_at": now - timedelta(days=1)
+    } for i in range(rows)]}
+
+
+PAYLOADS = {
+    "queries": queries_payload,
+    "expired_stats": expired_stats_payload,
+}
+
+
+def _available_compressions() -> list[str]:
+    available = ["none"]
+    for name, factory in COMPRESSORS.items():
+        try:
+            factory()
+        except RuntimeError:
+            continue
+        available.append(name)
+    return available
+
+
+def run(rows: int, number: int) -> list[dict]:
+    results = []
+    for payload_name, factory in PAYLOADS.items():
+        payload = factory(rows)
+        for coder_name in CODERS:
+            for compression in _available_compressions():
+                coder = build_coder(coder_name, compression, min_bytes=0)
+                encoded = coder.encode(payload)
+                encode_time = timeit.timeit(lambda: coder.encode(payload), number=number) / number
+                decode_time = timeit.timeit(lambda: coder.decode(encoded), number=number) / number
+                results.append({
+                    "payload": payload_name,
+                    "rows": rows,
+                    "coder": coder_name,
+                    "compression": compression,
+                    "bytes": len(encoded),
+                    "encode_us": round(encode_time * 1e6, 1),
+                    "decode_us": round(decode_time * 1e6, 1),
+                })
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare cache coders on list endpoint payloads")
+    parser.add_argument("--rows", type=int, default=1000)
+    parser.add_argument("--number", type=int, default=200)
+    parser.add_argument("--json", action="store_true", help="print machine-readable results")
+    args = parser.parse_args()
+
+    results = run(args.rows, args.number)
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print(f"{'payload':<14}{'coder':<9}{'compression':<13}{'bytes':>10}{'encode, us':>12}{'decode, us':>12}")
+    for r in results:
+        print(f"{r['payload']:<14}{r['coder']:<9}{r['compression']:<13}{r['bytes']:>10}{r['encode_us']:>12}{r['decode_us']:>12}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,48 @@
+import argparse
+import json
+import sys
+
+METRICS = ("p50_ms", "p95_ms", "p99_ms")
+
+
+def compare(baseline: dict, current: dict, threshold: float) -> list[str]:
+    regressions = []
+    for metric in METRICS:
+        before = baseline["latency"][metric]
+        after = current["latency"][metric]
+        if before and after > before * (1 + threshold):
+            regressions.append(f"{metric}: {before} -> {after} ms")
+    before = baseline["throughput_rps"]
+    after = current["throughput_rps"]
+    if before and after < before * (1 - threshold):
+        regressions.append(f"throughput_rps: {before} -> {after}")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare two benchmarks.load JSON reports")
+    parser.add_argument("baseline")
+    parser.add_argument("current")
+    parser.add_argument("--threshold", type=float, default=0.1, help="allowed relative regression")
+    args = parser.parse_args(argv)
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.current) as f:
+        current = json.load(f)
+    if (baseline["scenario"], baseline["mode"]) != (current["scenario"], current["mode"]):
+        sys.exit("Reports are for different scenarios or modes")
+
+    print(f"{baseline['scenario']} ({baseline['mode']}): {baseline['commit']} -> {current['commit']}")
+    for metric in METRICS:
+        print(f"  {metric:<15}{baseline['latency'][metric]:>10} -> {current['latency'][metric]}")
+    print(f"  {'throughput_rps':<15}{baseline['throughput_rps']:>10} -> {current['throughput_rps']}")
+
+    regressions = compare(baseline, current, args.threshold)
+    if regressions:
+        print("Regressions over threshold:\n  " + "\n  ".join(regressions))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
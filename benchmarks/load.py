@@ -0,0 +1,196 @@
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter, defaultdict
+from pathlib import Path
+
+import httpx
+
+from benchmarks.scenarios import SCENARIOS
+
+
+def percentile(sorted_values: list[float], q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = max(0, min(len(sorted_values) - 1, round(q / 100 * len(sorted_values) + 0.5) - 1))
+    return sorted_values[index]
+
+
+def summarize(latencies: list[float]) -> dict:
+    values = sorted(latencies)
+    return {
+        "count": len(values),
+        "p50_ms": round(percentile(values, 50) * 1000, 3),
+        "p95_ms": round(percentile(values, 95) * 1000, 3),
+        "p99_ms": round(percentile(values, 99) * 1000, 3),
+        "max_ms": round(values[-1] * 1000, 3) if values else 0.0,
+    }
+
+
+class Recorder:
+    def __init__(self):
+        self.latencies: list[float] = []
+        self.by_name: dict[str, list[float]] = defaultdict(list)
+        self.statuses: Counter = Counter()
+        self.errors: Counter = Counter()
+
+    def record(self, name: str, latency: float, status: int) -> None:
+        self.latencies.append(latency)
+        self.by_name[name].append(latency)
+        self.statuses[str(status)] += 1
+
+    def error(self, exc: Exception) -> None:
+        self.errors[type(exc).__name__] += 1
+
+
+async def _call(scenario, client, recorder: Recorder, started: float) -> None:
+    try:
+        name, response = await scenario.step(client)
+    except httpx.HTTPError as e:
+        recorder.error(e)
+        return
+    recorder.record(name, time.perf_counter() - started, response.status_code)
+
+
+async def closed_loop(scenario, client, recorder: Recorder, concurrency: int, duration: float) -> None:
+    deadline = time.perf_counter() + duration
+
+    async def worker():
+        while time.perf_counter() < deadline:
+            await _call(scenario, client, recorder, time.perf_counter())
+
+    await asyncio.gather(*[worker() for _ in range(concurrency)])
+
+
+async def open_loop(scenario, client, recorder: Recorder, rate: float, duration: float, max_in_flight: int) -> None:
+    # Latency is measured from the scheduled arrival time, so a slow server
+    # cannot hide queueing delay by slowing down the generator.
+    start = time.perf_counter()
+    in_flight: set[asyncio.Task] = set()
+    scheduled = start
+    while scheduled < start + duration:
+        scheduled += scenario.rng.expovariate(rate)
+        delay = scheduled - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        if len(in_flight) >= max_in_flight:
+            recorder.errors["dropped"] += 1
+            continue
+        task = asyncio.create_task(_call(scenario, client, recorder, scheduled))
+        in_flight.add(task)
+        task.add_done_callback(in_flight.discard)
+    if in_flight:
+        await asyncio.gather(*in_flight)
+
+
+def _git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=Path(__file__).resolve().parent.parent, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+async def _in_process_client(timeout: float, db_path: str) -> httpx.AsyncClient:
+    os.environ["DB_URL"] = f"sqlite+aiosqlite:///{db_path}"
+
+    from fastapi_cache import FastAPICache
+    from fastapi_cache.backends.inmemory import InMemoryBackend
+
+    from caching import request_key_builder
+    from coders import default_coder
+    from database import get_engine
+    from main import app
+    from models import Base
+
+    async with get_engine().begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    FastAPICache.init(InMemoryBackend(), prefix="fastapi-cache-bench", coder=default_coder, key_builder=request_key_builder)
+    app.state.ready = True
+    return httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench", timeout=timeout)
+
+
+async def run(args) -> dict:
+    scenario = SCENARIOS[args.scenario](links=args.links, zipf_s=args.zipf_s, seed=args.seed)
+    with contextlib.ExitStack() as stack:
+        if args.in_process:
+            # Every run gets an empty database of its own, so links and users
+            # left by earlier runs do not change what is measured.
+            db_dir = stack.enter_context(tempfile.TemporaryDirectory(prefix="bench-"))
+            client = await _in_process_client(args.timeout, os.path.join(db_dir, "bench.db"))
+        else:
+            limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+            client = httpx.AsyncClient(base_url=args.target, timeout=args.timeout, limits=limits)
+
+        async with client:
+            await scenario.setup(client)
+            if args.warmup > 0:
+                await closed_loop(scenario, client, Recorder(), args.concurrency, args.warmup)
+
+            recorder = Recorder()
+            started = time.perf_counter()
+            if args.mode == "open":
+                await open_loop(scenario, client, recorder, args.rate, args.duration, args.concurrency)
+            else:
+                await closed_loop(scenario, client, recorder, args.concurrency, args.duration)
+            elapsed = time.perf_counter() - started
+
+    return {
+        "scenario": scenario.name,
+        "mode": args.mode,
+        "target": "in-process" if args.in_process else args.target,
+        "commit": _git_commit(),
+        "python": platform.python_version(),
+        "duration_s": round(elapsed, 3),
+        "concurrency": args.concurrency,
+        "rate": args.rate if args.mode == "open" else None,
+        "throughput_rps": round(len(recorder.latencies) / elapsed, 2) if elapsed else 0.0,
+        "latency": summarize(recorder.latencies),
+        "requests": {name: summarize(values) for name, values in sorted(recorder.by_name.items())},
+        "statuses": dict(recorder.statuses),
+        "errors": dict(recorder.errors),
+    }
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Run a load scenario against the shortener")
+    parser.add_argument("scenario", choices=sorted(SCENARIOS))
+    parser.add_argument("--target", default="http://localhost:8000")
+    parser.add_argument("--in-process", action="store_true", help="drive main.app through ASGITransport with a fresh SQLite database")
+    parser.add_argument("--mode", choices=["closed", "open"], default="closed")
+    parser.add_argument("--rate", type=float, default=100, help="arrivals per second in open-loop mode")
+    parser.add_argument("--concurrency", type=int, default=32, help="workers (closed) or max in-flight requests (open)")
+    parser.add_argument("--duration", type=float, default=30)
+    parser.add_argument("--warmup", type=float, default=5)
+    parser.add_argument("--links", type=int, default=1000)
+    parser.add_argument("--zipf-s", type=float, default=1.1)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--timeout", type=float, default=10)
+    parser.add_argument("--out", help="write JSON results to this file instead of stdout")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    # Keep stdout for the JSON report, whatever the app or its libraries write.
+    with contextlib.redirect_stdout(sys.stderr):
+        result = asyncio.run(run(args))
+    output = json.dumps(result, indent=2)
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(output + "\n")
+    else:
+        sys.stdout.write(output + "\n")
+
+
+if __name__ == "__main__":
+    main()
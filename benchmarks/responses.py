@@ -0,0 +1,78 @@
+import argparse
+import json
+import timeit
+import uuid
+from datetime import datetime, timedelta
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from sqlalchemy import create_engine, insert, select
+from sqlalchemy.orm import Session
+
+from models import Base, Query
+from responses import FastJSONResponse, rows_response
+
+
+def query_rows(rows: int):
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine, tables=[Query.__table__])
+    now = datetime.now()
+    user_id = uuid.uuid4()
+    with Session(engine) as session:
+        session.execute(insert(Query), [{
+            "link_id": 1,
+            "user_id": user_id,
+            "short_code": "example",
+            "original_link": "https://www.google.com/search?q=shorten",
+            "accessed_at": now - timedelta(minutes=i)
+        } for i in range(rows)])
+        objects = session.execute(select(Query)).scalars().all()
+        mappings = session.execute(select(
+            Query.link_id, Query.user_id, Query.short_code, Query.original_link, Query.accessed_at
+        )).mappings().all()
+    return objects, mappings
+
+
+def _as_dicts(objects) -> dict:
+    return {"status": "success", "data": [{
+        "link_id": r.link_id,
+        "user_id": r.user_id,
+        "short_code": r.short_code,
+        "original_link": r.original_link,
+        "accessed_at": r.accessed_at
+    } for r in objects]}
+
+
+def run(rows: int, number: int) -> list[dict]:
+    objects, mappings = query_rows(rows)
+    cases = {
+        "dicts + jsonable_encoder + JSONResponse": lambda: JSONResponse(jsonable_encoder(_as_dicts(objects))),
+        "dicts + jsonable_encoder + FastJSONResponse": lambda: FastJSONResponse(jsonable_encoder(_as_dicts(objects))),
+        "Row mappings + rows_response": lambda: rows_response(mappings),
+    }
+    results = []
+    for name, case in cases.items():
+        seconds = timeit.timeit(case, number=number) / number
+        results.append({"case": name, "rows": rows, "us": round(seconds * 1e6, 1), "bytes": len(case().body)})
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare JSON rendering paths for list endpoints")
+    parser.add_argument("--rows", type=int, default=1000)
+    parser.add_argument("--number", type=int, default=100)
+    parser.add_argument("--json", action="store_true", help="print machine-readable results")
+    args = parser.parse_args()
+
+    results = run(args.rows, args.number)
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print(f"{'case':<46}{'rows':>6}{'us':>12}{'bytes':>10}")
+    for r in results:
+        print(f"{r['case']:<46}{r['rows']:>6}{r['us']:>12}{r['bytes']:>10}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+import abc
+import bisect
+import itertools
+import random
+import uuid
+from datetime import datetime, timedelta
+
+
+def zipf_cum_weights(n: int, s: float) -> list[float]:
+    return list(itertools.accumulate(1 / k ** s for k in range(1, n + 1)))
+
+
+class Scenario(abc.ABC):
+    name = ""
+
+    def __init__(self, links: int = 1000, zipf_s: float = 1.1, seed: int = 42):
+        self.links = links
+        self.zipf_s = zipf_s
+        self.rng = random.Random(seed)
+        self.codes: list[str] = []
+        self.headers: dict[str, str] = {}
+
+    async def setup(self, client) -> None:
+        pass
+
+    @abc.abstractmethod
+    async def step(self, client):
+        ...
+
+    async def _seed_links(self, client, count: int, prefix: str = "bench") -> None:
+        run = uuid.uuid4().hex[:6]
+        expires_at = (datetime.now() + timedelta(days=30)).strftime("%Y-%m-%d %H:%M")
+        for i in range(count):
+            code = f"{prefix}-{run}-{i}"
+            response = await client.post("/links/shorten", json={
+                "original_link": f"https://example.com/{prefix}/{i}",
+                "custom_alias": code,
+                "expires_at": expires_at
+            }, headers=self.headers)
+            response.raise_for_status()
+            self.codes.append(code)
+        self._cum_weights = zipf_cum_weights(len(self.codes), self.zipf_s)
+
+    def _zipf_code(self) -> str:
+        x = self.rng.random() * self._cum_weights[-1]
+        return self.codes[bisect.bisect_left(self._cum_weights, x)]
+
+    async def _login(self, client, premium: bool = False) -> None:
+        email = f"bench-{uuid.uuid4().hex[:8]}@example.com"
+        password = "bench-password"
+        response = await client.post("/auth/register", json={"email": email, "password": password})
+        response.raise_for_status()
+        response = await client.post("/auth/jwt/login", data={"username": email, "password": password})
+        response.raise_for_status()
+        self.headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+        if premium:
+            response = await client.put("/premium/premium", params={"status": True}, headers=self.headers)
+            response.raise_for_status()
+
+
+class RedirectZipf(Scenario):
+    name = "redirect_zipf"
+
+    async def setup(self, client):
+        await self._seed_links(client, self.links)
+
+    async def step(self, client):
+        return "redirect", await client.get(f"/links/{self._zipf_code()}", follow_redirects=False)
+
+
+class ShortenBurst(Scenario):
+    name = "shorten_burst"
+
+    async def step(self, client):
+        payload = {"original_link": f"https://example.com/burst/{self.rng.getrandbits(48)}"}
+        return "shorten", await client.post("/links/shorten", json=payload, headers=self.headers)
+
+
+class PremiumAnalytics(Scenario):
+    name = "premium_analytics"
+
+    async def setup(self, client):
+        await self._login(client, premium=True)
+        await self._seed_links(client, min(self.links, 100), prefix="premium")
+        for code in self.codes[:20]:
+            await client.get(f"/links/{code}", follow_redirects=False, headers=self.headers)
+
+    async def step(self, client):
+        choice = self.rng.random()
+        if choice < 0.4:
+            return "premium_stats", await client.get(f"/premium/{self._zipf_code()}/stats", headers=self.headers)
+        if choice < 0.8:
+            return "premium_queries", await client.get(f"/premium/{self._zipf_code()}/queries", headers=self.headers)
+        return "premium_expired_stats", await client.get("/premium/expired_stats", headers=self.headers)
+
+
+class Mixed(Scenario):
+    name = "mixed"
+
+    async def setup(self, client):
+        await self._login(client)
+        await self._seed_links(client, self.links, prefix="mixed")
+
+    async def step(self, client):
+        choice = self.rng.random()
+        if choice < 0.8:
+            return "redirect", await client.get(f"/links/{self._zipf_code()}", follow_redirects=False)
+        if choice < 0.9:
+            payload = {"original_link": f"https://example.com/mixed/{self.rng.getrandbits(48)}"}
+            return "shorten", await client.post("/links/shorten", json=payload, headers=self.headers)
+        if choice < 0.95:
+            params = {"original_url": f"https://example.com/mixed/{self.rng.randrange(self.links)}"}
+            return "search", await client.get("/links/search", params=params)
+        return "stats", await client.get(f"/links/{self._zipf_code()}/stats", headers=self.headers)
+
+
+class Scanner404(Scenario):
+    name = "scanner_404"
+
+    async def step(self, client):
+        return "redirect_404", await client.get(f"/links/scan-{self.rng.getrandbits(40):x}", follow_redirects=False)
+
+
+SCENARIOS = {scenario.name: scenario for scenario in (RedirectZipf, ShortenBurst, PremiumAnalytics, Mixed, Scanner404)}
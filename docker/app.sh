@@ -5,4 +5,8 @@ alembic upgrade head
 
 cd src
 
-gunicorn main:app --workers 4 --worker-class uvicorn.workers.UvicornWorker --bind=0.0.0.0:8000
\ No newline at end of file
+export PROMETHEUS_MULTIPROC_DIR=${PROMETHEUS_MULTIPROC_DIR:-/tmp/prometheus_multiproc}
+rm -rf "$PROMETHEUS_MULTIPROC_DIR"
+mkdir -p "$PROMETHEUS_MULTIPROC_DIR"
+
+gunicorn main:app --config gunicorn_conf.py --workers 4 --worker-class uvicorn.workers.UvicornWorker --bind=0.0.0.0:8000
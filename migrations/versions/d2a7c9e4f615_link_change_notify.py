@@ -0,0 +1,63 @@
+"""Link change notify
+
+Revision ID: d2a7c9e4f615
+Revises: b8e2f4a6c013
+Create Date: 2026-10-19 20:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd2a7c9e4f615'
+down_revision: Union[str, None] = 'b8e2f4a6c013'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# The payload carries only the keys of the row, so it stays far below the
+# 8000 byte NOTIFY limit; listeners read the rest of the row themselves.
+# Click updates do not touch the listed columns and do not notify.
+NOTIFY_FUNCTION = """
+CREATE OR REPLACE FUNCTION notify_link_change() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        PERFORM pg_notify('link_changes', json_build_object(
+            'op', TG_OP, 'id', OLD.id, 'domain', OLD.domain, 'short_code', OLD.short_code
+        )::text);
+    ELSIF TG_OP = 'UPDATE' THEN
+        PERFORM pg_notify('link_changes', json_build_object(
+            'op', TG_OP, 'id', NEW.id, 'domain', NEW.domain, 'short_code', NEW.short_code,
+            'old_domain', OLD.domain, 'old_short_code', OLD.short_code
+        )::text);
+    ELSE
+        PERFORM pg_notify('link_changes', json_build_object(
+            'op', TG_OP, 'id', NEW.id, 'domain', NEW.domain, 'short_code', NEW.short_code
+        )::text);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql
+"""
+
+NOTIFY_TRIGGER = """
+CREATE TRIGGER link_change_notify
+AFTER INSERT OR DELETE OR UPDATE OF domain, short_code, original_url, redirect_mode ON link
+FOR EACH ROW EXECUTE FUNCTION notify_link_change()
+"""
+
+
+def upgrade() -> None:
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    op.execute(NOTIFY_FUNCTION)
+    op.execute(NOTIFY_TRIGGER)
+
+
+def downgrade() -> None:
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    op.execute('DROP TRIGGER IF EXISTS link_change_notify ON link')
+    op.execute('DROP FUNCTION IF EXISTS notify_link_change()')
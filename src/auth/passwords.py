@@ -0,0 +1,87 @@
+import asyncio
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Optional
+
+from fastapi import HTTPException
+from fastapi_users.password import PasswordHelper
+from pwdlib import PasswordHash
+from pwdlib.hashers.argon2 import Argon2Hasher
+from pwdlib.hashers.bcrypt import BcryptHasher
+
+from config import (
+    PASSWORD_HASH_EXECUTOR, PASSWORD_HASH_WORKERS, PASSWORD_HASH_MAX_PENDING, PASSWORD_HASH_RETRY_AFTER,
+    ARGON2_TIME_COST, ARGON2_MEMORY_COST, ARGON2_PARALLELISM, BCRYPT_ROUNDS
+)
+
+
+def build_password_hash() -> PasswordHash:
+    return PasswordHash((
+        Argon2Hasher(time_cost=ARGON2_TIME_COST, memory_cost=ARGON2_MEMORY_COST, parallelism=ARGON2_PARALLELISM),
+        BcryptHasher(rounds=BCRYPT_ROUNDS),
+    ))
+
+
+# Module level, so process pool workers build their own hasher on import and
+# only the password strings cross the process boundary.
+password_hash = build_password_hash()
+
+
+def _hash(password: str) -> str:
+    return password_hash.hash(password)
+
+
+def _verify_and_update(plain_password: str, hashed_password: str) -> tuple[bool, Optional[str]]:
+    return password_hash.verify_and_update(plain_password, hashed_password)
+
+
+def _build_executor(kind: str, workers: int) -> Executor:
+    if kind == "thread":
+        return ThreadPoolExecutor(max_workers=workers, thread_name_prefix="password-hash")
+    if kind == "process":
+        return ProcessPoolExecutor(max_workers=workers)
+    raise ValueError(f"Unknown password hash executor {kind!r}, expected thread or process")
+
+
+class PooledPasswordHelper(PasswordHelper):
+    # argon2 and bcrypt release the GIL, so even the thread pool hashes on
+    # several cores while the event loop keeps serving redirects. At most
+    # max_pending hashes wait for the pool; beyond that auth requests get 503
+    # instead of building an unbounded queue.
+    def __init__(self, executor: Optional[Executor] = None, max_pending: int = PASSWORD_HASH_MAX_PENDING):
+        super().__init__(password_hash)
+        self._executor = executor
+        self.max_pending = max_pending
+        self.pending = 0
+
+    @property
+    def executor(self) -> Executor:
+        if self._executor is None:
+            self._executor = _build_executor(PASSWORD_HASH_EXECUTOR, PASSWORD_HASH_WORKERS)
+        return self._executor
+
+    async def _run(self, func, *args):
+        if self.pending >= self.max_pending:
+            raise HTTPException(
+                status_code=503,
+                detail="Too many authentication requests, retry later",
+                headers={"Retry-After": str(PASSWORD_HASH_RETRY_AFTER)}
+            )
+        self.pending += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self.executor, func, *args)
+        finally:
+            self.pending -= 1
+
+    async def hash_async(self, password: str) -> str:
+        return await self._run(_hash, password)
+
+    async def verify_and_update_async(self, plain_password: str, hashed_password: str) -> tuple[bool, Optional[str]]:
+        return await self._run(_verify_and_update, plain_password, hashed_password)
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+password_helper = PooledPasswordHelper()
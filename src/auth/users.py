@@ -1,48 +1,108 @@
+import logging
 import uuid
-from typing import Optional
+from typing import Any, Optional
 
 from fastapi import Depends, Request
-from fastapi_users import BaseUserManager, FastAPIUsers, UUIDIDMixin, models
+from fastapi.security import OAuth2PasswordRequestForm
+from fastapi_users import BaseUserManager, FastAPIUsers, UUIDIDMixin, exceptions, models, schemas
 from fastapi_users.authentication import (
     AuthenticationBackend,
     BearerTransport,
     JWTStrategy,
 )
 from fastapi_users.db import SQLAlchemyUserDatabase
+from fastapi_users.jwt import generate_jwt
 
 from models import User
 from auth.database import get_user_db
+from auth.passwords import password_helper
 from config import SECRET
+from tracing import traced
 
 
+logger = logging.getLogger(__name__)
+
 
 class UserManager(UUIDIDMixin, BaseUserManager[User, uuid.UUID]):
     reset_password_token_secret = SECRET
     verification_token_secret = SECRET
 
+    # Registration, login and password updates hash in the password helper's
+    # pool instead of on the event loop.
+    async def create(self, user_create: schemas.UC, safe: bool = False, request: Optional[Request] = None) -> User:
+        await self.validate_password(user_create.password, user_create)
+
+        existing_user = await self.user_db.get_by_email(user_create.email)
+        if existing_user is not None:
+            raise exceptions.UserAlreadyExists()
+
+        user_dict = user_create.create_update_dict() if safe else user_create.create_update_dict_superuser()
+        password = user_dict.pop("password")
+        user_dict["hashed_password"] = await self.password_helper.hash_async(password)
+
+        created_user = await self.user_db.create(user_dict)
+        await self.on_after_register(created_user, request)
+        return created_user
+
+    async def authenticate(self, credentials: OAuth2PasswordRequestForm) -> Optional[User]:
+        try:
+            user = await self.get_by_email(credentials.username)
+        except exceptions.UserNotExists:
+            # Hash anyway, so response time does not reveal unknown emails.
+            await self.password_helper.hash_async(credentials.password)
+            return None
+
+        verified, updated_password_hash = await self.password_helper.verify_and_update_async(
+            credentials.password, user.hashed_password
+        )
+        if not verified:
+            return None
+        if updated_password_hash is not None:
+            await self.user_db.update(user, {"hashed_password": updated_password_hash})
+        return user
+
+    async def _update(self, user: User, update_dict: dict[str, Any]) -> User:
+        password = update_dict.get("password")
+        if password is not None:
+            await self.validate_password(password, user)
+            update_dict = {field: value for field, value in update_dict.items() if field != "password"}
+            update_dict["hashed_password"] = await self.password_helper.hash_async(password)
+        return await super()._update(user, update_dict)
+
     async def on_after_register(self, user: User, request: Optional[Request] = None):
-        print(f"User {user.id} has registered.")
+        logger.info("User registered", extra={"user_id": str(user.id)})
 
     async def on_after_forgot_password(
         self, user: User, token: str, request: Optional[Request] = None
     ):
-        print(f"User {user.id} has forgot their password. Reset token: {token}")
+        logger.info("Password reset requested", extra={"user_id": str(user.id)})
 
     async def on_after_request_verify(
         self, user: User, token: str, request: Optional[Request] = None
     ):
-        print(f"Verification requested for user {user.id}. Verification token: {token}")
+        logger.info("Verification requested", extra={"user_id": str(user.id)})
 
 
 async def get_user_manager(user_db: SQLAlchemyUserDatabase = Depends(get_user_db)):
-    yield UserManager(user_db)
+    yield UserManager(user_db, password_helper)
 
 
 bearer_transport = BearerTransport(tokenUrl="auth/jwt/login")
 
 
+class ShortenerJWTStrategy(JWTStrategy[models.UP, models.ID]):
+    @traced("auth.jwt.read_token")
+    async def read_token(self, token, user_manager):
+        return await super().read_token(token, user_manager)
+
+    async def write_token(self, user: User) -> str:
+        # The premium claim lets the rate limiter pick a tier without a DB lookup.
+        data = {"sub": str(user.id), "aud": self.token_audience, "premium": bool(user.is_premium)}
+        return generate_jwt(data, self.encode_key, self.lifetime_seconds, algorithm=self.algorithm)
+
+
 def get_jwt_strategy() -> JWTStrategy[models.UP, models.ID]:
-    return JWTStrategy(secret=SECRET, lifetime_seconds=3600)
+    return ShortenerJWTStrategy(secret=SECRET, lifetime_seconds=3600)
 
 
 auth_backend = AuthenticationBackend(
@@ -53,4 +113,4 @@ auth_backend = AuthenticationBackend(
 
 fastapi_users = FastAPIUsers[User, uuid.UUID](get_user_manager, [auth_backend])
 
-current_active_user = fastapi_users.current_user(optional=True, active=True)
\ No newline at end of file
+current_active_user = traced("auth.current_user")(fastapi_users.current_user(optional=True, active=True))
\ No newline at end of file
@@ -0,0 +1,278 @@
+import asyncio
+import hashlib
+import logging
+import math
+import random
+import secrets
+import time
+from dataclasses import dataclass
+from functools import wraps
+from typing import Any, Awaitable, Callable, Optional, Type
+
+from fastapi import HTTPException
+from fastapi_cache import FastAPICache
+from fastapi_cache.coder import Coder
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette.responses import JSONResponse
+
+from config import (
+    CACHE_REDIS_LOCK, CACHE_LOCK_TIMEOUT_MS, CACHE_LOCK_POLL_INTERVAL,
+    CACHE_SOFT_TTL, CACHE_HARD_TTL, CACHE_TTL_JITTER
+)
+from coders import body_coder
+from database import get_session_maker
+from metrics import record_cache
+from responses import body_response
+
+
+logger = logging.getLogger(__name__)
+
+_background_tasks = set()
+
+_VALUE = b"v"
+_BODY = b"b"
+
+_RELEASE_LOCK_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+
+def _key_part(value: Any) -> Any:
+    if hasattr(value, "id"):
+        return value.id
+    return value
+
+
+def request_key_builder(
+    func: Callable[..., Any],
+    namespace: str = "",
+    *,
+    request: Any = None,
+    response: Any = None,
+    args: tuple = (),
+    kwargs: Optional[dict] = None
+) -> str:
+    parts = {
+        name: _key_part(value)
+        for name, value in sorted((kwargs or {}).items())
+        if not isinstance(value, AsyncSession)
+    }
+    raw = f"{func.__module__}:{func.__name__}:{args}:{parts}"
+    return f"{namespace}:{hashlib.md5(raw.encode()).hexdigest()}"  # noqa: S324
+
+
+class SingleFlight:
+    def __init__(self):
+        self._calls: dict[str, asyncio.Future] = {}
+
+    def in_flight(self, key: str) -> bool:
+        return key in self._calls
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        task = self._calls.get(key)
+        if task is None:
+            task = asyncio.ensure_future(fn())
+            self._calls[key] = task
+            task.add_done_callback(lambda done: self._forget(key, done))
+        return await asyncio.shield(task)
+
+    def _forget(self, key: str, task: asyncio.Future) -> None:
+        if self._calls.get(key) is task:
+            del self._calls[key]
+        if not task.cancelled():
+            task.exception()
+
+
+async def delete_key(key: str) -> None:
+    try:
+        await FastAPICache.get_backend().clear(key=key)
+    except KeyError:
+        pass
+    except Exception:
+        logger.warning("Cannot delete cache key %s", key, exc_info=True)
+
+
+def _finish_background_task(task: asyncio.Task) -> None:
+    _background_tasks.discard(task)
+    if not task.cancelled():
+        task.exception()
+
+
+def spawn(coro: Awaitable[Any]) -> asyncio.Task:
+    task = asyncio.ensure_future(coro)
+    _background_tasks.add(task)
+    task.add_done_callback(_finish_background_task)
+    return task
+
+
+def _redis_client():
+    if not CACHE_REDIS_LOCK:
+        return None
+    return getattr(FastAPICache.get_backend(), "redis", None)
+
+
+async def locked_fetch(
+    key: str,
+    fetch: Callable[[], Awaitable[Any]],
+    read_cached: Callable[[], Awaitable[Any]]
+) -> Any:
+    redis = _redis_client()
+    if redis is None:
+        return await fetch()
+
+    lock_key = f"{key}:lock"
+    token = secrets.token_hex(8)
+    try:
+        acquired = await redis.set(lock_key, token, nx=True, px=CACHE_LOCK_TIMEOUT_MS)
+    except Exception:
+        logger.warning("Cannot acquire cache lock %s", lock_key, exc_info=True)
+        return await fetch()
+
+    if acquired:
+        try:
+            return await fetch()
+        finally:
+            try:
+                await redis.eval(_RELEASE_LOCK_SCRIPT, 1, lock_key, token)
+            except Exception:
+                logger.warning("Cannot release cache lock %s", lock_key, exc_info=True)
+
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + CACHE_LOCK_TIMEOUT_MS / 1000
+    while loop.time() < deadline:
+        await asyncio.sleep(CACHE_LOCK_POLL_INTERVAL)
+        cached = await read_cached()
+        if cached is not None:
+            return cached
+    return await fetch()
+
+
+@dataclass(frozen=True)
+class CachePolicy:
+    soft_ttl: int = CACHE_SOFT_TTL
+    hard_ttl: int = CACHE_HARD_TTL
+    jitter: float = CACHE_TTL_JITTER
+    refresh_ahead: bool = True
+    serve_stale_on_error: bool = True
+    namespace: str = ""
+    coder: Optional[Type[Coder]] = None
+
+    def ttls(self) -> tuple[float, int]:
+        factor = 1 + random.uniform(-self.jitter, self.jitter)  # noqa: S311
+        soft_ttl = self.soft_ttl * factor
+        hard_ttl = max(math.ceil(self.hard_ttl * factor), math.ceil(soft_ttl))
+        return soft_ttl, hard_ttl
+
+    def get_coder(self) -> Type[Coder]:
+        return self.coder or FastAPICache.get_coder()
+
+
+async def _read_entry(key: str) -> Optional[tuple[float, bytes, bytes]]:
+    try:
+        raw = await FastAPICache.get_backend().get(key)
+    except Exception:
+        logger.warning("Cannot read cache key %s", key, exc_info=True)
+        return None
+    if raw is None:
+        return None
+    header, _, payload = raw.partition(b"\n")
+    stale_at, _, kind = header.partition(b" ")
+    return float(stale_at), kind, payload
+
+
+def _decode_entry(kind: bytes, payload: bytes, policy: CachePolicy) -> Any:
+    if kind == _BODY:
+        return body_response(body_coder.decode(payload))
+    return policy.get_coder().decode(payload)
+
+
+async def _write_entry(key: str, value: Any, policy: CachePolicy) -> None:
+    soft_ttl, hard_ttl = policy.ttls()
+    if isinstance(value, JSONResponse):
+        kind, payload = _BODY, body_coder.encode(bytes(value.body))
+    else:
+        kind, payload = _VALUE, policy.get_coder().encode(value)
+    raw = f"{time.time() + soft_ttl:.3f} ".encode() + kind + b"\n" + payload
+    try:
+        await FastAPICache.get_backend().set(key, raw, hard_ttl)
+    except Exception:
+        logger.warning("Cannot write cache key %s", key, exc_info=True)
+
+
+async def _read_fresh(key: str, policy: CachePolicy) -> Any:
+    entry = await _read_entry(key)
+    if entry is None or entry[0] <= time.time():
+        return None
+    return _decode_entry(entry[1], entry[2], policy)
+
+
+async def _refresh(key: str, func: Callable[..., Awaitable[Any]], args: tuple, kwargs: dict, policy: CachePolicy) -> Any:
+    try:
+        if any(isinstance(value, AsyncSession) for value in kwargs.values()):
+            async with get_session_maker()() as session:
+                kwargs = {
+                    name: session if isinstance(value, AsyncSession) else value
+                    for name, value in kwargs.items()
+                }
+                value = await func(*args, **kwargs)
+        else:
+            value = await func(*args, **kwargs)
+    except HTTPException:
+        await delete_key(key)
+        raise
+    except Exception:
+        logger.warning("Background refresh of %s failed, keeping stale value", key, exc_info=True)
+        raise
+    await _write_entry(key, value, policy)
+    return value
+
+
+def cached(policy: CachePolicy = CachePolicy()):
+    def wrapper(func: Callable[..., Awaitable[Any]]) -> Callable[..., Awaitable[Any]]:
+        flight = SingleFlight()
+        cache_name = policy.namespace or func.__name__
+
+        async def compute(key: str, args: tuple, kwargs: dict) -> Any:
+            value = await func(*args, **kwargs)
+            await _write_entry(key, value, policy)
+            return value
+
+        @wraps(func)
+        async def inner(*args, **kwargs):
+            if not FastAPICache.get_enable():
+                return await func(*args, **kwargs)
+
+            key = request_key_builder(func, f"{FastAPICache.get_prefix()}:{policy.namespace}", args=args, kwargs=kwargs)
+            entry = await _read_entry(key)
+            if entry is not None:
+                stale_at, kind, payload = entry
+                if stale_at > time.time():
+                    record_cache(cache_name, "hit")
+                    return _decode_entry(kind, payload, policy)
+                if policy.refresh_ahead:
+                    record_cache(cache_name, "stale")
+                    if not flight.in_flight(key):
+                        spawn(flight.do(key, lambda: _refresh(key, func, args, kwargs, policy)))
+                    return _decode_entry(kind, payload, policy)
+
+            record_cache(cache_name, "miss")
+            try:
+                return await flight.do(key, lambda: locked_fetch(
+                    key,
+                    lambda: compute(key, args, kwargs),
+                    lambda: _read_fresh(key, policy)
+                ))
+            except HTTPException:
+                raise
+            except Exception:
+                if entry is None or not policy.serve_stale_on_error:
+                    raise
+                logger.warning("Serving stale value for %s", key, exc_info=True)
+                return _decode_entry(entry[1], entry[2], policy)
+
+        return inner
+
+    return wrapper
@@ -0,0 +1,234 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Optional
+
+from fastapi_cache import FastAPICache
+from fastapi_cache.types import Backend
+from sqlalchemy import event, exc
+
+from config import (
+    CACHE_BREAKER_FAILURES, CACHE_BREAKER_RESET, CACHE_BREAKER_TIMEOUT_MS, CACHE_FALLBACK_SIZE, CACHE_FALLBACK_TTL,
+    DB_BREAKER_FAILURES, DB_BREAKER_RESET
+)
+from metrics import CIRCUIT_BREAKER_STATE
+
+
+logger = logging.getLogger(__name__)
+
+CLOSED = "closed"
+HALF_OPEN = "half_open"
+OPEN = "open"
+
+_STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+
+class CircuitOpenError(Exception):
+    pass
+
+
+class CircuitBreaker:
+    # Opens after failure_threshold consecutive failures. Once reset_timeout
+    # has passed one probe is let through (half-open): its success closes the
+    # breaker, its failure opens it for another reset_timeout.
+    def __init__(
+        self,
+        name: str,
+        failure_threshold: int,
+        reset_timeout: float,
+        call_timeout: Optional[float] = None
+    ):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.call_timeout = call_timeout
+        self.state = CLOSED
+        self._failures = 0
+        self._retry_at = 0.0
+        CIRCUIT_BREAKER_STATE.labels(name).set(_STATE_VALUES[CLOSED])
+
+    def _set_state(self, state: str) -> None:
+        if state != self.state:
+            logger.warning("Circuit breaker %s is %s", self.name, state.replace("_", "-"))
+            self.state = state
+            CIRCUIT_BREAKER_STATE.labels(self.name).set(_STATE_VALUES[state])
+
+    def allow(self) -> bool:
+        if self.state == CLOSED:
+            return True
+        now = time.monotonic()
+        if now < self._retry_at:
+            return False
+        # Only one probe per reset_timeout; if it never reports back, the
+        # next one goes out after another reset_timeout.
+        self._set_state(HALF_OPEN)
+        self._retry_at = now + self.reset_timeout
+        return True
+
+    def record_success(self) -> None:
+        self._failures = 0
+        self._set_state(CLOSED)
+
+    def record_failure(self) -> None:
+        self._failures += 1
+        if self.state == HALF_OPEN or self._failures >= self.failure_threshold:
+            self._retry_at = time.monotonic() + self.reset_timeout
+            self._set_state(OPEN)
+
+    async def call(self, fn: Callable[[], Awaitable[Any]]) -> Any:
+        if not self.allow():
+            raise CircuitOpenError(self.name)
+        try:
+            result = await asyncio.wait_for(fn(), self.call_timeout)
+        except Exception:
+            self.record_failure()
+            raise
+        self.record_success()
+        return result
+
+
+class LocalCache:
+    def __init__(self, maxsize: int = CACHE_FALLBACK_SIZE):
+        self.maxsize = maxsize
+        self._entries: OrderedDict[str, tuple[float, bytes]] = OrderedDict()
+
+    def get_with_ttl(self, key: str) -> tuple[int, Optional[bytes]]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return -2, None
+        expires_at, value = entry
+        ttl = expires_at - time.monotonic()
+        if ttl <= 0:
+            del self._entries[key]
+            return -2, None
+        self._entries.move_to_end(key)
+        return int(ttl), value
+
+    def get(self, key: str) -> Optional[bytes]:
+        return self.get_with_ttl(key)[1]
+
+    def set(self, key: str, value: bytes, expire: Optional[int] = None) -> None:
+        self._entries[key] = (time.monotonic() + expire if expire else float("inf"), value)
+        self._entries.move_to_end(key)
+        if len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def clear(self, namespace: Optional[str] = None, key: Optional[str] = None) -> int:
+        if key:
+            return 1 if self._entries.pop(key, None) is not None else 0
+        if namespace:
+            keys = [name for name in self._entries if name.startswith(f"{namespace}:")]
+            for name in keys:
+                del self._entries[name]
+            return len(keys)
+        return 0
+
+
+class BreakerBackend(Backend):
+    # While Redis is unavailable, writes go to a small in-process LRU for at
+    # most fallback_ttl seconds and reads are answered from it (a miss falls
+    # through to the database), so a stalled Redis costs at most call_timeout.
+    # Values written while Redis works are never copied locally: other
+    # workers' invalidations could not reach such a copy.
+    def __init__(
+        self,
+        backend: Backend,
+        breaker: CircuitBreaker = None,
+        local: LocalCache = None,
+        fallback_ttl: float = CACHE_FALLBACK_TTL
+    ):
+        self._backend = backend
+        self.breaker = breaker or CircuitBreaker(
+            "cache", CACHE_BREAKER_FAILURES, CACHE_BREAKER_RESET, CACHE_BREAKER_TIMEOUT_MS / 1000
+        )
+        self.local = local or LocalCache()
+        self.fallback_ttl = fallback_ttl
+        self._clears: OrderedDict[tuple[Optional[str], Optional[str]], None] = OrderedDict()
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._backend, name)
+
+    @property
+    def redis(self):
+        # Locks and rate limits fall back to their local versions without it.
+        if self.breaker.state != CLOSED:
+            return None
+        return getattr(self._backend, "redis", None)
+
+    def _queue_clear(self, namespace: Optional[str], key: Optional[str]) -> None:
+        if len(self._clears) >= self.local.maxsize:
+            # Too many to replay one by one: drop the whole cache instead.
+            self._clears = OrderedDict({(FastAPICache.get_prefix(), None): None})
+        else:
+            self._clears[(namespace, key)] = None
+
+    async def _replay_clears(self) -> None:
+        # Invalidations that failed while Redis was unavailable go out before
+        # any other command, so Redis never serves what was deleted meanwhile.
+        while self._clears:
+            namespace, key = next(iter(self._clears))
+            await self.breaker.call(lambda: self._backend.clear(namespace, key))
+            self._clears.pop((namespace, key), None)
+
+    async def get_with_ttl(self, key: str):
+        try:
+            await self._replay_clears()
+            return await self.breaker.call(lambda: self._backend.get_with_ttl(key))
+        except Exception:
+            return self.local.get_with_ttl(key)
+
+    async def get(self, key: str):
+        try:
+            await self._replay_clears()
+            return await self.breaker.call(lambda: self._backend.get(key))
+        except Exception:
+            return self.local.get(key)
+
+    async def set(self, key: str, value: bytes, expire: Optional[int] = None) -> None:
+        try:
+            await self._replay_clears()
+            await self.breaker.call(lambda: self._backend.set(key, value, expire))
+        except Exception:
+            self.local.set(key, value, min(expire, self.fallback_ttl) if expire else self.fallback_ttl)
+        else:
+            self.local.clear(key=key)
+
+    async def clear(self, namespace: Optional[str] = None, key: Optional[str] = None) -> int:
+        self.local.clear(namespace, key)
+        try:
+            await self._replay_clears()
+            return await self.breaker.call(lambda: self._backend.clear(namespace, key))
+        except Exception:
+            self._queue_clear(namespace, key)
+            return 0
+
+
+db_breaker = CircuitBreaker("database", DB_BREAKER_FAILURES, DB_BREAKER_RESET)
+
+
+def _is_unavailable(error: Optional[BaseException]) -> bool:
+    while error is not None:
+        if isinstance(error, (TimeoutError, OSError, exc.TimeoutError)):
+            return True
+        error = error.__cause__
+    return False
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    db_breaker.record_success()
+
+
+def _handle_error(context):
+    # Only connectivity problems and timeouts count; constraint violations
+    # and other query errors say nothing about the database being healthy.
+    if context.is_disconnect or _is_unavailable(context.original_exception):
+        db_breaker.record_failure()
+
+
+def guard_engine(engine) -> None:
+    sync_engine = getattr(engine, "sync_engine", engine)
+    if event.contains(sync_engine, "handle_error", _handle_error):
+        return
+    event.listen(sync_engine, "after_cursor_execute", _after_cursor_execute)
+    event.listen(sync_engine, "handle_error", _handle_error)
@@ -0,0 +1,167 @@
+import struct
+import uuid
+import zlib
+from datetime import date, datetime, timedelta, timezone
+from decimal import Decimal
+from typing import Any, Callable, Type
+
+import msgpack
+import orjson
+from fastapi_cache.coder import Coder, JsonCoder
+from starlette.responses import JSONResponse
+
+from config import CACHE_CODER, CACHE_LIST_CODER, CACHE_COMPRESSION, CACHE_COMPRESSION_MIN_BYTES
+
+
+_EPOCH = datetime(1970, 1, 1)
+_EPOCH_UTC = datetime(1970, 1, 1, tzinfo=timezone.utc)
+_INT64 = struct.Struct(">q")
+
+_EXT_DATETIME = 1
+_EXT_DATETIME_UTC = 2
+_EXT_DATE = 3
+_EXT_UUID = 4
+_EXT_DECIMAL = 5
+
+
+class OrjsonCoder(Coder):
+    @classmethod
+    def encode(cls, value: Any) -> bytes:
+        if isinstance(value, JSONResponse):
+            return value.body
+        return orjson.dumps(value, option=orjson.OPT_NON_STR_KEYS)
+
+    @classmethod
+    def decode(cls, value: bytes) -> Any:
+        return orjson.loads(value)
+
+
+def _micros(delta) -> int:
+    return (delta.days * 86400 + delta.seconds) * 1_000_000 + delta.microseconds
+
+
+def _msgpack_default(obj: Any) -> Any:
+    if isinstance(obj, datetime):
+        if obj.tzinfo is None:
+            return msgpack.ExtType(_EXT_DATETIME, _INT64.pack(_micros(obj - _EPOCH)))
+        return msgpack.ExtType(_EXT_DATETIME_UTC, _INT64.pack(_micros(obj - _EPOCH_UTC)))
+    if isinstance(obj, date):
+        return msgpack.ExtType(_EXT_DATE, _INT64.pack(obj.toordinal()))
+    if isinstance(obj, uuid.UUID):
+        return msgpack.ExtType(_EXT_UUID, obj.bytes)
+    if isinstance(obj, Decimal):
+        return msgpack.ExtType(_EXT_DECIMAL, str(obj).encode())
+    raise TypeError(f"Cannot serialize {type(obj).__name__} with msgpack")
+
+
+def _msgpack_ext_hook(code: int, data: bytes) -> Any:
+    if code == _EXT_DATETIME:
+        return _EPOCH + timedelta(microseconds=_INT64.unpack(data)[0])
+    if code == _EXT_DATETIME_UTC:
+        return _EPOCH_UTC + timedelta(microseconds=_INT64.unpack(data)[0])
+    if code == _EXT_DATE:
+        return date.fromordinal(_INT64.unpack(data)[0])
+    if code == _EXT_UUID:
+        return uuid.UUID(bytes=data)
+    if code == _EXT_DECIMAL:
+        return Decimal(data.decode())
+    return msgpack.ExtType(code, data)
+
+
+class MsgpackCoder(Coder):
+    @classmethod
+    def encode(cls, value: Any) -> bytes:
+        if isinstance(value, JSONResponse):
+            value = orjson.loads(value.body)
+        return msgpack.packb(value, default=_msgpack_default, use_bin_type=True)
+
+    @classmethod
+    def decode(cls, value: bytes) -> Any:
+        return msgpack.unpackb(value, ext_hook=_msgpack_ext_hook, raw=False, strict_map_key=False)
+
+
+class RawCoder(Coder):
+    @classmethod
+    def encode(cls, value: bytes) -> bytes:
+        return value
+
+    @classmethod
+    def decode(cls, value: bytes) -> bytes:
+        return value
+
+
+def _zlib() -> tuple[Callable[[bytes], bytes], Callable[[bytes], bytes]]:
+    return (lambda data: zlib.compress(data, 1)), zlib.decompress
+
+
+def _zstd() -> tuple[Callable[[bytes], bytes], Callable[[bytes], bytes]]:
+    try:
+        import zstandard
+    except ImportError as e:
+        raise RuntimeError("Install zstandard to use zstd cache compression") from e
+    return zstandard.ZstdCompressor(level=3).compress, zstandard.ZstdDecompressor().decompress
+
+
+def _lz4() -> tuple[Callable[[bytes], bytes], Callable[[bytes], bytes]]:
+    try:
+        import lz4.frame
+    except ImportError as e:
+        raise RuntimeError("Install lz4 to use lz4 cache compression") from e
+    return lz4.frame.compress, lz4.frame.decompress
+
+
+CODERS: dict[str, Type[Coder]] = {
+    "json": JsonCoder,
+    "orjson": OrjsonCoder,
+    "msgpack": MsgpackCoder,
+}
+
+COMPRESSORS = {
+    "zlib": _zlib,
+    "zstd": _zstd,
+    "lz4": _lz4,
+}
+
+_RAW = b"\x00"
+_COMPRESSED = b"\x01"
+
+
+def compressed(coder: Type[Coder], algorithm: str = "zlib", min_bytes: int = 1024) -> Type[Coder]:
+    compress, decompress = COMPRESSORS[algorithm]()
+
+    class CompressedCoder(coder):
+        @classmethod
+        def encode(cls, value: Any) -> bytes:
+            data = coder.encode(value)
+            if len(data) < min_bytes:
+                return _RAW + data
+            return _COMPRESSED + compress(data)
+
+        @classmethod
+        def decode(cls, value: bytes) -> Any:
+            if value[:1] == _COMPRESSED:
+                return coder.decode(decompress(value[1:]))
+            return coder.decode(value[1:])
+
+    CompressedCoder.__name__ = f"{algorithm.capitalize()}{coder.__name__}"
+    return CompressedCoder
+
+
+def build_coder(name: str, compression: str = "none", min_bytes: int = 1024) -> Type[Coder]:
+    if name not in CODERS:
+        raise ValueError(f"Unknown cache coder {name!r}, expected one of {sorted(CODERS)}")
+    if compression == "none":
+        return CODERS[name]
+    if compression not in COMPRESSORS:
+        raise ValueError(f"Unknown cache compression {compression!r}, expected one of {sorted(COMPRESSORS)}")
+    return compressed(CODERS[name], compression, min_bytes)
+
+
+default_coder = build_coder(CACHE_CODER, CACHE_COMPRESSION, CACHE_COMPRESSION_MIN_BYTES)
+list_coder = build_coder(CACHE_LIST_CODER, CACHE_COMPRESSION, CACHE_COMPRESSION_MIN_BYTES)
+# Response bodies are bytes already; RawCoder is not in CODERS because it
+# cannot encode the dict payloads the other coders are chosen for.
+if CACHE_COMPRESSION == "none":
+    body_coder = RawCoder
+else:
+    body_coder = compressed(RawCoder, CACHE_COMPRESSION, CACHE_COMPRESSION_MIN_BYTES)
@@ -11,4 +11,140 @@ DB_PORT = os.getenv("DB_PORT")
 DB_NAME = os.getenv("DB_NAME")
 DB_URL = os.getenv("DB_URL")
 
-SECRET = "SECRET"
\ No newline at end of file
+SECRET = "SECRET"
+
+REDIS_URL = os.getenv("REDIS_URL", "redis://redis:6379")
+REDIS_MAX_CONNECTIONS = int(os.getenv("REDIS_MAX_CONNECTIONS", 50))
+REDIS_POOL_TIMEOUT = float(os.getenv("REDIS_POOL_TIMEOUT", 1))
+REDIS_SOCKET_TIMEOUT = float(os.getenv("REDIS_SOCKET_TIMEOUT", 0.5))
+REDIS_CONNECT_TIMEOUT = float(os.getenv("REDIS_CONNECT_TIMEOUT", 1))
+REDIS_HEALTH_CHECK_INTERVAL = int(os.getenv("REDIS_HEALTH_CHECK_INTERVAL", 30))
+REDIS_PIPELINING = os.getenv("REDIS_PIPELINING", "true").lower() == "true"
+REDIS_PIPELINE_MAX_BATCH = int(os.getenv("REDIS_PIPELINE_MAX_BATCH", 256))
+
+CACHE_BREAKER_TIMEOUT_MS = float(os.getenv("CACHE_BREAKER_TIMEOUT_MS", 50))
+CACHE_BREAKER_FAILURES = int(os.getenv("CACHE_BREAKER_FAILURES", 5))
+CACHE_BREAKER_RESET = float(os.getenv("CACHE_BREAKER_RESET", 5))
+CACHE_FALLBACK_SIZE = int(os.getenv("CACHE_FALLBACK_SIZE", 1024))
+CACHE_FALLBACK_TTL = float(os.getenv("CACHE_FALLBACK_TTL", 10))
+
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", 2))
+DB_CONNECT_TIMEOUT = float(os.getenv("DB_CONNECT_TIMEOUT", 2))
+DB_COMMAND_TIMEOUT = float(os.getenv("DB_COMMAND_TIMEOUT", 10))
+DB_BREAKER_FAILURES = int(os.getenv("DB_BREAKER_FAILURES", 5))
+DB_BREAKER_RESET = float(os.getenv("DB_BREAKER_RESET", 5))
+
+LINK_CACHE_EXPIRE = int(os.getenv("LINK_CACHE_EXPIRE", 60))
+LINK_CACHE_STALE_TTL = int(os.getenv("LINK_CACHE_STALE_TTL", 30))
+CACHE_WARMUP_LIMIT = int(os.getenv("CACHE_WARMUP_LIMIT", 1000))
+CACHE_WARMUP_TIMEOUT = float(os.getenv("CACHE_WARMUP_TIMEOUT", 10))
+CACHE_WARMUP_MAX_BYTES = int(os.getenv("CACHE_WARMUP_MAX_BYTES", 8 * 1024 * 1024))
+
+
+CACHE_REDIS_LOCK = os.getenv("CACHE_REDIS_LOCK", "false").lower() == "true"
+CACHE_LOCK_TIMEOUT_MS = int(os.getenv("CACHE_LOCK_TIMEOUT_MS", 200))
+CACHE_LOCK_POLL_INTERVAL = float(os.getenv("CACHE_LOCK_POLL_INTERVAL", 0.01))
+
+CACHE_SOFT_TTL = int(os.getenv("CACHE_SOFT_TTL", 60))
+CACHE_HARD_TTL = int(os.getenv("CACHE_HARD_TTL", 120))
+CACHE_TTL_JITTER = float(os.getenv("CACHE_TTL_JITTER", 0.1))
+
+CACHE_CODER = os.getenv("CACHE_CODER", "orjson")
+CACHE_LIST_CODER = os.getenv("CACHE_LIST_CODER", "orjson")
+CACHE_COMPRESSION = os.getenv("CACHE_COMPRESSION", "zlib")
+CACHE_COMPRESSION_MIN_BYTES = int(os.getenv("CACHE_COMPRESSION_MIN_BYTES", 2048))
+
+QUERY_PROFILING = os.getenv("QUERY_PROFILING", "off")
+QUERY_PROFILING_HEADER = os.getenv("QUERY_PROFILING_HEADER", "X-Query-Profile")
+QUERY_PROFILING_SECRET = os.getenv("QUERY_PROFILING_SECRET", "")
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", 100))
+SLOW_QUERY_EXPLAIN_RATE = float(os.getenv("SLOW_QUERY_EXPLAIN_RATE", 1.0))
+SLOW_QUERY_EXPLAIN_LIMIT = int(os.getenv("SLOW_QUERY_EXPLAIN_LIMIT", 3))
+
+TRACING_ENABLED = os.getenv("TRACING_ENABLED", "false").lower() == "true"
+TRACING_EXPORTER = os.getenv("TRACING_EXPORTER", "file")
+TRACING_FILE = os.getenv("TRACING_FILE", "traces.jsonl")
+TRACING_SAMPLE_RATE = float(os.getenv("TRACING_SAMPLE_RATE", 0.05))
+TRACING_SLOW_MS = float(os.getenv("TRACING_SLOW_MS", 250))
+TRACING_MAX_PENDING_TRACES = int(os.getenv("TRACING_MAX_PENDING_TRACES", 2048))
+
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "false").lower() == "true"
+RATE_LIMITS = os.getenv(
+    "RATE_LIMITS",
+    "POST /links/shorten=anonymous:10/60,free:60/60,premium:300/60;"
+    "GET /links/{short_url}=anonymous:20/1,free:50/1,premium:200/1"
+)
+RATE_LIMIT_DEFAULT = os.getenv("RATE_LIMIT_DEFAULT", "anonymous:20/1,free:50/1,premium:100/1")
+RATE_LIMIT_REDIS = os.getenv("RATE_LIMIT_REDIS", "true").lower() == "true"
+RATE_LIMIT_LEASE = int(os.getenv("RATE_LIMIT_LEASE", 5))
+RATE_LIMIT_LEASE_TTL = float(os.getenv("RATE_LIMIT_LEASE_TTL", 1))
+RATE_LIMIT_MAX_KEYS = int(os.getenv("RATE_LIMIT_MAX_KEYS", 100_000))
+RATE_LIMIT_TRUST_FORWARDED = os.getenv("RATE_LIMIT_TRUST_FORWARDED", "false").lower() == "true"
+
+LOAD_SHED_ENABLED = os.getenv("LOAD_SHED_ENABLED", "false").lower() == "true"
+LOAD_SHED_INITIAL_LIMIT = int(os.getenv("LOAD_SHED_INITIAL_LIMIT", 64))
+LOAD_SHED_MIN_LIMIT = int(os.getenv("LOAD_SHED_MIN_LIMIT", 8))
+LOAD_SHED_MAX_LIMIT = int(os.getenv("LOAD_SHED_MAX_LIMIT", 512))
+LOAD_SHED_TARGET_MS = float(os.getenv("LOAD_SHED_TARGET_MS", 100))
+LOAD_SHED_TOLERANCE = float(os.getenv("LOAD_SHED_TOLERANCE", 2))
+LOAD_SHED_CRITICAL_MIN_LIMIT = int(os.getenv("LOAD_SHED_CRITICAL_MIN_LIMIT", 16))
+LOAD_SHED_BACKOFF = float(os.getenv("LOAD_SHED_BACKOFF", 0.9))
+LOAD_SHED_QUEUE_SIZE = int(os.getenv("LOAD_SHED_QUEUE_SIZE", 64))
+LOAD_SHED_QUEUE_TIMEOUT_MS = float(os.getenv("LOAD_SHED_QUEUE_TIMEOUT_MS", 50))
+LOAD_SHED_RETRY_AFTER = int(os.getenv("LOAD_SHED_RETRY_AFTER", 1))
+LOAD_SHED_CRITICAL_ROUTES = os.getenv("LOAD_SHED_CRITICAL_ROUTES", "url_redirect,health,metrics")
+LOAD_SHED_ANALYTICS_ROUTES = os.getenv(
+    "LOAD_SHED_ANALYTICS_ROUTES", "get_short_url_stats,get_expired_link_stats,get_short_url_queries,get_short_url_breakdown"
+)
+
+TRACKED_REDIRECT_STATUS = int(os.getenv("TRACKED_REDIRECT_STATUS", 307))
+PERMANENT_REDIRECT_STATUS = int(os.getenv("PERMANENT_REDIRECT_STATUS", 301))
+PERMANENT_REDIRECT_MAX_AGE = int(os.getenv("PERMANENT_REDIRECT_MAX_AGE", 86400))
+
+SHORT_URL_SCHEME = os.getenv("SHORT_URL_SCHEME", "http")
+DEFAULT_DOMAIN = os.getenv("DEFAULT_DOMAIN", "localhost")
+SHORT_URL_PATH = os.getenv("SHORT_URL_PATH", "/links/")
+DOMAIN_CACHE_TTL = float(os.getenv("DOMAIN_CACHE_TTL", 60))
+DOMAIN_MISS_TTL = float(os.getenv("DOMAIN_MISS_TTL", 5))
+DOMAIN_MISS_CACHE_SIZE = int(os.getenv("DOMAIN_MISS_CACHE_SIZE", 4096))
+
+ENRICHMENT_ENABLED = os.getenv("ENRICHMENT_ENABLED", "true").lower() == "true"
+ENRICHMENT_INTERVAL = float(os.getenv("ENRICHMENT_INTERVAL", 5))
+ENRICHMENT_BATCH_SIZE = int(os.getenv("ENRICHMENT_BATCH_SIZE", 1000))
+GEOIP_DATABASE = os.getenv("GEOIP_DATABASE", "")
+UA_CACHE_SIZE = int(os.getenv("UA_CACHE_SIZE", 4096))
+
+ALIAS_GRACE_PERIOD = int(os.getenv("ALIAS_GRACE_PERIOD", 7 * 24 * 3600))
+RESOLVE_MAX_CODES = int(os.getenv("RESOLVE_MAX_CODES", 5000))
+LINKS_PAGE_SIZE = int(os.getenv("LINKS_PAGE_SIZE", 50))
+LINKS_MAX_PAGE_SIZE = int(os.getenv("LINKS_MAX_PAGE_SIZE", 200))
+
+PASSWORD_HASH_EXECUTOR = os.getenv("PASSWORD_HASH_EXECUTOR", "thread")
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", os.cpu_count() or 1))
+PASSWORD_HASH_MAX_PENDING = int(os.getenv("PASSWORD_HASH_MAX_PENDING", 64))
+PASSWORD_HASH_RETRY_AFTER = int(os.getenv("PASSWORD_HASH_RETRY_AFTER", 1))
+ARGON2_TIME_COST = int(os.getenv("ARGON2_TIME_COST", 3))
+ARGON2_MEMORY_COST = int(os.getenv("ARGON2_MEMORY_COST", 65536))
+ARGON2_PARALLELISM = int(os.getenv("ARGON2_PARALLELISM", 4))
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", 12))
+
+LOOP_MONITOR_ENABLED = os.getenv("LOOP_MONITOR_ENABLED", "true").lower() == "true"
+LOOP_MONITOR_INTERVAL = float(os.getenv("LOOP_MONITOR_INTERVAL", 0.05))
+LOOP_BLOCK_THRESHOLD_MS = float(os.getenv("LOOP_BLOCK_THRESHOLD_MS", 100))
+LOOP_BLOCK_SAMPLE_MS = float(os.getenv("LOOP_BLOCK_SAMPLE_MS", 20))
+LOOP_BLOCK_MAX_SAMPLES = int(os.getenv("LOOP_BLOCK_MAX_SAMPLES", 50))
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json")
+LOG_SAMPLING = os.getenv("LOG_SAMPLING", "access.redirect=0.01")
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", 10000))
+REQUEST_ID_HEADER = os.getenv("REQUEST_ID_HEADER", "X-Request-ID")
+
+LINK_SNAPSHOT_ENABLED = os.getenv("LINK_SNAPSHOT_ENABLED", "false").lower() == "true"
+LINK_SNAPSHOT_PATH = os.getenv("LINK_SNAPSHOT_PATH", "")
+LINK_SNAPSHOT_BATCH_SIZE = int(os.getenv("LINK_SNAPSHOT_BATCH_SIZE", 10000))
+LINK_SNAPSHOT_MAX_AGE = float(os.getenv("LINK_SNAPSHOT_MAX_AGE", 60))
+LINK_SNAPSHOT_MAX_OVERLAY = int(os.getenv("LINK_SNAPSHOT_MAX_OVERLAY", 100000))
+
+USER_STATS_FLUSH_INTERVAL = float(os.getenv("USER_STATS_FLUSH_INTERVAL", 5))
+USER_STATS_RECONCILE_INTERVAL = float(os.getenv("USER_STATS_RECONCILE_INTERVAL", 3600))
@@ -1,8 +1,16 @@
 import os
 from typing import AsyncGenerator
+from fastapi import HTTPException
+from sqlalchemy.engine import make_url
 from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.orm import DeclarativeBase
 
+from circuit_breaker import db_breaker, guard_engine
+from config import DB_POOL_TIMEOUT, DB_CONNECT_TIMEOUT, DB_COMMAND_TIMEOUT, DB_BREAKER_RESET
+from metrics import instrument_engine
+from profiling import attach_profile, profile_engine
+from tracing import trace_engine
+
 _engine = None
 _session_maker = None
 
@@ -14,7 +22,17 @@ def get_engine():
     global _engine
     if _engine is None:
         db_url = os.getenv("DB_URL")
-        _engine = create_async_engine(db_url, future=True, echo=False)
+        options = {}
+        if make_url(db_url).drivername == "postgresql+asyncpg":
+            options = {
+                "pool_timeout": DB_POOL_TIMEOUT,
+                "connect_args": {"timeout": DB_CONNECT_TIMEOUT, "command_timeout": DB_COMMAND_TIMEOUT},
+            }
+        _engine = create_async_engine(db_url, future=True, echo=False, **options)
+        instrument_engine(_engine)
+        guard_engine(_engine)
+        profile_engine(_engine)
+        trace_engine(_engine)
     return _engine
 
 
@@ -26,6 +44,13 @@ def get_session_maker():
 
 
 async def get_async_session() -> AsyncGenerator[AsyncSession, None]:
+    if not db_breaker.allow():
+        raise HTTPException(
+            status_code=503,
+            detail="Database is unavailable, retry later",
+            headers={"Retry-After": str(int(DB_BREAKER_RESET))}
+        )
     async_session = get_session_maker()
     async with async_session() as session:
+        attach_profile(session)
         yield session
\ No newline at end of file
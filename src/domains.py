@@ -0,0 +1,123 @@
+import logging
+import re
+import time
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Optional
+from uuid import UUID
+
+from fastapi import Depends, Request
+from sqlalchemy import case, literal, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from caching import SingleFlight, spawn
+from config import (
+    SHORT_URL_SCHEME, DEFAULT_DOMAIN, SHORT_URL_PATH, DOMAIN_CACHE_TTL, DOMAIN_MISS_TTL, DOMAIN_MISS_CACHE_SIZE
+)
+from database import get_async_session, get_session_maker
+from models import Domain, Link
+
+
+logger = logging.getLogger(__name__)
+
+_HOST_PATTERN = re.compile(r"(?=.{1,253}$)([a-z0-9]([a-z0-9-]{0,61}[a-z0-9])?\.)+[a-z]{2,63}")
+_FLIGHT_KEY = "domains"
+
+
+def normalize_host(host: Optional[str]) -> str:
+    if not host:
+        return ""
+    return host.strip().lower().split(":", 1)[0].rstrip(".")
+
+
+def is_valid_host(host: str) -> bool:
+    return bool(_HOST_PATTERN.fullmatch(host)) and host != DEFAULT_DOMAIN
+
+
+@lru_cache(maxsize=4096)
+def short_url_prefix(domain: str) -> str:
+    return f"{SHORT_URL_SCHEME}://{domain or DEFAULT_DOMAIN}{SHORT_URL_PATH}"
+
+
+def short_url(domain: str, short_code: str) -> str:
+    return short_url_prefix(domain) + short_code
+
+
+def short_url_column():
+    prefix = case(
+        (Link.domain == "", literal(short_url_prefix(""))),
+        else_=literal(f"{SHORT_URL_SCHEME}://") + Link.domain + literal(SHORT_URL_PATH)
+    )
+    return (prefix + Link.short_code).label("short_url")
+
+
+class DomainTable:
+    # Every worker keeps the whole host -> owner table in memory, so routing a
+    # request by its Host header is a dict lookup. After DOMAIN_CACHE_TTL the
+    # table is reloaded in the background while the old one keeps serving.
+    # A host missing from the table is looked up in the database before it is
+    # rejected, so a domain added through another worker works at once;
+    # misses are remembered for miss_ttl seconds.
+    def __init__(self, ttl: float = DOMAIN_CACHE_TTL, miss_ttl: float = DOMAIN_MISS_TTL):
+        self.ttl = ttl
+        self.miss_ttl = miss_ttl
+        self._owners: Optional[dict] = None
+        self._loaded_at = 0.0
+        self._missing: OrderedDict[str, float] = OrderedDict()
+        self._flight = SingleFlight()
+
+    async def _load(self, session) -> dict:
+        result = await session.execute(select(Domain.host, Domain.owner_id))
+        self._owners = {row.host: row.owner_id for row in result}
+        self._loaded_at = time.monotonic()
+        return self._owners
+
+    async def _refresh(self) -> dict:
+        try:
+            async with get_session_maker()() as session:
+                return await self._load(session)
+        except Exception:
+            # Keep serving the old table and retry after another TTL.
+            self._loaded_at = time.monotonic()
+            logger.warning("Cannot refresh domain table", exc_info=True)
+            raise
+
+    async def owners(self, session) -> dict:
+        if self._owners is None:
+            return await self._flight.do(_FLIGHT_KEY, lambda: self._load(session))
+        if time.monotonic() - self._loaded_at > self.ttl and not self._flight.in_flight(_FLIGHT_KEY):
+            spawn(self._flight.do(_FLIGHT_KEY, self._refresh))
+        return self._owners
+
+    async def lookup(self, session, host: str) -> tuple[bool, Optional[UUID]]:
+        owners = await self.owners(session)
+        if host in owners:
+            return True, owners[host]
+        checked_at = self._missing.get(host)
+        if checked_at is not None and time.monotonic() - checked_at < self.miss_ttl:
+            return False, None
+        row = (await session.execute(select(Domain.owner_id).where(Domain.host == host))).first()
+        if row is None:
+            self._missing[host] = time.monotonic()
+            self._missing.move_to_end(host)
+            if len(self._missing) > DOMAIN_MISS_CACHE_SIZE:
+                self._missing.popitem(last=False)
+            return False, None
+        owners[host] = row.owner_id
+        self._missing.pop(host, None)
+        return True, row.owner_id
+
+    def invalidate(self) -> None:
+        self._owners = None
+        self._missing.clear()
+
+
+domain_table = DomainTable()
+
+
+async def request_domain(request: Request, session: AsyncSession = Depends(get_async_session)) -> str:
+    host = normalize_host(request.headers.get("host"))
+    if not host or host == DEFAULT_DOMAIN:
+        return ""
+    found, _ = await domain_table.lookup(session, host)
+    return host if found else ""
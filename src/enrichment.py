@@ -0,0 +1,196 @@
+import asyncio
+import logging
+import re
+from collections import Counter
+from datetime import datetime
+from functools import lru_cache
+from typing import Optional
+from urllib.parse import urlparse
+
+from sqlalchemy import select, update
+from sqlalchemy.dialects import postgresql, sqlite
+
+from config import ENRICHMENT_INTERVAL, ENRICHMENT_BATCH_SIZE, GEOIP_DATABASE, UA_CACHE_SIZE
+from models import Query, QueryRollup
+from rate_limit import client_ip
+
+
+logger = logging.getLogger(__name__)
+
+DIMENSIONS = ("country", "device", "browser", "os", "referrer")
+
+_MAX_HEADER_LENGTH = 512
+
+_BOT = re.compile(r"bot|crawl|spider|slurp|preview|facebookexternalhit|^curl/|^wget/|python-requests|httpx", re.I)
+_TABLET = re.compile(r"ipad|tablet|kindle|silk/|android(?!.*mobile)", re.I)
+_MOBILE = re.compile(r"mobi|iphone|ipod|windows phone", re.I)
+_BROWSERS = (
+    ("Edge", re.compile(r"Edg(e|A|iOS)?/")),
+    ("Opera", re.compile(r"OPR/|Opera")),
+    ("Samsung Internet", re.compile(r"SamsungBrowser/")),
+    ("Yandex", re.compile(r"YaBrowser/")),
+    ("Chrome", re.compile(r"Chrome/|CriOS/")),
+    ("Firefox", re.compile(r"Firefox/|FxiOS/")),
+    ("Safari", re.compile(r"Safari/")),
+)
+_OPERATING_SYSTEMS = (
+    ("iOS", re.compile(r"iPhone|iPad|iPod")),
+    ("Android", re.compile(r"Android")),
+    ("Windows", re.compile(r"Windows")),
+    ("macOS", re.compile(r"Macintosh|Mac OS X")),
+    ("Linux", re.compile(r"Linux|X11")),
+)
+
+
+def capture_access(headers, client) -> dict:
+    ip = client_ip(headers.get("x-forwarded-for"), client)
+    user_agent = headers.get("user-agent")
+    referrer = headers.get("referer")
+    return {
+        "ip": ip,
+        "user_agent": user_agent[:_MAX_HEADER_LENGTH] if user_agent else None,
+        "referrer": referrer[:_MAX_HEADER_LENGTH] if referrer else None,
+    }
+
+
+def _first_match(patterns, user_agent: str) -> str:
+    for name, pattern in patterns:
+        if pattern.search(user_agent):
+            return name
+    return "Other"
+
+
+@lru_cache(maxsize=UA_CACHE_SIZE)
+def parse_user_agent(user_agent: Optional[str]) -> tuple[str, str, str]:
+    if not user_agent:
+        return "unknown", "unknown", "unknown"
+    if _BOT.search(user_agent):
+        device = "bot"
+    elif _TABLET.search(user_agent):
+        device = "tablet"
+    elif _MOBILE.search(user_agent):
+        device = "mobile"
+    else:
+        device = "desktop"
+    return device, _first_match(_BROWSERS, user_agent), _first_match(_OPERATING_SYSTEMS, user_agent)
+
+
+def referrer_host(referrer: Optional[str]) -> Optional[str]:
+    if not referrer:
+        return None
+    try:
+        host = urlparse(referrer).hostname
+    except ValueError:
+        return None
+    return host.removeprefix("www.") if host else None
+
+
+class GeoIPResolver:
+    # The mmdb file is memory-mapped, so every worker shares the page cache
+    # instead of holding its own copy of the database.
+    def __init__(self, path: str = GEOIP_DATABASE):
+        self._reader = None
+        if not path:
+            return
+        try:
+            import maxminddb
+        except ImportError as e:
+            raise RuntimeError("Install maxminddb to resolve countries from GEOIP_DATABASE") from e
+        self._reader = maxminddb.open_database(path, maxminddb.MODE_MMAP)
+
+    def country(self, ip: Optional[str]) -> Optional[str]:
+        if self._reader is None or not ip:
+            return None
+        try:
+            record = self._reader.get(ip)
+        except ValueError:
+            return None
+        if not record:
+            return None
+        return (record.get("country") or record.get("registered_country") or {}).get("iso_code")
+
+    def close(self) -> None:
+        if self._reader is not None:
+            self._reader.close()
+
+
+_geoip: Optional[GeoIPResolver] = None
+
+
+def get_geoip() -> GeoIPResolver:
+    global _geoip
+    if _geoip is None:
+        _geoip = GeoIPResolver()
+    return _geoip
+
+
+def enrich_rows(rows, geoip: GeoIPResolver, enriched_at: datetime) -> tuple[list[dict], Counter]:
+    updates = []
+    rollups = Counter()
+    for row in rows:
+        device, browser, os_name = parse_user_agent(row.user_agent)
+        values = {
+            "country": geoip.country(row.ip),
+            "device": device,
+            "browser": browser,
+            "os": os_name,
+            "referrer_host": referrer_host(row.referrer),
+        }
+        updates.append({"id": row.id, "enriched_at": enriched_at, **values})
+
+        day = row.accessed_at.date()
+        for dimension, value in (
+            ("country", values["country"] or "unknown"),
+            ("device", device),
+            ("browser", browser),
+            ("os", os_name),
+            ("referrer", values["referrer_host"] or "direct"),
+        ):
+            rollups[(row.link_id, day, dimension, value)] += 1
+    return updates, rollups
+
+
+async def _upsert_rollups(session, rollups: Counter) -> None:
+    dialect = session.get_bind().dialect.name
+    insert = postgresql.insert if dialect == "postgresql" else sqlite.insert
+    query = insert(QueryRollup).values([
+        {"link_id": link_id, "day": day, "dimension": dimension, "value": value, "clicks": clicks}
+        for (link_id, day, dimension, value), clicks in rollups.items()
+    ])
+    query = query.on_conflict_do_update(
+        index_elements=[QueryRollup.link_id, QueryRollup.day, QueryRollup.dimension, QueryRollup.value],
+        set_={"clicks": QueryRollup.clicks + query.excluded.clicks}
+    )
+    await session.execute(query)
+
+
+async def enrich_pending(session_maker, batch_size: int = ENRICHMENT_BATCH_SIZE) -> int:
+    query = (
+        select(Query.id, Query.link_id, Query.accessed_at, Query.ip, Query.user_agent, Query.referrer)
+        .where(Query.enriched_at.is_(None))
+        .order_by(Query.id)
+        .limit(batch_size)
+        .with_for_update(skip_locked=True)
+    )
+    async with session_maker() as session:
+        rows = (await session.execute(query)).all()
+        if not rows:
+            return 0
+        # Parsing runs in a thread, so a large batch does not hold up the
+        # event loop serving redirects.
+        updates, rollups = await asyncio.to_thread(enrich_rows, rows, get_geoip(), datetime.now())
+        await session.execute(update(Query), updates)
+        await _upsert_rollups(session, rollups)
+        await session.commit()
+    return len(rows)
+
+
+async def run_enrichment(session_maker, interval: float = ENRICHMENT_INTERVAL, batch_size: int = ENRICHMENT_BATCH_SIZE) -> None:
+    while True:
+        try:
+            processed = await enrich_pending(session_maker, batch_size)
+        except Exception:
+            logger.warning("Access event enrichment failed", exc_info=True)
+            processed = 0
+        if processed < batch_size:
+            await asyncio.sleep(interval)
@@ -0,0 +1,271 @@
+import asyncio
+import json
+import logging
+import time
+from datetime import datetime
+from types import SimpleNamespace
+from typing import Optional
+
+from fastapi_cache import FastAPICache
+from sqlalchemy import String, any_, literal, select
+from sqlalchemy.dialects.postgresql import ARRAY
+
+from caching import SingleFlight, delete_key, locked_fetch, spawn
+from config import LINK_CACHE_EXPIRE, LINK_CACHE_STALE_TTL, CACHE_WARMUP_LIMIT, CACHE_WARMUP_TIMEOUT, CACHE_WARMUP_MAX_BYTES
+from database import get_session_maker
+from link_table import link_table
+from metrics import record_cache
+from models import Link, LinkAlias
+
+
+logger = logging.getLogger(__name__)
+
+_flight = SingleFlight()
+
+
+def link_cache_key(short_code: str, domain: str = "") -> str:
+    if domain:
+        return f"{FastAPICache.get_prefix()}:link:{domain}/{short_code}"
+    return f"{FastAPICache.get_prefix()}:link:{short_code}"
+
+
+def encode_link(link) -> bytes:
+    return json.dumps({
+        "id": link.id,
+        "original_url": link.original_url,
+        "expires_at": link.expires_at.isoformat() if link.expires_at else None,
+        "redirect_mode": link.redirect_mode,
+        "stale_at": time.time() + LINK_CACHE_EXPIRE
+    }).encode()
+
+
+def decode_link(value) -> dict:
+    data = json.loads(value)
+    data.setdefault("redirect_mode", "tracked")
+    if data["expires_at"]:
+        data["expires_at"] = datetime.fromisoformat(data["expires_at"])
+    return data
+
+
+async def get_cached_link(short_code: str, domain: str = "") -> Optional[dict]:
+    try:
+        value = await FastAPICache.get_backend().get(link_cache_key(short_code, domain))
+    except Exception:
+        logger.warning("Cannot read link %s from cache", short_code, exc_info=True)
+        return None
+    if value is None:
+        return None
+    return decode_link(value)
+
+
+async def set_cached_link(short_code: str, link, domain: str = "", expire: int = LINK_CACHE_EXPIRE + LINK_CACHE_STALE_TTL) -> None:
+    try:
+        await FastAPICache.get_backend().set(link_cache_key(short_code, domain), encode_link(link), expire)
+    except Exception:
+        logger.warning("Cannot write link %s to cache", short_code, exc_info=True)
+
+
+async def invalidate_link(short_code: str, domain: str = "") -> None:
+    if link_table.ready:
+        link_table.discard(short_code, domain)
+    await delete_key(link_cache_key(short_code, domain))
+
+
+def _alias_query(domain: str, condition):
+    return select(
+        Link.id, Link.original_url, Link.expires_at, Link.redirect_mode,
+        LinkAlias.short_code, LinkAlias.expires_at.label("alias_expires_at")
+    ).join(LinkAlias, LinkAlias.link_id == Link.id).where(
+        LinkAlias.domain == domain, condition, LinkAlias.expires_at > datetime.now()
+    )
+
+
+def _alias_link(row) -> SimpleNamespace:
+    # An old alias stops redirecting at the end of its grace window even if
+    # the link itself lives longer.
+    expires_at = min(row.expires_at, row.alias_expires_at) if row.expires_at else row.alias_expires_at
+    return SimpleNamespace(id=row.id, original_url=row.original_url, expires_at=expires_at, redirect_mode=row.redirect_mode)
+
+
+def _link_dict(row) -> dict:
+    return {"id": row.id, "original_url": row.original_url, "expires_at": row.expires_at, "redirect_mode": row.redirect_mode}
+
+
+async def _fetch_alias(short_code: str, domain: str, session):
+    result = await session.execute(_alias_query(domain, LinkAlias.short_code == short_code))
+    row = result.first()
+    if row is None:
+        return None
+    return _alias_link(row)
+
+
+async def _fetch_link(short_code: str, domain: str, session) -> Optional[dict]:
+    query = select(Link.id, Link.original_url, Link.expires_at, Link.redirect_mode).where(
+        Link.domain == domain, Link.short_code == short_code
+    )
+    result = await session.execute(query)
+    row = result.first()
+    if row is not None and link_table.ready:
+        # Keeps links extended by clicks, or created moments ago, in memory.
+        link_table.put(short_code, domain, row)
+    if row is None:
+        row = await _fetch_alias(short_code, domain, session)
+    if row is None:
+        return None
+    await set_cached_link(short_code, row, domain)
+    return _link_dict(row)
+
+
+async def _refresh_link(short_code: str, domain: str) -> Optional[dict]:
+    try:
+        async with get_session_maker()() as session:
+            return await _fetch_link(short_code, domain, session)
+    except Exception:
+        logger.warning("Cannot refresh link %s in background", short_code, exc_info=True)
+        raise
+
+
+async def load_link(short_code: str, session, use_cache: bool = True, domain: str = "") -> Optional[dict]:
+    key = link_cache_key(short_code, domain)
+
+    if use_cache and link_table.ready:
+        link = link_table.get(short_code, domain)
+        if link is not None:
+            record_cache("snapshot", "hit")
+            return link
+        record_cache("snapshot", "miss")
+
+    if use_cache:
+        link = await get_cached_link(short_code, domain)
+        if link is not None:
+            if link["stale_at"] > time.time():
+                record_cache("link", "hit")
+            else:
+                record_cache("link", "stale")
+                if not _flight.in_flight(key):
+                    spawn(_flight.do(key, lambda: _refresh_link(short_code, domain)))
+            return link
+        record_cache("link", "miss")
+
+    return await _flight.do(key, lambda: locked_fetch(
+        key,
+        lambda: _fetch_link(short_code, domain, session),
+        lambda: get_cached_link(short_code, domain)
+    ))
+
+
+def _in_codes(session, column, short_codes: list[str]):
+    # One array parameter on PostgreSQL instead of a bind parameter per code.
+    if session.get_bind().dialect.name == "postgresql":
+        return column == any_(literal(short_codes, ARRAY(String)))
+    return column.in_(short_codes)
+
+
+async def _fetch_links(short_codes: list[str], domain: str, session) -> dict[str, dict]:
+    query = select(Link.id, Link.short_code, Link.original_url, Link.expires_at, Link.redirect_mode).where(
+        Link.domain == domain, _in_codes(session, Link.short_code, short_codes)
+    )
+    rows = {row.short_code: row for row in await session.execute(query)}
+    if link_table.ready:
+        for short_code, row in rows.items():
+            link_table.put(short_code, domain, row)
+
+    missing = [short_code for short_code in short_codes if short_code not in rows]
+    if missing:
+        result = await session.execute(_alias_query(domain, _in_codes(session, LinkAlias.short_code, missing)))
+        rows.update((row.short_code, _alias_link(row)) for row in result)
+
+    # With a pipelined backend these writes share one round trip.
+    await asyncio.gather(*(set_cached_link(short_code, row, domain) for short_code, row in rows.items()))
+    return {short_code: _link_dict(row) for short_code, row in rows.items()}
+
+
+async def load_links(short_codes: list[str], session, domain: str = "") -> dict[str, dict]:
+    links = {}
+    if link_table.ready:
+        for short_code in short_codes:
+            link = link_table.get(short_code, domain)
+            if link is not None:
+                links[short_code] = link
+
+    missing = [short_code for short_code in short_codes if short_code not in links]
+    cached_links = await asyncio.gather(*(get_cached_link(short_code, domain) for short_code in missing))
+    for short_code, link in zip(missing, cached_links):
+        record_cache("link", "miss" if link is None else "hit")
+        if link is not None:
+            links[short_code] = link
+
+    # Links that look expired may have been extended by clicks since they
+    # were cached, so they are read again together with the misses.
+    now = datetime.now()
+    stale = [
+        short_code for short_code in short_codes
+        if short_code not in links or (links[short_code]["expires_at"] and links[short_code]["expires_at"] < now)
+    ]
+    if stale:
+        fetched = await _fetch_links(stale, domain, session)
+        for short_code in stale:
+            links.pop(short_code, None)
+        links.update(fetched)
+    return links
+
+
+async def load_link_stats(short_code: str, session, domain: str = ""):
+    query = select(
+        Link.id,
+        Link.original_url,
+        Link.created_at,
+        Link.clicks,
+        Link.last_accessed,
+        Link.expires_at,
+        Link.owner_id
+    ).where(Link.domain == domain, Link.short_code == short_code)
+    result = await session.execute(query)
+    return result.first()
+
+
+async def warm_up_cache(
+    session_maker,
+    limit: int = CACHE_WARMUP_LIMIT,
+    timeout: float = CACHE_WARMUP_TIMEOUT,
+    max_bytes: int = CACHE_WARMUP_MAX_BYTES
+) -> int:
+    if limit <= 0:
+        return 0
+
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    query = (
+        select(Link.id, Link.domain, Link.short_code, Link.original_url, Link.expires_at, Link.redirect_mode)
+        .where(Link.expires_at > datetime.now())
+        .order_by(Link.last_accessed.desc().nulls_last(), Link.clicks.desc())
+        .limit(limit)
+    )
+    try:
+        async with session_maker() as session:
+            result = await asyncio.wait_for(session.execute(query), timeout)
+            rows = result.all()
+    except asyncio.TimeoutError:
+        logger.warning("Cache warm-up query did not finish in %s seconds", timeout)
+        return 0
+    except Exception:
+        logger.warning("Cache warm-up query failed", exc_info=True)
+        return 0
+
+    backend = FastAPICache.get_backend()
+    loaded = 0
+    used_bytes = 0
+    for row in rows:
+        value = encode_link(row)
+        if used_bytes + len(value) > max_bytes or loop.time() > deadline:
+            break
+        try:
+            await backend.set(link_cache_key(row.short_code, row.domain), value, LINK_CACHE_EXPIRE + LINK_CACHE_STALE_TTL)
+        except Exception:
+            logger.warning("Cache warm-up stopped on backend error", exc_info=True)
+            break
+        used_bytes += len(value)
+        loaded += 1
+
+    logger.info("Cache warm-up loaded %s links (%s bytes)", loaded, used_bytes)
+    return loaded
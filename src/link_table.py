@@ -0,0 +1,331 @@
+import asyncio
+import fcntl
+import logging
+import math
+import mmap
+import os
+import struct
+import time
+from datetime import datetime
+from typing import Optional
+
+import orjson
+from sqlalchemy import or_, select
+from sqlalchemy.engine import make_url
+
+from caching import spawn
+from config import (
+    DB_URL, LINK_SNAPSHOT_PATH, LINK_SNAPSHOT_BATCH_SIZE, LINK_SNAPSHOT_MAX_AGE, LINK_SNAPSHOT_MAX_OVERLAY
+)
+from models import Link
+from responses import REDIRECT_MODES
+
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = "link_changes"
+
+# File layout: header, one fixed-size record per link sorted by key, then a
+# blob with the key and url bytes of every record.
+_MAGIC = b"LINKSNP1"
+_HEADER = struct.Struct("<8sQd")  # magic, count, built_at
+_RECORD = struct.Struct("<QIIqdB")  # blob offset, key length, url length, id, expires_at, redirect mode
+_MODES = {mode: index for index, mode in enumerate(REDIRECT_MODES)}
+_MAX_RECONNECT_DELAY = 30
+
+
+def snapshot_key(short_code: str, domain: str = "") -> bytes:
+    return f"{domain}/{short_code}".encode()
+
+
+def _entry(row) -> tuple:
+    expires_at = row.expires_at.timestamp() if row.expires_at else math.nan
+    return row.id, row.original_url, expires_at, _MODES.get(row.redirect_mode, 0)
+
+
+def build_snapshot(rows, built_at: float) -> bytearray:
+    records = sorted((snapshot_key(row.short_code, row.domain), _entry(row)) for row in rows)
+    blob_start = _HEADER.size + len(records) * _RECORD.size
+    data = bytearray(blob_start)
+    _HEADER.pack_into(data, 0, _MAGIC, len(records), built_at)
+    offset = blob_start
+    for index, (key, (link_id, original_url, expires_at, mode)) in enumerate(records):
+        url = original_url.encode()
+        _RECORD.pack_into(data, _HEADER.size + index * _RECORD.size, offset, len(key), len(url), link_id, expires_at, mode)
+        data += key
+        data += url
+        offset += len(key) + len(url)
+    return data
+
+
+class LinkSnapshot:
+    # Lookups binary-search the sorted records directly in the buffer, so the
+    # same code serves a private bytearray and a file mapped by every worker.
+    def __init__(self, buffer):
+        magic, self.count, self.built_at = _HEADER.unpack_from(buffer, 0)
+        if magic != _MAGIC:
+            raise ValueError("Not a link snapshot")
+        self._buffer = buffer
+
+    @classmethod
+    def open(cls, path: str) -> "LinkSnapshot":
+        with open(path, "rb") as file:
+            return cls(mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ))
+
+    @property
+    def size(self) -> int:
+        return len(self._buffer)
+
+    def lookup(self, key: bytes) -> Optional[tuple]:
+        buffer = self._buffer
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            offset, key_length, url_length, link_id, expires_at, mode = _RECORD.unpack_from(
+                buffer, _HEADER.size + middle * _RECORD.size
+            )
+            current = buffer[offset:offset + key_length]
+            if current < key:
+                low = middle + 1
+            elif current > key:
+                high = middle
+            else:
+                url = buffer[offset + key_length:offset + key_length + url_length]
+                return link_id, bytes(url).decode(), expires_at, mode
+        return None
+
+    def close(self) -> None:
+        if isinstance(self._buffer, mmap.mmap):
+            self._buffer.close()
+
+
+def _lock(path: str) -> int:
+    fd = os.open(f"{path}.lock", os.O_CREAT | os.O_RDWR, 0o644)
+    fcntl.flock(fd, fcntl.LOCK_EX)
+    return fd
+
+
+def _unlock(fd: int) -> None:
+    fcntl.flock(fd, fcntl.LOCK_UN)
+    os.close(fd)
+
+
+def _file_built_at(path: str) -> Optional[float]:
+    try:
+        with open(path, "rb") as file:
+            magic, _, built_at = _HEADER.unpack(file.read(_HEADER.size))
+    except (OSError, struct.error):
+        return None
+    return built_at if magic == _MAGIC else None
+
+
+def _write_file(path: str, data: bytearray) -> None:
+    # Workers that still map the old file keep reading it until they remap.
+    temporary = f"{path}.{os.getpid()}.tmp"
+    with open(temporary, "wb") as file:
+        file.write(data)
+    os.replace(temporary, path)
+
+
+class LinkTable:
+    # A read-only snapshot of all active links plus an overlay of the changes
+    # that arrived through the NOTIFY feed since it was built. Once the overlay
+    # grows past LINK_SNAPSHOT_MAX_OVERLAY the snapshot is rebuilt.
+    def __init__(
+        self,
+        path: str = LINK_SNAPSHOT_PATH,
+        batch_size: int = LINK_SNAPSHOT_BATCH_SIZE,
+        max_age: float = LINK_SNAPSHOT_MAX_AGE,
+        max_overlay: int = LINK_SNAPSHOT_MAX_OVERLAY
+    ):
+        self.path = path
+        self.batch_size = batch_size
+        self.max_age = max_age
+        self.max_overlay = max_overlay
+        self.snapshot: Optional[LinkSnapshot] = None
+        self._overlay: dict[bytes, Optional[tuple]] = {}
+        self._replay: Optional[dict] = None
+        self._session_maker = None
+        self._listener = None
+        self._changes: Optional[asyncio.Queue] = None
+        self._tasks: list[asyncio.Task] = []
+        self._reload_task: Optional[asyncio.Task] = None
+        self._stopping = False
+
+    @property
+    def ready(self) -> bool:
+        return self.snapshot is not None
+
+    def get(self, short_code: str, domain: str = "") -> Optional[dict]:
+        key = snapshot_key(short_code, domain)
+        entry = self._overlay[key] if key in self._overlay else self.snapshot.lookup(key)
+        if entry is None:
+            return None
+        link_id, original_url, expires_at, mode = entry
+        return {
+            "id": link_id,
+            "original_url": original_url,
+            "expires_at": None if math.isnan(expires_at) else datetime.fromtimestamp(expires_at),
+            "redirect_mode": REDIRECT_MODES[mode],
+        }
+
+    def put(self, short_code: str, domain: str, row) -> None:
+        self._put(snapshot_key(short_code, domain), _entry(row) if row is not None else None)
+
+    def discard(self, short_code: str, domain: str = "") -> None:
+        self._put(snapshot_key(short_code, domain), None)
+
+    def _put(self, key: bytes, entry: Optional[tuple]) -> None:
+        self._overlay[key] = entry
+        if self._replay is not None:
+            self._replay[key] = entry
+        elif len(self._overlay) > self.max_overlay:
+            self._schedule_reload()
+
+    async def start(self, session_maker) -> None:
+        self._session_maker = session_maker
+        self._stopping = False
+        async with session_maker() as session:
+            dialect = session.get_bind().dialect.name
+        if dialect == "postgresql":
+            # Listen before reading the table, so no change falls in between.
+            self._changes = asyncio.Queue()
+            await self._listen()
+            self._tasks.append(asyncio.create_task(self._consume()))
+        else:
+            logger.warning("Link change feed needs PostgreSQL; the snapshot will not see later changes")
+        await self.reload(time.time() - self.max_age)
+
+    async def stop(self) -> None:
+        self._stopping = True
+        for task in (*self._tasks, self._reload_task):
+            if task is not None:
+                task.cancel()
+        self._tasks = []
+        self._reload_task = None
+        if self._listener is not None:
+            await self._listener.close()
+            self._listener = None
+        if self.snapshot is not None:
+            self.snapshot.close()
+            self.snapshot = None
+        self._overlay = {}
+
+    async def reload(self, min_built_at: Optional[float] = None) -> None:
+        # Changes applied while the table is read are kept on top of the new
+        # snapshot; everything older is already part of it.
+        self._replay = {}
+        try:
+            if self.path:
+                snapshot = await self._load_shared(time.time() if min_built_at is None else min_built_at)
+            else:
+                snapshot = LinkSnapshot(await asyncio.to_thread(build_snapshot, await self._read_links(), time.time()))
+            overlay = self._replay
+        finally:
+            self._replay = None
+        previous, self.snapshot, self._overlay = self.snapshot, snapshot, overlay
+        if previous is not None:
+            previous.close()
+        logger.info("Link snapshot holds %s links (%s bytes)", snapshot.count, snapshot.size)
+
+    async def _read_links(self) -> list:
+        query = (
+            select(Link.id, Link.domain, Link.short_code, Link.original_url, Link.expires_at, Link.redirect_mode)
+            .where(or_(Link.expires_at.is_(None), Link.expires_at > datetime.now()))
+            .execution_options(yield_per=self.batch_size)
+        )
+        rows = []
+        async with self._session_maker() as session:
+            result = await session.stream(query)
+            async for partition in result.partitions():
+                rows.extend(partition)
+        return rows
+
+    async def _load_shared(self, min_built_at: float) -> LinkSnapshot:
+        # The first worker to take the lock builds the file; the others wait
+        # and map it as long as it is recent enough.
+        fd = await asyncio.to_thread(_lock, self.path)
+        try:
+            built_at = _file_built_at(self.path)
+            if built_at is None or built_at < min_built_at:
+                built_at = time.time()
+                data = await asyncio.to_thread(build_snapshot, await self._read_links(), built_at)
+                await asyncio.to_thread(_write_file, self.path, data)
+            return LinkSnapshot.open(self.path)
+        finally:
+            _unlock(fd)
+
+    def _schedule_reload(self, min_built_at: Optional[float] = None) -> None:
+        if self._reload_task is None or self._reload_task.done():
+            self._reload_task = spawn(self._safe_reload(min_built_at))
+
+    async def _safe_reload(self, min_built_at: Optional[float]) -> None:
+        try:
+            await self.reload(min_built_at)
+        except Exception:
+            logger.warning("Cannot reload link snapshot", exc_info=True)
+
+    async def _listen(self) -> None:
+        import asyncpg
+
+        url = make_url(DB_URL).set(drivername="postgresql").render_as_string(hide_password=False)
+        self._listener = await asyncpg.connect(url)
+        await self._listener.add_listener(CHANNEL, self._notify)
+        self._listener.add_termination_listener(self._lost)
+
+    def _notify(self, connection, pid, channel, payload) -> None:
+        self._changes.put_nowait(payload)
+
+    def _lost(self, connection) -> None:
+        if self._stopping:
+            return
+        logger.warning("Link change feed connection lost, reconnecting")
+        self._listener = None
+        self._tasks.append(spawn(self._reconnect()))
+
+    async def _reconnect(self) -> None:
+        delay = 1
+        while True:
+            try:
+                await self._listen()
+                break
+            except Exception:
+                logger.warning("Cannot reconnect link change feed", exc_info=True)
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, _MAX_RECONNECT_DELAY)
+        # Changes made while the feed was down were never delivered.
+        self._schedule_reload(time.time())
+
+    async def _consume(self) -> None:
+        while True:
+            changes = [await self._changes.get()]
+            while not self._changes.empty():
+                changes.append(self._changes.get_nowait())
+            try:
+                await self.apply([orjson.loads(change) for change in changes])
+            except Exception:
+                logger.warning("Cannot apply link changes, reloading snapshot", exc_info=True)
+                self._schedule_reload(time.time())
+
+    async def apply(self, changes: list[dict]) -> None:
+        ids = {change["id"] for change in changes if change["op"] != "DELETE"}
+        rows = {}
+        if ids:
+            query = select(
+                Link.id, Link.domain, Link.short_code, Link.original_url, Link.expires_at, Link.redirect_mode
+            ).where(Link.id.in_(ids))
+            async with self._session_maker() as session:
+                rows = {row.id: row for row in await session.execute(query)}
+
+        for change in changes:
+            old = (change.get("old_domain"), change.get("old_short_code"))
+            if old[1] is not None and old != (change["domain"], change["short_code"]):
+                self.discard(old[1], old[0])
+            row = rows.get(change["id"])
+            if change["op"] == "DELETE" or row is None:
+                self.discard(change["short_code"], change["domain"])
+            elif (row.domain, row.short_code) == (change["domain"], change["short_code"]):
+                self.put(row.short_code, row.domain, row)
+
+
+link_table = LinkTable()
@@ -0,0 +1,213 @@
+import asyncio
+import time
+from collections import deque
+
+import orjson
+
+from config import (
+    LOAD_SHED_ENABLED, LOAD_SHED_INITIAL_LIMIT, LOAD_SHED_MIN_LIMIT, LOAD_SHED_MAX_LIMIT, LOAD_SHED_TARGET_MS,
+    LOAD_SHED_TOLERANCE, LOAD_SHED_CRITICAL_MIN_LIMIT, LOAD_SHED_BACKOFF, LOAD_SHED_QUEUE_SIZE, LOAD_SHED_QUEUE_TIMEOUT_MS, LOAD_SHED_RETRY_AFTER,
+    LOAD_SHED_CRITICAL_ROUTES, LOAD_SHED_ANALYTICS_ROUTES
+)
+from metrics import CONCURRENCY_LIMIT, REQUESTS_SHED
+from rate_limit import app_routes, match_route
+
+
+CRITICAL = "critical"
+NORMAL = "normal"
+ANALYTICS = "analytics"
+
+# Share of the concurrency limit each priority may occupy; lower priorities
+# are shed first as the limit shrinks.
+SHARES = {
+    CRITICAL: 1.0,
+    NORMAL: 0.8,
+    ANALYTICS: 0.5,
+}
+
+_SMOOTHING = 0.1
+_BASELINE_DRIFT = 0.01
+
+
+class AIMDLimiter:
+    def __init__(
+        self,
+        initial: int = LOAD_SHED_INITIAL_LIMIT,
+        min_limit: int = LOAD_SHED_MIN_LIMIT,
+        max_limit: int = LOAD_SHED_MAX_LIMIT,
+        target_ms: float = LOAD_SHED_TARGET_MS,
+        tolerance: float = LOAD_SHED_TOLERANCE,
+        critical_min_limit: int = LOAD_SHED_CRITICAL_MIN_LIMIT,
+        backoff: float = LOAD_SHED_BACKOFF,
+        queue_size: int = LOAD_SHED_QUEUE_SIZE,
+        queue_timeout_ms: float = LOAD_SHED_QUEUE_TIMEOUT_MS
+    ):
+        self.limit = float(initial)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.target = target_ms / 1000
+        self.tolerance = tolerance
+        self.critical_min_limit = critical_min_limit
+        self.backoff = backoff
+        self.queue_size = queue_size
+        self.queue_timeout = queue_timeout_ms / 1000
+        self.in_flight = 0
+        # Latency and baseline are kept per route: a redirect and a search do
+        # not cost the same, and one baseline shared by both would be the
+        # redirect's.
+        self.latency: dict[str, float] = {}
+        self.baseline: dict[str, float] = {}
+        self._last_decrease = 0.0
+        self._waiters: deque[asyncio.Future] = deque()
+        CONCURRENCY_LIMIT.set(self.limit)
+
+    def _capacity(self, priority: str) -> float:
+        if priority == CRITICAL:
+            # Critical routes keep their floor however far the limit shrinks.
+            return max(self.limit, self.critical_min_limit)
+        return max(1.0, self.limit * SHARES[priority])
+
+    def try_acquire(self, priority: str) -> bool:
+        if self.in_flight < self._capacity(priority):
+            self.in_flight += 1
+            return True
+        return False
+
+    async def acquire(self, priority: str) -> bool:
+        if self.try_acquire(priority):
+            return True
+        if priority != CRITICAL or len(self._waiters) >= self.queue_size:
+            return False
+
+        loop = asyncio.get_running_loop()
+        waiter = loop.create_future()
+        self._waiters.append(waiter)
+        handle = loop.call_later(self.queue_timeout, self._expire, waiter)
+        try:
+            return await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled() and waiter.result():
+                self.release()
+            raise
+        finally:
+            handle.cancel()
+
+    def _expire(self, waiter: asyncio.Future) -> None:
+        if not waiter.done():
+            self._waiters.remove(waiter)
+            waiter.set_result(False)
+
+    def release(self) -> None:
+        self.in_flight -= 1
+        while self._waiters and self.in_flight < self._capacity(CRITICAL):
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                # The slot is handed over to the waiter directly, so a newly
+                # arriving request cannot take it first.
+                self.in_flight += 1
+                waiter.set_result(True)
+
+    def on_sample(self, latency: float, overloaded: bool, route: str = None) -> None:
+        now = time.monotonic()
+        # A smoothed latency keeps single slow requests from shrinking the limit.
+        smoothed = self.latency.get(route)
+        smoothed = latency if smoothed is None else smoothed + _SMOOTHING * (latency - smoothed)
+        self.latency[route] = smoothed
+        # The baseline follows the route's fastest responses and drifts up
+        # slowly, so it tracks what the route costs without queueing. Only
+        # latency well above it means requests wait for each other; a slow
+        # database alone does not shrink the limit.
+        baseline = self.baseline.get(route)
+        if baseline is None or latency < baseline:
+            baseline = latency
+        else:
+            baseline += _BASELINE_DRIFT * (latency - baseline)
+        self.baseline[route] = baseline
+        queueing = smoothed > max(self.target, baseline * self.tolerance)
+        if overloaded or queueing:
+            # Decrease at most once per target interval, so one burst of slow
+            # responses does not collapse the limit.
+            if now - self._last_decrease >= self.target:
+                self.limit = max(self.min_limit, self.limit * self.backoff)
+                self._last_decrease = now
+        elif self.in_flight >= self.limit / 2:
+            self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+        CONCURRENCY_LIMIT.set(self.limit)
+
+
+def _route_names(spec: str) -> set[str]:
+    return {name.strip() for name in spec.split(",") if name.strip()}
+
+
+class LoadSheddingMiddleware:
+    def __init__(
+        self,
+        app,
+        enabled: bool = LOAD_SHED_ENABLED,
+        limiter: AIMDLimiter = None,
+        critical_routes: str = LOAD_SHED_CRITICAL_ROUTES,
+        analytics_routes: str = LOAD_SHED_ANALYTICS_ROUTES
+    ):
+        self.app = app
+        self.enabled = enabled
+        self.limiter = limiter or AIMDLimiter()
+        self.critical_routes = _route_names(critical_routes)
+        self.analytics_routes = _route_names(analytics_routes)
+        self._routes = None
+
+    def _route_name(self, scope) -> str:
+        if self._routes is None:
+            self._routes = app_routes(scope, self.app)
+        return getattr(match_route(self._routes, scope), "name", None)
+
+    def _priority(self, name: str) -> str:
+        if name in self.critical_routes:
+            return CRITICAL
+        if name in self.analytics_routes:
+            return ANALYTICS
+        return NORMAL
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self.enabled:
+            await self.app(scope, receive, send)
+            return
+
+        name = self._route_name(scope)
+        priority = self._priority(name)
+        if not await self.limiter.acquire(priority):
+            REQUESTS_SHED.labels(priority).inc()
+            await self._reject(send)
+            return
+
+        status_code = 500
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            self.limiter.release()
+            # Analytics handlers are expected to be slow; only the latency of
+            # critical and normal routes drives the limit down. 503s come from
+            # other guards (breakers, the password pool) and say nothing about
+            # queueing in this worker.
+            if status_code != 503 and (priority != ANALYTICS or status_code >= 500):
+                self.limiter.on_sample(time.perf_counter() - started, status_code >= 500, name)
+
+    async def _reject(self, send) -> None:
+        body = orjson.dumps({"detail": "Server is overloaded, retry later"})
+        await send({
+            "type": "http.response.start",
+            "status": 503,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                (b"retry-after", str(LOAD_SHED_RETRY_AFTER).encode()),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
@@ -0,0 +1,172 @@
+import logging
+import queue
+import random
+import re
+import sys
+import time
+import uuid
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from typing import Optional
+
+import orjson
+
+from config import LOG_LEVEL, LOG_FORMAT, LOG_SAMPLING, LOG_QUEUE_SIZE, REQUEST_ID_HEADER
+
+
+request_id_var: ContextVar[Optional[str]] = ContextVar("request_id", default=None)
+
+_RECORD_FIELDS = set(logging.makeLogRecord({}).__dict__) | {"message", "asctime", "request_id"}
+_REQUEST_ID_PATTERN = re.compile(r"[A-Za-z0-9._-]{1,64}")
+
+access_logger = logging.getLogger("access")
+redirect_access_logger = logging.getLogger("access.redirect")
+
+_listener: Optional[QueueListener] = None
+_handler: Optional[QueueHandler] = None
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        data = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        if getattr(record, "request_id", None):
+            data["request_id"] = record.request_id
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_FIELDS:
+                data[key] = value
+        if record.exc_info:
+            data["exc_info"] = self.formatException(record.exc_info)
+        return orjson.dumps(data, default=str).decode()
+
+
+class RequestIdFilter(logging.Filter):
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.request_id = request_id_var.get()
+        return True
+
+
+def parse_sampling(spec: str) -> dict[str, float]:
+    rates = {}
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        name, _, rate = item.partition("=")
+        rates[name.strip()] = float(rate)
+    return rates
+
+
+class SamplingFilter(logging.Filter):
+    # Keeps the given fraction of records below WARNING for each logger;
+    # warnings and errors always pass.
+    def __init__(self, rates: dict[str, float]):
+        super().__init__()
+        self.rates = rates
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        rate = self.rates.get(record.name)
+        if rate is None or record.levelno >= logging.WARNING:
+            return True
+        return random.random() < rate  # noqa: S311
+
+
+class _DroppingQueueHandler(QueueHandler):
+    # A full queue drops the record instead of blocking the event loop.
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            pass
+
+
+def setup_logging(
+    level: str = LOG_LEVEL,
+    log_format: str = LOG_FORMAT,
+    sampling: str = LOG_SAMPLING,
+    stream=None
+) -> QueueListener:
+    # Records are only put on a queue in the calling thread; formatting and
+    # the stdout write happen in the listener thread.
+    global _listener, _handler
+    shutdown_logging()
+
+    output = logging.StreamHandler(stream or sys.stdout)
+    output.setFormatter(JsonFormatter() if log_format == "json" else logging.Formatter(
+        "%(asctime)s %(levelname)s %(name)s [%(request_id)s] %(message)s"
+    ))
+
+    log_queue = queue.Queue(LOG_QUEUE_SIZE)
+    _handler = _DroppingQueueHandler(log_queue)
+    _handler.addFilter(RequestIdFilter())
+    _handler.addFilter(SamplingFilter(parse_sampling(sampling)))
+
+    root = logging.getLogger()
+    root.addHandler(_handler)
+    root.setLevel(level)
+
+    _listener = QueueListener(log_queue, output, respect_handler_level=True)
+    _listener.start()
+    return _listener
+
+
+def shutdown_logging() -> None:
+    global _listener, _handler
+    if _handler is not None:
+        logging.getLogger().removeHandler(_handler)
+        _handler = None
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+def _request_id(scope) -> str:
+    header = REQUEST_ID_HEADER.lower().encode()
+    for name, value in scope["headers"]:
+        if name == header:
+            value = value.decode("latin-1")
+            if _REQUEST_ID_PATTERN.fullmatch(value):
+                return value
+            break
+    return uuid.uuid4().hex
+
+
+class AccessLogMiddleware:
+    def __init__(self, app, redirect_routes: tuple[str, ...] = ("url_redirect",)):
+        self.app = app
+        self.redirect_routes = set(redirect_routes)
+        self._header = REQUEST_ID_HEADER.lower().encode()
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        request_id = _request_id(scope)
+        token = request_id_var.set(request_id)
+        status_code = 500
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                message["headers"] = [*message.get("headers", []), (self._header, request_id.encode())]
+            await send(message)
+
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            route = scope.get("route")
+            logger = redirect_access_logger if getattr(route, "name", None) in self.redirect_routes else access_logger
+            level = logging.WARNING if status_code >= 500 else logging.INFO
+            if logger.isEnabledFor(level):
+                logger.log(level, "%s %s %s", scope["method"], scope["path"], status_code, extra={
+                    "method": scope["method"],
+                    "route": getattr(route, "path", None),
+                    "status": status_code,
+                    "duration_ms": round((time.perf_counter() - started) * 1000, 3),
+                })
+            request_id_var.reset(token)
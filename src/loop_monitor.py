@@ -0,0 +1,104 @@
+import asyncio
+import logging
+import sys
+import threading
+import time
+import traceback
+from collections import Counter, deque
+from dataclasses import dataclass
+from typing import Optional
+
+from config import LOOP_MONITOR_INTERVAL, LOOP_BLOCK_THRESHOLD_MS, LOOP_BLOCK_SAMPLE_MS, LOOP_BLOCK_MAX_SAMPLES
+from metrics import EVENT_LOOP_BLOCKS, EVENT_LOOP_LAG
+
+
+logger = logging.getLogger(__name__)
+
+_STACK_DEPTH = 15
+_REPORTS = 20
+
+
+@dataclass
+class BlockReport:
+    blocked_ms: float
+    samples: int
+    stacks: list[tuple[str, int]]
+
+
+class LoopMonitor:
+    # A heartbeat task measures how late the loop wakes it up. A separate
+    # thread watches the heartbeat and, while the loop is stuck, samples the
+    # loop thread's stack, so the report shows the code that was blocking.
+    def __init__(
+        self,
+        interval: float = LOOP_MONITOR_INTERVAL,
+        threshold_ms: float = LOOP_BLOCK_THRESHOLD_MS,
+        sample_ms: float = LOOP_BLOCK_SAMPLE_MS,
+        max_samples: int = LOOP_BLOCK_MAX_SAMPLES
+    ):
+        self.interval = interval
+        self.threshold = threshold_ms / 1000
+        self.sample_interval = sample_ms / 1000
+        self.max_samples = max_samples
+        self.reports: deque[BlockReport] = deque(maxlen=_REPORTS)
+        self._beat = time.monotonic()
+        self._loop_thread_id: Optional[int] = None
+        self._task: Optional[asyncio.Task] = None
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    def start(self) -> None:
+        self._loop_thread_id = threading.get_ident()
+        self._beat = time.monotonic()
+        self._stop.clear()
+        self._task = asyncio.get_running_loop().create_task(self._heartbeat())
+        self._thread = threading.Thread(target=self._watch, name="loop-monitor", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    async def _heartbeat(self) -> None:
+        while True:
+            started = time.monotonic()
+            self._beat = started
+            await asyncio.sleep(self.interval)
+            EVENT_LOOP_LAG.observe(max(0.0, time.monotonic() - started - self.interval))
+
+    def _watch(self) -> None:
+        samples = []
+        blocked_since = None
+        while not self._stop.wait(self.sample_interval):
+            beat = self._beat
+            overdue = time.monotonic() - beat - self.interval
+            if overdue >= self.threshold:
+                blocked_since = blocked_since or beat + self.interval
+                if len(samples) < self.max_samples:
+                    frame = sys._current_frames().get(self._loop_thread_id)
+                    if frame is not None:
+                        samples.append(traceback.extract_stack(frame)[-_STACK_DEPTH:])
+            elif blocked_since is not None:
+                # The heartbeat has run again, so the block is over.
+                self._report(self._beat - blocked_since, samples)
+                samples = []
+                blocked_since = None
+
+    def _report(self, blocked: float, samples: list) -> None:
+        EVENT_LOOP_BLOCKS.inc()
+        stacks = Counter("".join(traceback.format_list(stack)) for stack in samples)
+        report = BlockReport(round(blocked * 1000, 1), len(samples), stacks.most_common())
+        self.reports.append(report)
+        if report.stacks:
+            stack, count = report.stacks[0]
+            logger.warning(
+                "Event loop was blocked for %.1f ms; %s of %s stack samples in:\n%s",
+                report.blocked_ms, count, report.samples, stack
+            )
+        else:
+            logger.warning("Event loop was blocked for %.1f ms", report.blocked_ms)
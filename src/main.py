@@ -1,25 +1,82 @@
+import asyncio
+import logging
 from fastapi import FastAPI
+from fastapi.responses import JSONResponse, Response
 from collections.abc import AsyncIterator
 from contextlib import asynccontextmanager
 from auth.users import auth_backend, fastapi_users
+from auth.passwords import password_helper
 from auth.schemas import UserCreate, UserRead
 from routers.user import router as user_router
 from routers.premium import router as premium_router
-from redis import asyncio as aioredis
 from fastapi_cache import FastAPICache
-from fastapi_cache.backends.redis import RedisBackend
+from config import ENRICHMENT_ENABLED, LOOP_MONITOR_ENABLED, LINK_SNAPSHOT_ENABLED
+from caching import request_key_builder
+from coders import default_coder
+from database import get_session_maker
+from link_cache import warm_up_cache
+from link_table import link_table
+from redis_cache import build_cache_backend, close_redis, create_redis
+from circuit_breaker import BreakerBackend
+from enrichment import get_geoip, run_enrichment
+from user_stats import run_user_stats, user_clicks
+from loop_monitor import LoopMonitor
+from log_config import AccessLogMiddleware, setup_logging, shutdown_logging
+from responses import FastJSONResponse
+from metrics import PrometheusMiddleware, render_metrics
+from profiling import QueryProfilerMiddleware
+from tracing import setup_tracing, shutdown_tracing, traced_backend
+from rate_limit import RateLimitMiddleware
+from load_shedding import LoadSheddingMiddleware
+from prometheus_client import CONTENT_TYPE_LATEST
 
 import uvicorn
 
 
 @asynccontextmanager
-async def lifespan(_: FastAPI) -> AsyncIterator[None]:
-    redis = aioredis.from_url("redis://redis:6379")
-    FastAPICache.init(RedisBackend(redis), prefix="fastapi-cache")
+async def lifespan(app: FastAPI) -> AsyncIterator[None]:
+    app.state.ready = False
+    setup_logging()
+    loop_monitor = LoopMonitor() if LOOP_MONITOR_ENABLED else None
+    if loop_monitor is not None:
+        loop_monitor.start()
+    setup_tracing()
+    redis = create_redis()
+    FastAPICache.init(BreakerBackend(traced_backend(build_cache_backend(redis))), prefix="fastapi-cache", coder=default_coder, key_builder=request_key_builder)
+    if LINK_SNAPSHOT_ENABLED:
+        await link_table.start(get_session_maker())
+    else:
+        await warm_up_cache(get_session_maker())
+    enrichment = None
+    if ENRICHMENT_ENABLED:
+        get_geoip()
+        enrichment = asyncio.create_task(run_enrichment(get_session_maker()))
+    user_stats = asyncio.create_task(run_user_stats(get_session_maker()))
+    app.state.ready = True
     yield
+    if enrichment is not None:
+        enrichment.cancel()
+    user_stats.cancel()
+    try:
+        await user_clicks.flush(get_session_maker())
+    except Exception:
+        logging.getLogger(__name__).warning("Cannot flush user click counters", exc_info=True)
+    await link_table.stop()
+    await close_redis(redis)
+    password_helper.shutdown()
+    shutdown_tracing()
+    if loop_monitor is not None:
+        loop_monitor.stop()
+    shutdown_logging()
 
 
-app = FastAPI(lifespan=lifespan, debug=True)
+app = FastAPI(lifespan=lifespan, debug=True, default_response_class=FastJSONResponse)
+app.state.ready = False
+app.add_middleware(RateLimitMiddleware)
+app.add_middleware(QueryProfilerMiddleware)
+app.add_middleware(LoadSheddingMiddleware)
+app.add_middleware(PrometheusMiddleware)
+app.add_middleware(AccessLogMiddleware)
 
 app.include_router(
     fastapi_users.get_auth_router(auth_backend), prefix="/auth/jwt", tags=["auth"]
@@ -34,5 +91,18 @@ app.include_router(user_router)
 app.include_router(premium_router)
 
 
+@app.get("/health", tags=["health"])
+async def health():
+    if not app.state.ready:
+        return JSONResponse(status_code=503, content={"status": "warming_up"})
+    return {"status": "ready"}
+
+
+
+@app.get("/metrics", tags=["health"], include_in_schema=False)
+async def metrics():
+    return Response(content=render_metrics(), media_type=CONTENT_TYPE_LATEST)
+
+
 if __name__ == "__main__":
     uvicorn.run("main:app", reload=True, host="0.0.0.0", log_level="debug")
\ No newline at end of file
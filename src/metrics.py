@@ -0,0 +1,195 @@
+import os
+import time
+
+from prometheus_client import (
+    CollectorRegistry, Counter, Gauge, GCCollector, Histogram, PlatformCollector, ProcessCollector,
+    generate_latest, multiprocess
+)
+from sqlalchemy import event
+
+
+REQUEST_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 5)
+
+_OPERATIONS = {"SELECT", "INSERT", "UPDATE", "DELETE", "BEGIN", "COMMIT", "ROLLBACK"}
+_METHODS = {"GET", "HEAD", "POST", "PUT", "PATCH", "DELETE", "OPTIONS"}
+
+
+# The service's own registry: collectors never touch the process-wide default
+# one, so importing this module again under another name cannot collide.
+REGISTRY = CollectorRegistry()
+ProcessCollector(registry=REGISTRY)
+PlatformCollector(registry=REGISTRY)
+GCCollector(registry=REGISTRY)
+
+
+REQUEST_LATENCY = Histogram(
+    "http_request_duration_seconds",
+    "HTTP request latency by route template",
+    ["method", "route", "status"],
+    buckets=REQUEST_BUCKETS,
+    registry=REGISTRY
+)
+REQUESTS_IN_PROGRESS = Gauge(
+    "http_requests_in_progress",
+    "HTTP requests being handled",
+    ["method"],
+    multiprocess_mode="livesum",
+    registry=REGISTRY
+)
+DB_QUERY_LATENCY = Histogram(
+    "db_query_duration_seconds",
+    "SQL statement latency by statement type",
+    ["operation"],
+    buckets=QUERY_BUCKETS,
+    registry=REGISTRY
+)
+DB_QUERY_ERRORS = Counter(
+    "db_query_errors_total",
+    "SQL statements that raised",
+    ["operation"],
+    registry=REGISTRY
+)
+DB_POOL_CHECKED_OUT = Gauge(
+    "db_pool_checked_out_connections",
+    "Connections currently checked out of the pool",
+    multiprocess_mode="livesum",
+    registry=REGISTRY
+)
+DB_POOL_CONNECTIONS = Gauge(
+    "db_pool_open_connections",
+    "Connections currently opened by the pool",
+    multiprocess_mode="livesum",
+    registry=REGISTRY
+)
+CACHE_REQUESTS = Counter(
+    "cache_requests_total",
+    "Cache lookups by cache and result (hit, stale, miss)",
+    ["cache", "result"],
+    registry=REGISTRY
+)
+
+CONCURRENCY_LIMIT = Gauge(
+    "concurrency_limit",
+    "Adaptive concurrency limit of the worker",
+    multiprocess_mode="liveall",
+    registry=REGISTRY
+)
+REQUESTS_SHED = Counter(
+    "requests_shed_total",
+    "Requests rejected by the concurrency limiter by priority",
+    ["priority"],
+    registry=REGISTRY
+)
+PIPELINE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256, 512)
+CACHE_PIPELINE_COMMANDS = Histogram(
+    "cache_pipeline_commands",
+    "Cache commands sent to Redis in one pipelined round trip",
+    buckets=PIPELINE_BUCKETS,
+    registry=REGISTRY
+)
+CIRCUIT_BREAKER_STATE = Gauge(
+    "circuit_breaker_state",
+    "Circuit breaker state: 0 closed, 1 half-open, 2 open",
+    ["name"],
+    multiprocess_mode="liveall",
+    registry=REGISTRY
+)
+
+LOOP_LAG_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+EVENT_LOOP_LAG = Histogram(
+    "event_loop_lag_seconds",
+    "Delay of event loop heartbeats beyond their schedule",
+    buckets=LOOP_LAG_BUCKETS,
+    registry=REGISTRY
+)
+EVENT_LOOP_BLOCKS = Counter(
+    "event_loop_blocks_total",
+    "Times the event loop was blocked longer than the threshold",
+    registry=REGISTRY
+)
+
+
+def record_cache(cache: str, result: str) -> None:
+    CACHE_REQUESTS.labels(cache, result).inc()
+
+
+def _operation(statement: str) -> str:
+    operation = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else ""
+    return operation if operation in _OPERATIONS else "OTHER"
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("metrics_query_start", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info["metrics_query_start"].pop()
+    DB_QUERY_LATENCY.labels(_operation(statement)).observe(time.perf_counter() - started)
+
+
+def _handle_error(context):
+    starts = context.connection.info.get("metrics_query_start") if context.connection is not None else None
+    if starts:
+        starts.pop()
+    DB_QUERY_ERRORS.labels(_operation(context.statement or "")).inc()
+
+
+def instrument_engine(engine) -> None:
+    sync_engine = getattr(engine, "sync_engine", engine)
+    if event.contains(sync_engine, "before_cursor_execute", _before_cursor_execute):
+        return
+
+    event.listen(sync_engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(sync_engine, "after_cursor_execute", _after_cursor_execute)
+    event.listen(sync_engine, "handle_error", _handle_error)
+
+    pool = sync_engine.pool
+    event.listen(pool, "connect", lambda *args: DB_POOL_CONNECTIONS.inc())
+    event.listen(pool, "close", lambda *args: DB_POOL_CONNECTIONS.dec())
+    event.listen(pool, "checkout", lambda *args: DB_POOL_CHECKED_OUT.inc())
+    event.listen(pool, "checkin", lambda *args: DB_POOL_CHECKED_OUT.dec())
+
+
+def _route_template(scope) -> str:
+    route = scope.get("route")
+    return getattr(route, "path", None) or "unmatched"
+
+
+class PrometheusMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"] if scope["method"] in _METHODS else "OTHER"
+        status_code = 500
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        in_progress = REQUESTS_IN_PROGRESS.labels(method)
+        in_progress.inc()
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            in_progress.dec()
+            REQUEST_LATENCY.labels(method, _route_template(scope), str(status_code)).observe(
+                time.perf_counter() - started
+            )
+
+
+def render_metrics() -> bytes:
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry)
+    return generate_latest(REGISTRY)
+
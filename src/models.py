@@ -1,6 +1,6 @@
 from datetime import datetime
 import uuid
-from sqlalchemy import Column, String, TIMESTAMP, Boolean, DateTime, Integer, ForeignKey
+from sqlalchemy import Column, String, TIMESTAMP, Boolean, Date, DateTime, Integer, ForeignKey, Index
 from sqlalchemy.dialects.postgresql import UUID
 from sqlalchemy.orm import DeclarativeBase, relationship
 
@@ -23,20 +23,50 @@ class User(Base):
     links = relationship("Link", back_populates="owner")
 
 
+class Domain(Base):
+    __tablename__ = "domain"
+
+    id = Column(Integer, primary_key=True, index=True, autoincrement=True)
+    host = Column(String, nullable=False, unique=True)
+    owner_id = Column(UUID, ForeignKey("user.id"), nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+
 class Link(Base):
     __tablename__ = "link"
+    __table_args__ = (
+        Index("ix_link_domain_short_code", "domain", "short_code", unique=True),
+        Index("ix_link_owner_created_id", "owner_id", "created_at", "id"),
+    )
 
     id = Column(Integer, primary_key=True, index=True, autoincrement=True)
-    short_code = Column(String, nullable=False, index=True, unique=True)
+    domain = Column(String, nullable=False, default="", server_default="")
+    short_code = Column(String, nullable=False)
     original_url = Column(String, nullable=False, index=True)
     created_at = Column(DateTime, default=datetime.utcnow, index=True)
     expires_at = Column(DateTime, nullable=True)
     clicks = Column(Integer, default=0)
+    counted_clicks = Column(Integer, nullable=False, default=0, server_default="0")
     last_accessed = Column(DateTime, nullable=True)
     owner_id = Column(UUID, ForeignKey("user.id"), nullable=True)
+    redirect_mode = Column(String, nullable=False, default="tracked", server_default="tracked")
     owner = relationship("User", back_populates="links")
 
 
+class LinkAlias(Base):
+    __tablename__ = "link_alias"
+    __table_args__ = (
+        Index("ix_link_alias_domain_short_code", "domain", "short_code", unique=True),
+    )
+
+    id = Column(Integer, primary_key=True, index=True, autoincrement=True)
+    domain = Column(String, nullable=False, default="", server_default="")
+    short_code = Column(String, nullable=False)
+    link_id = Column(Integer, ForeignKey("link.id", ondelete="CASCADE"), nullable=False, index=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    expires_at = Column(DateTime, nullable=False)
+
+
 class Query(Base):
     __tablename__ = "query"
 
@@ -45,4 +75,41 @@ class Query(Base):
     user_id = Column(UUID, index=True)
     short_code = Column(String, nullable=False, index=True)
     original_link = Column(String, nullable=False, index=True)
-    accessed_at = Column(TIMESTAMP, default=datetime.utcnow, index=True)
\ No newline at end of file
+    accessed_at = Column(TIMESTAMP, default=datetime.utcnow, index=True)
+    ip = Column(String, nullable=True)
+    user_agent = Column(String, nullable=True)
+    referrer = Column(String, nullable=True)
+    country = Column(String, nullable=True)
+    device = Column(String, nullable=True)
+    browser = Column(String, nullable=True)
+    os = Column(String, nullable=True)
+    referrer_host = Column(String, nullable=True)
+    enriched_at = Column(DateTime, nullable=True)
+
+    __table_args__ = (
+        Index(
+            "ix_query_pending_enrichment", "id",
+            postgresql_where=enriched_at.is_(None),
+            sqlite_where=enriched_at.is_(None)
+        ),
+    )
+
+
+class QueryRollup(Base):
+    __tablename__ = "query_rollup"
+
+    link_id = Column(Integer, primary_key=True)
+    day = Column(Date, primary_key=True)
+    dimension = Column(String, primary_key=True)
+    value = Column(String, primary_key=True)
+    clicks = Column(Integer, nullable=False, default=0)
+
+
+class UserLinkStats(Base):
+    __tablename__ = "user_link_stats"
+
+    owner_id = Column(UUID, ForeignKey("user.id", ondelete="CASCADE"), primary_key=True)
+    total_links = Column(Integer, nullable=False, default=0, server_default="0")
+    active_links = Column(Integer, nullable=False, default=0, server_default="0")
+    total_clicks = Column(Integer, nullable=False, default=0, server_default="0")
+    reconciled_at = Column(DateTime, nullable=True)
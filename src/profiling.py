@@ -0,0 +1,212 @@
+import hmac
+import logging
+import random
+import time
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Optional
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from config import (
+    QUERY_PROFILING, QUERY_PROFILING_HEADER, QUERY_PROFILING_SECRET, SLOW_QUERY_MS, SLOW_QUERY_EXPLAIN_RATE, SLOW_QUERY_EXPLAIN_LIMIT
+)
+
+
+logger = logging.getLogger(__name__)
+
+_PROFILE_KEY = "query_profile"
+_START_KEY = "query_profile_start"
+_EXPLAIN_PREFIXES = {
+    "postgresql": "EXPLAIN ",
+    "sqlite": "EXPLAIN QUERY PLAN ",
+}
+_EXPLAINABLE = ("SELECT", "INSERT", "UPDATE", "DELETE", "WITH")
+_STATEMENT_LOG_LENGTH = 300
+
+_current_profile: ContextVar[Optional["QueryProfile"]] = ContextVar("query_profile", default=None)
+
+
+@dataclass
+class StatementStats:
+    count: int = 0
+    total: float = 0.0
+    max: float = 0.0
+
+
+@dataclass
+class QueryProfile:
+    started: float = field(default_factory=time.perf_counter)
+    statements: dict[str, StatementStats] = field(default_factory=dict)
+    slow: list[dict] = field(default_factory=list)
+    explained: int = 0
+
+    @property
+    def count(self) -> int:
+        return sum(stats.count for stats in self.statements.values())
+
+    @property
+    def db_time(self) -> float:
+        return sum(stats.total for stats in self.statements.values())
+
+    def record(self, statement: str, elapsed: float) -> None:
+        stats = self.statements.get(statement)
+        if stats is None:
+            stats = self.statements[statement] = StatementStats()
+        stats.count += 1
+        stats.total += elapsed
+        stats.max = max(stats.max, elapsed)
+
+    def server_timing(self) -> str:
+        total = (time.perf_counter() - self.started) * 1000
+        return f'db;dur={self.db_time * 1000:.3f};desc="{self.count} queries", total;dur={total:.3f}'
+
+    def summary(self) -> dict:
+        return {
+            "query_count": self.count,
+            "db_ms": round(self.db_time * 1000, 3),
+            "total_ms": round((time.perf_counter() - self.started) * 1000, 3),
+            "statements": [
+                {
+                    "statement": statement[:_STATEMENT_LOG_LENGTH],
+                    "count": stats.count,
+                    "total_ms": round(stats.total * 1000, 3),
+                    "max_ms": round(stats.max * 1000, 3),
+                }
+                for statement, stats in sorted(self.statements.items(), key=lambda item: -item[1].total)
+            ],
+            "repeated": [statement[:_STATEMENT_LOG_LENGTH] for statement, stats in self.statements.items() if stats.count > 1],
+            "slow": self.slow,
+        }
+
+
+def attach_profile(session) -> None:
+    profile = _current_profile.get()
+    if profile is not None:
+        session.info[_PROFILE_KEY] = profile
+
+
+@event.listens_for(Session, "after_begin")
+def _after_begin(session, transaction, connection):
+    profile = session.info.get(_PROFILE_KEY)
+    if profile is not None:
+        connection.info[_PROFILE_KEY] = profile
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _PROFILE_KEY in conn.info:
+        conn.info.setdefault(_START_KEY, []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    profile = conn.info.get(_PROFILE_KEY)
+    starts = conn.info.get(_START_KEY)
+    if profile is None or not starts:
+        return
+    elapsed = time.perf_counter() - starts.pop()
+    profile.record(statement, elapsed)
+    if elapsed * 1000 >= SLOW_QUERY_MS:
+        slow = {"statement": statement[:_STATEMENT_LOG_LENGTH], "ms": round(elapsed * 1000, 3)}
+        if not executemany and _should_explain(profile, statement):
+            slow["plan"] = _explain(conn, statement, parameters)
+        profile.slow.append(slow)
+
+
+def _handle_error(context):
+    if context.connection is not None:
+        starts = context.connection.info.get(_START_KEY)
+        if starts:
+            starts.pop()
+
+
+def _checkin(dbapi_connection, connection_record):
+    connection_record.info.pop(_PROFILE_KEY, None)
+    connection_record.info.pop(_START_KEY, None)
+
+
+def _should_explain(profile: QueryProfile, statement: str) -> bool:
+    if profile.explained >= SLOW_QUERY_EXPLAIN_LIMIT:
+        return False
+    if not statement.lstrip().upper().startswith(_EXPLAINABLE):
+        return False
+    return random.random() < SLOW_QUERY_EXPLAIN_RATE  # noqa: S311
+
+
+def _explain(conn, statement: str, parameters) -> Optional[list[str]]:
+    prefix = _EXPLAIN_PREFIXES.get(conn.dialect.name)
+    if prefix is None:
+        return None
+    conn.info[_PROFILE_KEY].explained += 1
+    # A raw DBAPI cursor does not fire engine events, so the EXPLAIN itself
+    # is neither profiled nor explained again.
+    cursor = conn.connection.cursor()
+    try:
+        cursor.execute(prefix + statement, parameters)
+        return [" ".join(str(column) for column in row) for row in cursor.fetchall()]
+    except Exception:
+        logger.warning("Cannot explain slow query", exc_info=True)
+        return None
+    finally:
+        cursor.close()
+
+
+def profile_engine(engine) -> None:
+    sync_engine = getattr(engine, "sync_engine", engine)
+    if event.contains(sync_engine, "before_cursor_execute", _before_cursor_execute):
+        return
+    event.listen(sync_engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(sync_engine, "after_cursor_execute", _after_cursor_execute)
+    event.listen(sync_engine, "handle_error", _handle_error)
+    event.listen(sync_engine.pool, "checkin", _checkin)
+
+
+def _profiling_requested(scope) -> bool:
+    if QUERY_PROFILING == "always":
+        return True
+    # The header must carry the configured secret: profiling runs EXPLAINs
+    # and exposes SQL timings, so anonymous clients must not switch it on.
+    if QUERY_PROFILING != "header" or not QUERY_PROFILING_SECRET:
+        return False
+    header = QUERY_PROFILING_HEADER.lower().encode()
+    secret = QUERY_PROFILING_SECRET.encode()
+    return any(name == header and hmac.compare_digest(value, secret) for name, value in scope["headers"])
+
+
+class QueryProfilerMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not _profiling_requested(scope):
+            await self.app(scope, receive, send)
+            return
+
+        profile = QueryProfile()
+        token = _current_profile.set(profile)
+        status_code = 500
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                message["headers"] = [
+                    *message.get("headers", []),
+                    (b"server-timing", profile.server_timing().encode())
+                ]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _current_profile.reset(token)
+            route = scope.get("route")
+            summary = profile.summary()
+            logger.info("Query profile of %s %s: %s queries", scope["method"], scope["path"], summary["query_count"], extra={
+                "event": "query_profile",
+                "method": scope["method"],
+                "path": scope["path"],
+                "route": getattr(route, "path", None),
+                "status": status_code,
+                **summary
+            })
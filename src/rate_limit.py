@@ -0,0 +1,245 @@
+import logging
+import math
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Optional
+
+import jwt
+import orjson
+from fastapi_cache import FastAPICache
+from fastapi_users.jwt import decode_jwt
+from starlette.routing import Match
+
+from config import (
+    SECRET, RATE_LIMIT_ENABLED, RATE_LIMITS, RATE_LIMIT_DEFAULT, RATE_LIMIT_REDIS, RATE_LIMIT_LEASE,
+    RATE_LIMIT_LEASE_TTL, RATE_LIMIT_MAX_KEYS, RATE_LIMIT_TRUST_FORWARDED
+)
+
+
+logger = logging.getLogger(__name__)
+
+TIERS = ("anonymous", "free", "premium")
+
+_TOKEN_BUCKET_SCRIPT = """
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local now = tonumber(ARGV[3])
+local requested = tonumber(ARGV[4])
+local state = redis.call('HMGET', KEYS[1], 't', 'u')
+local tokens = tonumber(state[1]) or burst
+local updated = tonumber(state[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - updated) * rate)
+local granted = math.min(requested, math.floor(tokens))
+tokens = tokens - granted
+redis.call('HSET', KEYS[1], 't', tostring(tokens), 'u', tostring(now))
+redis.call('EXPIRE', KEYS[1], math.ceil(burst / rate) + 1)
+return granted
+"""
+
+
+@dataclass(frozen=True)
+class Limit:
+    requests: int
+    period: float
+
+    @property
+    def rate(self) -> float:
+        return self.requests / self.period
+
+
+def parse_limits(spec: str) -> dict[str, Limit]:
+    limits = {}
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        tier, _, value = item.partition(":")
+        requests, _, period = value.partition("/")
+        if tier not in TIERS:
+            raise ValueError(f"Unknown rate limit tier {tier!r}, expected one of {TIERS}")
+        limits[tier] = Limit(int(requests), float(period))
+    return limits
+
+
+def parse_route_limits(spec: str) -> dict[tuple[str, str], dict[str, Limit]]:
+    routes = {}
+    for item in filter(None, (part.strip() for part in spec.split(";"))):
+        route, _, limits = item.partition("=")
+        method, _, path = route.strip().partition(" ")
+        routes[(method.upper(), path.strip())] = parse_limits(limits)
+    return routes
+
+
+class TokenBucket:
+    __slots__ = ("tokens", "updated")
+
+    def __init__(self, tokens: float, updated: float):
+        self.tokens = tokens
+        self.updated = updated
+
+    def take(self, limit: Limit, now: float) -> float:
+        self.tokens = min(limit.requests, self.tokens + (now - self.updated) * limit.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / limit.rate
+
+
+class _Lease:
+    __slots__ = ("tokens", "expires", "denied_until")
+
+    def __init__(self):
+        self.tokens = 0
+        self.expires = 0.0
+        self.denied_until = 0.0
+
+
+class RateLimiter:
+    # Local buckets answer every request when Redis is not available. With
+    # Redis, tokens are leased from the shared bucket in small batches, so a
+    # worker talks to Redis about once per RATE_LIMIT_LEASE requests per key.
+    def __init__(self, lease: int = RATE_LIMIT_LEASE, lease_ttl: float = RATE_LIMIT_LEASE_TTL, max_keys: int = RATE_LIMIT_MAX_KEYS):
+        self.lease = lease
+        self.lease_ttl = lease_ttl
+        self.max_keys = max_keys
+        self._buckets: OrderedDict[str, TokenBucket] = OrderedDict()
+        self._leases: OrderedDict[str, _Lease] = OrderedDict()
+
+    def _touch(self, entries: OrderedDict, key: str, factory):
+        entry = entries.get(key)
+        if entry is None:
+            entry = entries[key] = factory()
+            if len(entries) > self.max_keys:
+                entries.popitem(last=False)
+        else:
+            entries.move_to_end(key)
+        return entry
+
+    def take_local(self, key: str, limit: Limit, now: float) -> float:
+        bucket = self._touch(self._buckets, key, lambda: TokenBucket(limit.requests, now))
+        return bucket.take(limit, now)
+
+    async def take(self, key: str, limit: Limit, redis=None) -> float:
+        now = time.time()
+        if redis is None:
+            return self.take_local(key, limit, now)
+
+        lease = self._touch(self._leases, key, _Lease)
+        if lease.tokens > 0 and lease.expires > now:
+            lease.tokens -= 1
+            return 0.0
+        if lease.denied_until > now:
+            return lease.denied_until - now
+
+        requested = max(1, min(self.lease, limit.requests // 10))
+        try:
+            granted = int(await redis.eval(_TOKEN_BUCKET_SCRIPT, 1, key, limit.rate, limit.requests, now, requested))
+        except Exception:
+            logger.warning("Rate limit backend failed, using local bucket for %s", key, exc_info=True)
+            return self.take_local(key, limit, now)
+
+        if granted <= 0:
+            lease.tokens = 0
+            lease.denied_until = now + 1 / limit.rate
+            return 1 / limit.rate
+        lease.tokens = granted - 1
+        lease.expires = now + self.lease_ttl
+        return 0.0
+
+
+def _header(scope, name: bytes) -> Optional[str]:
+    for key, value in scope["headers"]:
+        if key == name:
+            return value.decode("latin-1")
+    return None
+
+
+def client_ip(forwarded: Optional[str], client, trust_forwarded: bool = RATE_LIMIT_TRUST_FORWARDED) -> Optional[str]:
+    # X-Forwarded-For is set by the client unless a trusted proxy rewrites it.
+    if forwarded and trust_forwarded:
+        return forwarded.split(",")[0].strip()
+    return client[0] if client else None
+
+
+def client_identity(scope) -> tuple[str, str]:
+    authorization = _header(scope, b"authorization")
+    if authorization and authorization.lower().startswith("bearer "):
+        try:
+            data = decode_jwt(authorization[7:], SECRET, ["fastapi-users:auth"])
+        except jwt.PyJWTError:
+            data = None
+        if data and data.get("sub"):
+            return ("premium" if data.get("premium") else "free"), f"user:{data['sub']}"
+
+    ip = client_ip(_header(scope, b"x-forwarded-for"), scope.get("client"))
+    return "anonymous", f"ip:{ip or 'unknown'}"
+
+
+def app_routes(scope, app) -> list:
+    return list(scope["app"].routes if "app" in scope else app.routes)
+
+
+def match_route(routes: list, scope):
+    for route in routes:
+        match, _ = route.matches(scope)
+        if match is Match.FULL:
+            return route
+    return None
+
+
+def _redis():
+    if not RATE_LIMIT_REDIS:
+        return None
+    try:
+        return getattr(FastAPICache.get_backend(), "redis", None)
+    except AssertionError:
+        return None
+
+
+class RateLimitMiddleware:
+    # Runs before routing, so rejected requests never reach dependencies
+    # such as get_async_session.
+    def __init__(self, app, enabled: bool = RATE_LIMIT_ENABLED, route_limits: str = RATE_LIMITS, default_limits: str = RATE_LIMIT_DEFAULT):
+        self.app = app
+        self.enabled = enabled
+        self.route_limits = parse_route_limits(route_limits)
+        self.default_limits = parse_limits(default_limits)
+        self.limiter = RateLimiter()
+        self._routes = None
+
+    def _match(self, scope) -> tuple[str, dict[str, Limit]]:
+        if self._routes is None:
+            self._routes = app_routes(scope, self.app)
+        route = match_route(self._routes, scope)
+        if route is None:
+            return "unmatched", self.default_limits
+        route_id = (scope["method"], route.path)
+        return f"{route_id[0]} {route_id[1]}", self.route_limits.get(route_id, self.default_limits)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self.enabled:
+            await self.app(scope, receive, send)
+            return
+
+        route_id, limits = self._match(scope)
+        tier, identity = client_identity(scope)
+        limit = limits.get(tier)
+        if limit is None:
+            await self.app(scope, receive, send)
+            return
+
+        retry_after = await self.limiter.take(f"rl:{route_id}:{identity}", limit, _redis())
+        if retry_after <= 0:
+            await self.app(scope, receive, send)
+            return
+
+        body = orjson.dumps({"detail": "Too many requests"})
+        await send({
+            "type": "http.response.start",
+            "status": 429,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                (b"retry-after", str(max(1, math.ceil(retry_after))).encode()),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
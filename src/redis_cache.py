@@ -0,0 +1,111 @@
+import asyncio
+from typing import Any, Optional
+
+from fastapi_cache.backends.redis import RedisBackend
+from redis.asyncio import BlockingConnectionPool, Redis
+
+from config import (
+    REDIS_URL, REDIS_MAX_CONNECTIONS, REDIS_POOL_TIMEOUT, REDIS_SOCKET_TIMEOUT, REDIS_CONNECT_TIMEOUT,
+    REDIS_HEALTH_CHECK_INTERVAL, REDIS_PIPELINING, REDIS_PIPELINE_MAX_BATCH
+)
+from metrics import CACHE_PIPELINE_COMMANDS
+
+
+def create_redis(url: str = REDIS_URL) -> Redis:
+    # A blocking pool makes a request wait up to REDIS_POOL_TIMEOUT for a free
+    # connection instead of failing as soon as all of them are busy.
+    pool = BlockingConnectionPool.from_url(
+        url,
+        max_connections=REDIS_MAX_CONNECTIONS,
+        timeout=REDIS_POOL_TIMEOUT,
+        socket_timeout=REDIS_SOCKET_TIMEOUT,
+        socket_connect_timeout=REDIS_CONNECT_TIMEOUT,
+        health_check_interval=REDIS_HEALTH_CHECK_INTERVAL,
+        retry_on_timeout=True
+    )
+    return Redis(connection_pool=pool)
+
+
+async def close_redis(redis: Redis) -> None:
+    await redis.close()
+    await redis.connection_pool.disconnect()
+
+
+class PipelinedBackend(RedisBackend):
+    # Gets and sets issued during one event loop iteration are queued and
+    # sent in a single pipeline by a task that runs on the next iteration,
+    # so concurrent requests share round trips. Concurrent gets of the same
+    # key share one command as long as no set of that key is queued after it.
+    # Clears go through the same queue, so Redis sees every command in the
+    # order it was issued and a set queued before an invalidation cannot land
+    # after it.
+    def __init__(self, redis: Redis, max_batch: int = REDIS_PIPELINE_MAX_BATCH):
+        super().__init__(redis)
+        self.max_batch = max_batch
+        self._pending: list[tuple[str, tuple, asyncio.Future]] = []
+        self._gets: dict[str, asyncio.Future] = {}
+        self._flush_task: Optional[asyncio.Task] = None
+
+    def _enqueue(self, command: str, args: tuple) -> asyncio.Future:
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((command, args, future))
+        if self._flush_task is None:
+            self._flush_task = asyncio.ensure_future(self._flush())
+        return future
+
+    async def get(self, key: str) -> Optional[bytes]:
+        future = self._gets.get(key)
+        if future is None:
+            future = self._gets[key] = self._enqueue("get", (key,))
+        return await asyncio.shield(future)
+
+    async def set(self, key: str, value: bytes, expire: Optional[int] = None) -> None:
+        self._gets.pop(key, None)
+        await self._enqueue("set", (key, value, expire))
+
+    async def clear(self, namespace: Optional[str] = None, key: Optional[str] = None) -> int:
+        if namespace:
+            for name in [name for name in self._gets if name.startswith(f"{namespace}:")]:
+                del self._gets[name]
+            lua = f"for i, name in ipairs(redis.call('KEYS', '{namespace}:*')) do redis.call('DEL', name); end"
+            return await self._enqueue("eval", (lua,))
+        if key:
+            self._gets.pop(key, None)
+            return await self._enqueue("delete", (key,))
+        return 0
+
+    async def _flush(self) -> None:
+        pending, self._pending = self._pending, []
+        self._gets = {}
+        self._flush_task = None
+        for start in range(0, len(pending), self.max_batch):
+            await self._execute(pending[start:start + self.max_batch])
+
+    async def _execute(self, batch: list) -> None:
+        CACHE_PIPELINE_COMMANDS.observe(len(batch))
+        try:
+            async with self.redis.pipeline(transaction=False) as pipe:
+                for command, args, _ in batch:
+                    if command == "get":
+                        pipe.get(*args)
+                    elif command == "set":
+                        key, value, expire = args
+                        pipe.set(key, value, ex=expire)
+                    elif command == "delete":
+                        pipe.delete(*args)
+                    else:
+                        pipe.eval(*args, 0)
+                results: list[Any] = await pipe.execute(raise_on_error=False)
+        except Exception as e:
+            results = [e] * len(batch)
+        for (_, _, future), result in zip(batch, results):
+            if future.done():
+                continue
+            if isinstance(result, Exception):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+
+
+def build_cache_backend(redis: Redis, pipelining: bool = REDIS_PIPELINING) -> RedisBackend:
+    return PipelinedBackend(redis) if pipelining else RedisBackend(redis)
@@ -0,0 +1,70 @@
+import hashlib
+from datetime import datetime
+from typing import Any
+
+import orjson
+from fastapi import Request
+from fastapi.responses import ORJSONResponse, RedirectResponse, Response
+from sqlalchemy.engine import Row, RowMapping
+
+from config import TRACKED_REDIRECT_STATUS, PERMANENT_REDIRECT_STATUS, PERMANENT_REDIRECT_MAX_AGE
+
+
+REDIRECT_MODES = ("tracked", "permanent")
+
+
+def _default(obj: Any) -> Any:
+    if isinstance(obj, RowMapping):
+        return dict(obj)
+    if isinstance(obj, Row):
+        return dict(obj._mapping)
+    raise TypeError(f"Type is not JSON serializable: {type(obj).__name__}")
+
+
+class FastJSONResponse(ORJSONResponse):
+    def render(self, content: Any) -> bytes:
+        return orjson.dumps(
+            content,
+            default=_default,
+            option=orjson.OPT_NON_STR_KEYS
+        )
+
+
+def rows_response(rows) -> FastJSONResponse:
+    return FastJSONResponse({"status": "success", "data": rows})
+
+
+def body_response(body: bytes) -> Response:
+    return Response(content=body, media_type=FastJSONResponse.media_type)
+
+
+def redirect_response(url: str, mode: str, expires_at: datetime) -> RedirectResponse:
+    if mode == "permanent":
+        # Shared caches may replay the redirect without reaching us, so they
+        # must not keep it past the link's expiry.
+        max_age = min(PERMANENT_REDIRECT_MAX_AGE, max(0, int((expires_at - datetime.now()).total_seconds())))
+        return RedirectResponse(url, status_code=PERMANENT_REDIRECT_STATUS, headers={"Cache-Control": f"public, max-age={max_age}"})
+    return RedirectResponse(url, status_code=TRACKED_REDIRECT_STATUS, headers={"Cache-Control": "no-store"})
+
+
+def link_validators(link) -> dict[str, str]:
+    # No Last-Modified: last_accessed is kept to the minute, so clicks within
+    # one minute would not change it and If-Modified-Since would answer 304
+    # with stale click counts. The ETag covers the click count itself.
+    raw = f"{link.id}:{link.clicks}:{link.last_accessed}:{link.expires_at}:{link.created_at}"
+    return {
+        "ETag": f'W/"{hashlib.md5(raw.encode()).hexdigest()[:16]}"',  # noqa: S324
+        "Cache-Control": "private, no-cache",
+    }
+
+
+def is_not_modified(request: Request, validators: dict[str, str]) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        tags = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+        return "*" in tags or validators["ETag"].removeprefix("W/") in tags
+    return False
+
+
+def not_modified_response(validators: dict[str, str]) -> Response:
+    return Response(status_code=304, headers=validators)
@@ -1,22 +1,33 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Request
 from typing import Optional
-from sqlalchemy import select, update
+from sqlalchemy import select, insert, update, func
 from sqlalchemy.ext.asyncio import AsyncSession
-from fastapi_cache.decorator import cache
-from fastapi_cache import FastAPICache
 from datetime import datetime
 
 from database import get_async_session
 from auth.users import current_active_user
+from caching import CachePolicy, cached
+from coders import list_coder
+from link_cache import load_link_stats
+from enrichment import DIMENSIONS
+from domains import domain_table, is_valid_host, normalize_host, request_domain, short_url_column
+from responses import FastJSONResponse, rows_response, link_validators, is_not_modified, not_modified_response
+from tracing import TracedRoute
 from auth.database import User
-from models import Link, Query, User as User_db
+from models import Domain, Link, Query, QueryRollup, User as User_db
+from routers.schemas import DomainCreate
 
 
 router = APIRouter(
+    route_class=TracedRoute,
     prefix="/premium",
     tags=["Premium"]
 )
 
+expired_stats_cache = CachePolicy(soft_ttl=30, hard_ttl=120, namespace="premium-expired-stats", coder=list_coder)
+queries_cache = CachePolicy(soft_ttl=60, hard_ttl=300, namespace="premium-queries", coder=list_coder)
+breakdown_cache = CachePolicy(soft_ttl=30, hard_ttl=300, namespace="premium-breakdown")
+
 
 @router.put("/premium")
 async def set_premium(status: bool, session: AsyncSession = Depends(get_async_session), current_user: Optional[User] = Depends(current_active_user)):
@@ -29,8 +40,34 @@ async def set_premium(status: bool, session: AsyncSession = Depends(get_async_se
     return {"status": "success"}
 
 
+@router.post("/domains")
+async def create_domain(request: DomainCreate, session: AsyncSession = Depends(get_async_session), current_user: Optional[User] = Depends(current_active_user)):
+    if not current_user:
+        raise HTTPException(status_code=403, detail="You should log in to add domains")
+    status = await session.execute(select(User_db).where(User_db.id == current_user.id))
+    status = status.scalars().first()
+    if not status.is_premium:
+        raise HTTPException(status_code=403, detail="You should be a premium user to add domains")
+
+    host = normalize_host(request.host)
+    if not is_valid_host(host):
+        raise HTTPException(status_code=400, detail="Invalid domain")
+    result = await session.execute(select(Domain.id).where(Domain.host == host))
+    if result.first():
+        raise HTTPException(status_code=400, detail="Domain already exists")
+
+    try:
+        await session.execute(insert(Domain).values(host=host, owner_id=current_user.id, created_at=datetime.now()))
+        await session.commit()
+    except Exception as e:
+        await session.rollback()
+        raise HTTPException(status_code=500, detail="Something went wrong. Try again later") from e
+    domain_table.invalidate()
+    return {"status": "success", "domain": host}
+
+
 @router.get("/expired_stats")
-@cache(expire=60)
+@cached(expired_stats_cache)
 async def get_expired_link_stats(session: AsyncSession = Depends(get_async_session), current_user: Optional[User] = Depends(current_active_user)):
 
     if not current_user:
@@ -41,42 +78,40 @@ async def get_expired_link_stats(session: AsyncSession = Depends(get_async_sessi
     if not status.is_premium:
         raise HTTPException(status_code=403, detail="You should be a premium user to get expired links stats")
 
-    query = select(Link).where(Link.expires_at < datetime.now())
+    query = select(
+        short_url_column(),
+        Link.original_url,
+        Link.created_at,
+        Link.clicks,
+        Link.last_accessed
+    ).where(Link.expires_at < datetime.now())
     result = await session.execute(query)
-    result = result.scalars().all()
+    result = result.mappings().all()
 
     if not result:
         raise HTTPException(status_code=404, detail=("Cannot find any expired links"))
-    
-    data = [{
-        "short_url": f"http://localhost/links/{r.short_code}", 
-        "original_url": r.original_url,
-        "created_at": r.created_at,
-        "clicks": r.clicks,
-        "last_accessed": r.last_accessed
-    } for r in result]
 
-    return {"status": "success", "data": data}
+    return rows_response(result)
 
 
 @router.get("/{short_url}/stats")
-@cache(expire=60)
-async def get_short_url_stats(short_url: str, session: AsyncSession = Depends(get_async_session), current_user: Optional[User] = Depends(current_active_user)):
+async def get_short_url_stats(short_url: str, request: Request, domain: str = Depends(request_domain), session: AsyncSession = Depends(get_async_session), current_user: Optional[User] = Depends(current_active_user)):
     
     if not current_user:
         raise HTTPException(status_code=403, detail="You should log in to get short url stats")
-    
     status = await session.execute(select(User_db).where(User_db.id == current_user.id))
     status = status.scalars().first()
     if not status.is_premium:
         raise HTTPException(status_code=403, detail="You should be a premium user to get links stats")
     
-    query = select(Link).where(Link.short_code == short_url)
-    result = await session.execute(query)
-    result = result.scalars().first()
+    result = await load_link_stats(short_url, session, domain)
 
     if not result:
         raise HTTPException(status_code=404, detail=("Cannot find this short code"))
+
+    validators = link_validators(result)
+    if is_not_modified(request, validators):
+        return not_modified_response(validators)
     
     data = {
         "original_url": result.original_url,
@@ -84,41 +119,82 @@ async def get_short_url_stats(short_url: str, session: AsyncSession = Depends(ge
         "clicks": result.clicks,
         "last_accessed": result.last_accessed
     }
-    return {"status": "success", "data": data}
+    return FastJSONResponse({"status": "success", "data": data}, headers=validators)
 
 
 @router.get("/{short_url}/queries")
-@cache(expire=60)
-async def get_short_url_queries(short_url: str, session: AsyncSession = Depends(get_async_session), current_user: Optional[User] = Depends(current_active_user)):
+async def get_short_url_queries(short_url: str, request: Request, domain: str = Depends(request_domain), session: AsyncSession = Depends(get_async_session), current_user: Optional[User] = Depends(current_active_user)):
 
     if not current_user:
         raise HTTPException(status_code=403, detail="You should log in to get short url queries")
-    
     status = await session.execute(select(User_db).where(User_db.id == current_user.id))
     status = status.scalars().first()
     if not status.is_premium:
         raise HTTPException(status_code=403, detail="You should be a premium user to get short url queries")
 
-    query = select(Link).where(Link.short_code == short_url)
-    result = await session.execute(query)
-    result = result.scalars().all()
+    result = await load_link_stats(short_url, session, domain)
 
     if not result:
         raise HTTPException(status_code=404, detail=("Cannot find this short code"))
 
-    query = select(Query).where(Query.short_code == short_url)
+    validators = link_validators(result)
+    if is_not_modified(request, validators):
+        return not_modified_response(validators)
+
+    response = await _get_short_url_queries(link_id=result.id, version=validators["ETag"], session=session)
+    response.headers.update(validators)
+    return response
+
+
+@cached(queries_cache)
+async def _get_short_url_queries(link_id: int, version: str, session: AsyncSession):
+    # Every click bumps the link version, so entries keyed by it never go stale.
+    query = select(
+        Query.link_id,
+        Query.user_id,
+        Query.short_code,
+        Query.original_link,
+        Query.accessed_at
+    ).where(Query.link_id == link_id)
     result = await session.execute(query)
-    result = result.scalars().all()
+    result = result.mappings().all()
 
     if not result:
         raise HTTPException(status_code=404, detail=("No queries found"))
 
-    data = [{
-        "link_id": r.link_id,
-        "user_id": r.user_id,
-        "short_code": r.short_code,
-        "original_link": r.original_link,
-        "accessed_at": r.accessed_at
-    } for r in result]
+    return rows_response(result)
 
-    return {"status": "success", "data": data}
\ No newline at end of file
+
+@router.get("/{short_url}/breakdown")
+async def get_short_url_breakdown(short_url: str, domain: str = Depends(request_domain), session: AsyncSession = Depends(get_async_session), current_user: Optional[User] = Depends(current_active_user)):
+
+    if not current_user:
+        raise HTTPException(status_code=403, detail="You should log in to get short url breakdown")
+    status = await session.execute(select(User_db).where(User_db.id == current_user.id))
+    status = status.scalars().first()
+    if not status.is_premium:
+        raise HTTPException(status_code=403, detail="You should be a premium user to get short url breakdown")
+
+    result = await load_link_stats(short_url, session, domain)
+
+    if not result:
+        raise HTTPException(status_code=404, detail=("Cannot find this short code"))
+
+    return await _get_short_url_breakdown(link_id=result.id, session=session)
+
+
+@cached(breakdown_cache)
+async def _get_short_url_breakdown(link_id: int, session: AsyncSession):
+    # Rollups are filled by the enrichment worker, so clicks show up here a
+    # few seconds after the redirect.
+    query = select(
+        QueryRollup.dimension,
+        QueryRollup.value,
+        func.sum(QueryRollup.clicks).label("clicks")
+    ).where(QueryRollup.link_id == link_id).group_by(QueryRollup.dimension, QueryRollup.value)
+    result = await session.execute(query)
+
+    data = {dimension: [] for dimension in DIMENSIONS}
+    for row in sorted(result.all(), key=lambda row: -row.clicks):
+        data[row.dimension].append({"value": row.value, "clicks": row.clicks})
+    return {"status": "success", "data": data}
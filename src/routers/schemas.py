@@ -1,8 +1,21 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from typing import Optional
 
+from config import RESOLVE_MAX_CODES
+
 
 class LinkCreate(BaseModel):
     original_link: str
     custom_alias: Optional[str] = None
-    expires_at: Optional[str] = None
\ No newline at end of file
+    expires_at: Optional[str] = None
+    redirect_mode: Optional[str] = None
+    domain: Optional[str] = None
+
+
+class DomainCreate(BaseModel):
+    host: str
+
+
+class ResolveRequest(BaseModel):
+    short_codes: list[str] = Field(max_length=RESOLVE_MAX_CODES)
+    count_clicks: bool = False
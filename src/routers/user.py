@@ -1,24 +1,41 @@
-from fastapi import APIRouter, Depends, HTTPException
-from fastapi.responses import RedirectResponse
+from fastapi import APIRouter, Depends, HTTPException, Request, Query as QueryParam
 from typing import Optional
-from sqlalchemy import select, insert, delete, update
+from sqlalchemy import select, insert, delete, update, and_, or_, tuple_
 from sqlalchemy.ext.asyncio import AsyncSession
-from fastapi_cache.decorator import cache
 from datetime import datetime, timedelta
 from urllib.parse import urlparse
+import base64
 import re
 import secrets
 
+import orjson
+
 from database import get_async_session
 from auth.users import current_active_user
 from auth.database import User
-from routers.schemas import LinkCreate
-from models import Link, Query
+from routers.schemas import LinkCreate, ResolveRequest
+from models import Link, LinkAlias, Query
+from link_cache import load_link, load_links, load_link_stats, invalidate_link
+from enrichment import capture_access
+from user_stats import update_user_stats, user_clicks, load_user_stats
+from domains import domain_table, normalize_host, request_domain, short_url as build_short_url, short_url_column
+from caching import CachePolicy, cached
+from coders import list_coder
+from responses import (
+    REDIRECT_MODES, FastJSONResponse, rows_response, redirect_response, link_validators, is_not_modified,
+    not_modified_response
+)
+from tracing import TracedRoute
+from config import ALIAS_GRACE_PERIOD, LINKS_PAGE_SIZE, LINKS_MAX_PAGE_SIZE
 
 
 days_before_expire = 1
 
+search_cache = CachePolicy(soft_ttl=60, hard_ttl=300, namespace="search")
+expired_stats_cache = CachePolicy(soft_ttl=30, hard_ttl=120, namespace="expired-stats", coder=list_coder)
+
 router = APIRouter(
+    route_class=TracedRoute,
     prefix="/links",
     tags=["Links"]
 )
@@ -52,27 +69,62 @@ def is_valid_date_format(date_string: str) -> bool:
     return False
 
 
+def generate_short_code() -> str:
+    return secrets.token_urlsafe(6)
+
+
+def encode_cursor(created_at: datetime, link_id: int) -> str:
+    return base64.urlsafe_b64encode(orjson.dumps([created_at.isoformat(), link_id])).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> tuple[datetime, int]:
+    try:
+        created_at, link_id = orjson.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        return datetime.fromisoformat(created_at), int(link_id)
+    except (ValueError, TypeError) as e:
+        raise HTTPException(status_code=400, detail="Invalid cursor") from e
+
+
+async def is_short_code_taken(session: AsyncSession, domain: str, short_code: str, link_id: Optional[int] = None) -> bool:
+    query = select(Link.id).where(Link.domain == domain, Link.short_code == short_code)
+    if (await session.execute(query)).first():
+        return True
+    # Old aliases in their grace window still redirect, so only the link they
+    # belong to may take them back.
+    query = select(LinkAlias.link_id).where(
+        LinkAlias.domain == domain, LinkAlias.short_code == short_code, LinkAlias.expires_at > datetime.now()
+    )
+    alias = (await session.execute(query)).first()
+    return alias is not None and alias.link_id != link_id
+
+
 @router.post("/shorten")
 async def shorten_link(request: LinkCreate, session: AsyncSession = Depends(get_async_session), current_user: Optional[User] = Depends(current_active_user)):
 
     if not is_valid_url(request.original_link):
         raise HTTPException(status_code=400, detail="Invalid URL")
-    
+    if request.redirect_mode and request.redirect_mode not in REDIRECT_MODES:
+        raise HTTPException(status_code=400, detail="Invalid redirect mode")
+
+    domain = ""
+    if request.domain:
+        domain = normalize_host(request.domain)
+        found, owner_id = await domain_table.lookup(session, domain)
+        if not found:
+            raise HTTPException(status_code=400, detail="Unknown domain")
+        if owner_id and (not current_user or owner_id != current_user.id):
+            raise HTTPException(status_code=403, detail="Cannot create short urls on domains of other users")
 
     if request.custom_alias:
         if not is_valid_short_code(request.custom_alias):
             raise HTTPException(status_code=400, detail="Invalid custom alias")
-        query = select(Link).where(Link.short_code == request.custom_alias)
-        result = await session.execute(query)
-        if result.scalars().all():
+        if await is_short_code_taken(session, domain, request.custom_alias):
             raise HTTPException(status_code=400, detail="Custom alias already exists")
         short_code = request.custom_alias
     else:
         while True:
-            short_code = secrets.token_urlsafe(6)
-            query = select(Link).where(Link.short_code == short_code)
-            result = await session.execute(query)
-            if not result.scalars().all():
+            short_code = generate_short_code()
+            if not await is_short_code_taken(session, domain, short_code):
                 break
 
     create_date = datetime.now()
@@ -89,121 +141,261 @@ async def shorten_link(request: LinkCreate, session: AsyncSession = Depends(get_
     user_id = current_user.id if current_user else None
 
     link_data = {
+        "domain": domain,
         "short_code": short_code,
         "original_url": request.original_link,
         "created_at": create_date,
         "expires_at": expires_date,
         "clicks": 0,
         "last_accessed": None,
-        "owner_id": user_id
+        "owner_id": user_id,
+        "redirect_mode": request.redirect_mode or "tracked"
     }
     
     query = insert(Link).values(**link_data)
     try:
         await session.execute(query)
+        if user_id:
+            await update_user_stats(session, user_id, links=1, expires_at=expires_date)
         await session.commit()
     except Exception as e:
         await session.rollback()
         raise HTTPException(status_code=500, detail="Something went wrong. Try again later") from e
-    return {"status": "success", "short_url": f"http://localhost/links/{short_code}"}
+    await invalidate_link(short_code, domain)
+    return {"status": "success", "short_url": build_short_url(domain, short_code)}
 
 
 @router.get("/search")
-@cache(expire=60)
+@cached(search_cache)
 async def search_short_url(original_url: str, session: AsyncSession = Depends(get_async_session)):
-    query = select(Link).where(Link.original_url == original_url)
+    query = select(Link.domain, Link.short_code).where(Link.original_url == original_url)
     result = await session.execute(query)
-    result = result.scalars().all()
+    result = result.all()
 
     if not result:
         raise HTTPException(status_code=404, detail=("Cannot find this original url"))
     
-    data = [{"short_url": f"http://localhost/links/{r.short_code}"} for r in result]
+    data = [{"short_url": build_short_url(r.domain, r.short_code)} for r in result]
 
     return {"status": "success", "data": data}
 
 
 @router.get("/expired_stats")
-@cache(expire=60)
+@cached(expired_stats_cache)
 async def get_expired_link_stats(session: AsyncSession = Depends(get_async_session), current_user: Optional[User] = Depends(current_active_user)):
 
     if not current_user:
         raise HTTPException(status_code=403, detail="You should log in to get your expired links stats")
 
-    query = select(Link).where(Link.expires_at < datetime.now()).filter(Link.owner_id == current_user.id)
+    query = select(
+        short_url_column(),
+        Link.original_url,
+        Link.created_at,
+        Link.clicks,
+        Link.last_accessed,
+        Link.expires_at
+    ).where(Link.expires_at < datetime.now()).filter(Link.owner_id == current_user.id)
     result = await session.execute(query)
-    result = result.scalars().all()
+    result = result.mappings().all()
 
     if not result:
         raise HTTPException(status_code=404, detail=("Cannot find expired links created by you"))
-    
-    data = [{
-        "short_url": f"http://localhost/links/{r.short_code}", 
-        "original_url": r.original_url,
-        "created_at": r.created_at,
-        "clicks": r.clicks,
-        "last_accessed": r.last_accessed,
-        "expires_at": r.expires_at
-    } for r in result]
 
-    return {"status": "success", "data": data}
+    return rows_response(result)
 
 
+@router.get("/mine")
+async def list_my_links(
+    cursor: Optional[str] = None,
+    limit: int = QueryParam(LINKS_PAGE_SIZE, ge=1, le=LINKS_MAX_PAGE_SIZE),
+    order: str = QueryParam("desc", pattern="^(asc|desc)$"),
+    status: str = QueryParam("all", pattern="^(all|active|expired)$"),
+    min_clicks: int = QueryParam(0, ge=0),
+    session: AsyncSession = Depends(get_async_session),
+    current_user: Optional[User] = Depends(current_active_user)
+):
+    if not current_user:
+        raise HTTPException(status_code=403, detail="You should log in to list your links")
+
+    # Keyset pagination over ix_link_owner_created_id: every page is one
+    # index range scan from the cursor, however many links come before it.
+    # status and min_clicks are checked on the rows that scan returns, so a
+    # filter that few links pass reads that many more rows per page.
+    position = tuple_(Link.created_at, Link.id)
+    if order == "desc":
+        ordering = (Link.created_at.desc(), Link.id.desc())
+    else:
+        ordering = (Link.created_at.asc(), Link.id.asc())
+    query = select(
+        Link.id,
+        short_url_column(),
+        Link.original_url,
+        Link.created_at,
+        Link.expires_at,
+        Link.clicks,
+        Link.last_accessed,
+        Link.redirect_mode
+    ).where(Link.owner_id == current_user.id).order_by(*ordering).limit(limit + 1)
+
+    if cursor:
+        after = tuple_(*decode_cursor(cursor))
+        query = query.where(position < after if order == "desc" else position > after)
+    now = datetime.now()
+    if status == "active":
+        query = query.where(or_(Link.expires_at.is_(None), Link.expires_at > now))
+    elif status == "expired":
+        query = query.where(Link.expires_at <= now)
+    if min_clicks:
+        query = query.where(Link.clicks >= min_clicks)
+
+    result = await session.execute(query)
+    rows = result.mappings().all()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1]["created_at"], rows[-1]["id"])
+
+    data = [{key: value for key, value in row.items() if key != "id"} for row in rows]
+    return {"status": "success", "data": data, "next_cursor": next_cursor}
+
+
+@router.get("/mine/stats")
+async def get_my_link_stats(session: AsyncSession = Depends(get_async_session), current_user: Optional[User] = Depends(current_active_user)):
+    if not current_user:
+        raise HTTPException(status_code=403, detail="You should log in to get your link stats")
+    return {"status": "success", "data": await load_user_stats(session, current_user.id)}
+
+
+@router.post("/resolve")
+async def resolve_short_urls(payload: ResolveRequest, request: Request, domain: str = Depends(request_domain), session: AsyncSession = Depends(get_async_session), current_user: Optional[User] = Depends(current_active_user)):
+    short_codes = list(dict.fromkeys(payload.short_codes))
+    links = await load_links(short_codes, session, domain)
+
+    now = datetime.fromisoformat(datetime.now().strftime("%Y-%m-%d %H:%M"))
+    results = []
+    resolved = {}
+    for short_code in short_codes:
+        link = links.get(short_code)
+        if link is None:
+            results.append({"short_code": short_code, "status": "missing"})
+        elif link["expires_at"] < now:
+            results.append({"short_code": short_code, "status": "expired"})
+        else:
+            resolved[short_code] = link
+            results.append({
+                "short_code": short_code,
+                "status": "ok",
+                "original_url": link["original_url"],
+                "redirect_mode": link["redirect_mode"],
+                "expires_at": link["expires_at"]
+            })
+
+    if payload.count_clicks and resolved:
+        # Every resolved code counts as one click, as if it was followed once.
+        expires_at = now + timedelta(days=days_before_expire)
+        access = capture_access(request.headers, request.client)
+        try:
+            query = update(Link).where(Link.id.in_({link["id"] for link in resolved.values()})).values(
+                last_accessed=now,
+                clicks=Link.clicks + 1,
+                expires_at=expires_at
+            ).returning(Link.id, Link.owner_id)
+            counted = (await session.execute(query)).all()
+            await session.execute(insert(Query), [
+                {
+                    "link_id": link["id"],
+                    "user_id": current_user.id if current_user else None,
+                    "short_code": short_code,
+                    "original_link": link["original_url"],
+                    "accessed_at": now,
+                    **access
+                }
+                for short_code, link in resolved.items()
+            ])
+            await session.commit()
+        except Exception as e:
+            await session.rollback()
+            raise HTTPException(status_code=500, detail="Something went wrong. Try again later") from e
+        for row in counted:
+            if row.owner_id:
+                user_clicks.add(row.id)
+        for result in results:
+            if result["status"] == "ok":
+                result["expires_at"] = expires_at
+
+    return {"status": "success", "data": results}
+
 
 @router.get("/{short_url}")
-@cache(expire=60)
-async def url_redirect(short_url: str, session: AsyncSession = Depends(get_async_session), current_user: Optional[User] = Depends(current_active_user)):
-    query = select(Link).where(Link.short_code == short_url)
-    message = await session.execute(query)
-    result = message.scalars().first()
+async def url_redirect(short_url: str, request: Request, domain: str = Depends(request_domain), session: AsyncSession = Depends(get_async_session), current_user: Optional[User] = Depends(current_active_user)):
+    now = datetime.fromisoformat(datetime.now().strftime("%Y-%m-%d %H:%M"))
 
-    if not result:
+    link = await load_link(short_url, session, domain=domain)
+    if link and link["expires_at"] < now:
+        link = await load_link(short_url, session, use_cache=False, domain=domain)
+
+    if not link:
         raise HTTPException(status_code=404, detail=("Cannot find this short code"))
-    if result.expires_at < datetime.fromisoformat(datetime.now().strftime("%Y-%m-%d %H:%M")):
+    if link["expires_at"] < now:
         raise HTTPException(status_code=410, detail=("Short link has expired"))
     
     access_time = datetime.now()
     access_time = datetime.fromisoformat(access_time.strftime("%Y-%m-%d %H:%M"))
 
+    expires_at = access_time + timedelta(days=days_before_expire)
+
     try:
+        query = update(Link).where(Link.id == link["id"]).values(
+            last_accessed=access_time,
+            clicks=Link.clicks + 1,
+            expires_at=expires_at
+            ).returning(Link.owner_id)
+        updated = (await session.execute(query)).first()
+        if updated is None:
+            await session.rollback()
+            await invalidate_link(short_url, domain)
+            raise HTTPException(status_code=404, detail=("Cannot find this short code"))
+
         query = insert(Query).values(
-            link_id=result.id,
+            link_id=link["id"],
             user_id=current_user.id if current_user else None,
             short_code=short_url,
-            original_link=result.original_url,
-            accessed_at=access_time
+            original_link=link["original_url"],
+            accessed_at=access_time,
+            **capture_access(request.headers, request.client)
             )
         await session.execute(query)
-        
-        result.last_accessed = access_time
-        result.clicks += 1
-        result.expires_at = access_time + timedelta(days=days_before_expire)
         await session.commit()
-        return RedirectResponse(url=result.original_url)
+        if updated.owner_id:
+            user_clicks.add(link["id"])
+        return redirect_response(link["original_url"], link["redirect_mode"], expires_at)
+    except HTTPException:
+        raise
     except Exception as e:
         await session.rollback()
         raise HTTPException(status_code=500, detail="Something went wrong. Try again later") from e
 
 
 @router.get("/{short_url}/stats")
-@cache(expire=60)
-async def get_short_url_stats(short_url: str, session: AsyncSession = Depends(get_async_session), current_user: Optional[User] = Depends(current_active_user)):
+async def get_short_url_stats(short_url: str, request: Request, domain: str = Depends(request_domain), session: AsyncSession = Depends(get_async_session), current_user: Optional[User] = Depends(current_active_user)):
     
     if not current_user:
         raise HTTPException(status_code=403, detail="You should log in to get short url stats")
     
-    query = select(Link).where(Link.short_code == short_url)
-    result = await session.execute(query)
-    result = result.scalars().first()
+    result = await load_link_stats(short_url, session, domain)
 
     if not result:
         raise HTTPException(status_code=404, detail=("Cannot find this short code"))
     if result.owner_id and not result.owner_id == current_user.id:
         raise HTTPException(status_code=403, detail=("Cannot get stats for short codes created by other logged in users"))
-    print(result.expires_at)
     if datetime.fromisoformat(result.expires_at.strftime("%Y-%m-%d %H:%M")) < datetime.fromisoformat(datetime.now().strftime("%Y-%m-%d %H:%M")):
         raise HTTPException(status_code=404, detail=("Short link has expired. Use /expired_stats instead."))
     
+    validators = link_validators(result)
+    if is_not_modified(request, validators):
+        return not_modified_response(validators)
+
     data = {
         "original_url": result.original_url,
         "created_at": result.created_at,
@@ -211,18 +403,18 @@ async def get_short_url_stats(short_url: str, session: AsyncSession = Depends(ge
         "last_accessed": result.last_accessed,
         "expires_at": result.expires_at
     }
-    return {"status": "success", "data": data}
+    return FastJSONResponse({"status": "success", "data": data}, headers=validators)
 
 
 @router.put("/{short_url}")
-async def update_short_url(short_url: str, new_alias: Optional[str], session: AsyncSession = Depends(get_async_session), current_user: Optional[User] = Depends(current_active_user)):
+async def update_short_url(short_url: str, new_alias: Optional[str], keep_old_alias: bool = False, domain: str = Depends(request_domain), session: AsyncSession = Depends(get_async_session), current_user: Optional[User] = Depends(current_active_user)):
     if not current_user:
         raise HTTPException(status_code=403, detail="You should log in to update short urls")
     
     if new_alias and not is_valid_short_code(new_alias):
         raise HTTPException(status_code=400, detail=("Invalid new alias"))
     
-    query = select(Link).where(Link.short_code == short_url)
+    query = select(Link).where(Link.domain == domain, Link.short_code == short_url)
     result = await session.execute(query)
     result_link = result.scalars().first()
 
@@ -233,15 +425,11 @@ async def update_short_url(short_url: str, new_alias: Optional[str], session: As
     
     if not new_alias or new_alias is None:
         while True:
-            new_alias = secrets.token_urlsafe(6)
-            query = select(Link).where(Link.short_code == new_alias)
-            result = await session.execute(query)
-            if not result.scalars().all():
+            new_alias = generate_short_code()
+            if not await is_short_code_taken(session, domain, new_alias):
                 break
     else:
-        query = select(Link).where(Link.short_code == new_alias)
-        result = await session.execute(query)
-        if result.scalars().all():
+        if await is_short_code_taken(session, domain, new_alias, result_link.id):
             raise HTTPException(status_code=400, detail=("Short code already exists"))
     
     create_time = datetime.now()
@@ -252,30 +440,43 @@ async def update_short_url(short_url: str, new_alias: Optional[str], session: As
         "created_at": create_time
     }
 
-    data_query ={
-        "short_code": new_alias
-    }
-
+    # A rename touches the link row and at most one alias row, however long
+    # the click history is. Query rows keep the code they were made with.
     try:
-        query = update(Link).where(Link.id == result_link.id).values(**data_link)
+        query = delete(LinkAlias).where(
+            LinkAlias.domain == domain,
+            or_(
+                LinkAlias.short_code.in_([short_url, new_alias]),
+                and_(LinkAlias.link_id == result_link.id, LinkAlias.expires_at <= create_time)
+            )
+        )
         await session.execute(query)
-        await session.commit()
-
-        query = update(Query).where(Query.link_id == result_link.id).values(**data_query)
+        query = update(Link).where(Link.id == result_link.id).values(**data_link)
         await session.execute(query)
+        if keep_old_alias and ALIAS_GRACE_PERIOD > 0:
+            query = insert(LinkAlias).values(
+                domain=domain,
+                short_code=short_url,
+                link_id=result_link.id,
+                created_at=create_time,
+                expires_at=create_time + timedelta(seconds=ALIAS_GRACE_PERIOD)
+            )
+            await session.execute(query)
         await session.commit()
-        return {"status": "success", "message": "Short url updated", "short_url": f"http://localhost/links/{new_alias}"}
+        await invalidate_link(short_url, domain)
+        await invalidate_link(new_alias, domain)
+        return {"status": "success", "message": "Short url updated", "short_url": build_short_url(domain, new_alias)}
     except Exception as e:
         await session.rollback()
         raise HTTPException(status_code=500, detail="Something went wrong. Try again later") from e
 
 
 @router.delete("/{short_url}")
-async def delete_short_url(short_url: str, session: AsyncSession = Depends(get_async_session), current_user: Optional[User] = Depends(current_active_user)): 
+async def delete_short_url(short_url: str, domain: str = Depends(request_domain), session: AsyncSession = Depends(get_async_session), current_user: Optional[User] = Depends(current_active_user)): 
     if not current_user:
         raise HTTPException(status_code=403, detail="You should log in to delete short urls")
     
-    query = select(Link).where(Link.short_code == short_url)
+    query = select(Link).where(Link.domain == domain, Link.short_code == short_url)
     result = await session.execute(query)
     result = result.scalars().first()
 
@@ -285,9 +486,20 @@ async def delete_short_url(short_url: str, session: AsyncSession = Depends(get_a
         raise HTTPException(status_code=403, detail=("Cannot delete short codes created by other logged in users"))
     
     try:
-        query = delete(Link).where(Link.short_code == short_url)
+        query = delete(LinkAlias).where(LinkAlias.link_id == result.id)
         await session.execute(query)
+        # The deleted row carries the clicks already flushed into the owner's
+        # total; clicks still buffered for it are dropped by the flush.
+        query = delete(Link).where(Link.id == result.id).returning(
+            Link.owner_id, Link.expires_at, Link.counted_clicks
+        )
+        deleted = (await session.execute(query)).first()
+        if deleted is not None and deleted.owner_id:
+            await update_user_stats(
+                session, deleted.owner_id, links=-1, expires_at=deleted.expires_at, clicks=-deleted.counted_clicks
+            )
         await session.commit()
+        await invalidate_link(short_url, domain)
         return {"status": "success", "message": "Short url deleted"}
     except Exception as e:
         await session.rollback()
@@ -0,0 +1,281 @@
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+from typing import Any, Callable, Optional, Sequence
+
+from fastapi import HTTPException
+from fastapi.routing import APIRoute
+from fastapi_cache.backends import Backend
+from opentelemetry.sdk.trace import ReadableSpan, SpanProcessor, TracerProvider
+from opentelemetry.sdk.trace.export import (
+    BatchSpanProcessor, ConsoleSpanExporter, SimpleSpanProcessor, SpanExporter, SpanExportResult
+)
+from opentelemetry.sdk.trace.sampling import ALWAYS_ON, ParentBased, TraceIdRatioBased
+from opentelemetry.trace import SpanKind, Status, StatusCode, Tracer
+from sqlalchemy import event
+
+from config import (
+    TRACING_ENABLED, TRACING_EXPORTER, TRACING_FILE, TRACING_SAMPLE_RATE, TRACING_SLOW_MS, TRACING_MAX_PENDING_TRACES
+)
+
+
+_SPANS_KEY = "tracing_spans"
+_STATEMENT_LENGTH = 1000
+_TRACE_ID_MASK = (1 << 64) - 1
+
+_provider: Optional[TracerProvider] = None
+_tracer: Optional[Tracer] = None
+
+
+class JsonLinesSpanExporter(SpanExporter):
+    def __init__(self, path: str):
+        self._path = path
+        self._lock = threading.Lock()
+
+    def export(self, spans: Sequence[ReadableSpan]) -> SpanExportResult:
+        lines = "".join(span.to_json(indent=None) + "\n" for span in spans)
+        with self._lock, open(self._path, "a") as f:
+            f.write(lines)
+        return SpanExportResult.SUCCESS
+
+    def shutdown(self) -> None:
+        pass
+
+
+class TailSamplingProcessor(SpanProcessor):
+    # Every span is recorded; a trace is exported once its root span ends if
+    # it was slow, failed, or falls into the sampled fraction of trace ids.
+    def __init__(self, processor: SpanProcessor, sample_rate: float, slow_ms: float, max_pending: int = 2048):
+        self._processor = processor
+        self._bound = int(sample_rate * (1 << 64))
+        self._slow_ns = slow_ms * 1_000_000
+        self._max_pending = max_pending
+        self._pending: OrderedDict[int, list[ReadableSpan]] = OrderedDict()
+        self._decided: OrderedDict[int, bool] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def on_start(self, span, parent_context=None) -> None:
+        self._processor.on_start(span, parent_context)
+
+    def on_end(self, span: ReadableSpan) -> None:
+        trace_id = span.context.trace_id
+        with self._lock:
+            if trace_id in self._decided:
+                spans = [span] if self._decided[trace_id] else []
+            elif span.parent is not None and not span.parent.is_remote:
+                self._pending.setdefault(trace_id, []).append(span)
+                if len(self._pending) > self._max_pending:
+                    self._pending.popitem(last=False)
+                return
+            else:
+                pending = self._pending.pop(trace_id, [])
+                keep = self._keep(span)
+                spans = pending + [span] if keep else []
+                self._decided[trace_id] = keep
+                if len(self._decided) > self._max_pending:
+                    self._decided.popitem(last=False)
+        for finished in spans:
+            self._processor.on_end(finished)
+
+    def _keep(self, span: ReadableSpan) -> bool:
+        if span.status.status_code is StatusCode.ERROR:
+            return True
+        if span.end_time - span.start_time >= self._slow_ns:
+            return True
+        return (span.context.trace_id & _TRACE_ID_MASK) < self._bound
+
+    def shutdown(self) -> None:
+        self._processor.shutdown()
+
+    def force_flush(self, timeout_millis: int = 30000) -> bool:
+        return self._processor.force_flush(timeout_millis)
+
+
+def _build_exporter(name: str) -> Optional[SpanExporter]:
+    if name == "file":
+        return JsonLinesSpanExporter(TRACING_FILE)
+    if name == "console":
+        return ConsoleSpanExporter()
+    if name == "none":
+        return None
+    raise ValueError(f"Unknown tracing exporter {name!r}, expected file, console or none")
+
+
+def setup_tracing(
+    exporter: Optional[SpanExporter] = None,
+    sample_rate: float = TRACING_SAMPLE_RATE,
+    slow_ms: float = TRACING_SLOW_MS,
+    batch: bool = True
+) -> Optional[TracerProvider]:
+    global _provider, _tracer
+    if exporter is None:
+        if not TRACING_ENABLED:
+            return None
+        exporter = _build_exporter(TRACING_EXPORTER)
+        if exporter is None:
+            return None
+
+    processor = BatchSpanProcessor(exporter) if batch else SimpleSpanProcessor(exporter)
+    if slow_ms > 0:
+        provider = TracerProvider(sampler=ALWAYS_ON)
+        provider.add_span_processor(TailSamplingProcessor(processor, sample_rate, slow_ms, TRACING_MAX_PENDING_TRACES))
+    else:
+        provider = TracerProvider(sampler=ParentBased(TraceIdRatioBased(sample_rate)))
+        provider.add_span_processor(processor)
+
+    shutdown_tracing()
+    _provider = provider
+    _tracer = provider.get_tracer("shortener")
+    return provider
+
+
+def shutdown_tracing() -> None:
+    global _provider, _tracer
+    if _provider is not None:
+        _provider.shutdown()
+    _provider = None
+    _tracer = None
+
+
+def get_tracer() -> Optional[Tracer]:
+    return _tracer
+
+
+def _queue_time_ms(header: Optional[str]) -> Optional[float]:
+    # X-Request-Start as set by nginx/heroku style proxies: "t=<epoch>" in
+    # seconds, milliseconds or microseconds.
+    if not header:
+        return None
+    try:
+        started = float(header.removeprefix("t="))
+    except ValueError:
+        return None
+    if started > 1e14:
+        started /= 1_000_000
+    elif started > 1e11:
+        started /= 1000
+    return max(0.0, (time.time() - started) * 1000)
+
+
+class TracedRoute(APIRoute):
+    def get_route_handler(self) -> Callable:
+        handler = super().get_route_handler()
+        name = f"{','.join(sorted(self.methods))} {self.path}"
+
+        async def traced_handler(request):
+            tracer = get_tracer()
+            if tracer is None:
+                return await handler(request)
+
+            attributes = {"http.method": request.method, "http.route": self.path}
+            queue_time = _queue_time_ms(request.headers.get("x-request-start"))
+            if queue_time is not None:
+                attributes["http.queue_time_ms"] = queue_time
+
+            with tracer.start_as_current_span(
+                name, kind=SpanKind.SERVER, attributes=attributes, record_exception=False, set_status_on_exception=False
+            ) as span:
+                try:
+                    response = await handler(request)
+                except HTTPException as e:
+                    span.set_attribute("http.status_code", e.status_code)
+                    if e.status_code >= 500:
+                        span.set_status(Status(StatusCode.ERROR))
+                    raise
+                except Exception as e:
+                    span.record_exception(e)
+                    span.set_status(Status(StatusCode.ERROR))
+                    raise
+                span.set_attribute("http.status_code", response.status_code)
+                return response
+
+        return traced_handler
+
+
+def traced(name: str):
+    def wrapper(func: Callable[..., Any]) -> Callable[..., Any]:
+        @wraps(func)
+        async def inner(*args, **kwargs):
+            tracer = get_tracer()
+            if tracer is None:
+                return await func(*args, **kwargs)
+            with tracer.start_as_current_span(name):
+                return await func(*args, **kwargs)
+
+        return inner
+
+    return wrapper
+
+
+class TracedBackend(Backend):
+    def __init__(self, backend: Backend):
+        self._backend = backend
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._backend, name)
+
+    async def _call(self, operation: str, key: Optional[str], call: Callable[[], Any]) -> Any:
+        tracer = get_tracer()
+        if tracer is None:
+            return await call()
+        attributes = {"cache.backend": type(self._backend).__name__, "cache.key": key or ""}
+        with tracer.start_as_current_span(f"cache.{operation}", kind=SpanKind.CLIENT, attributes=attributes):
+            return await call()
+
+    async def get_with_ttl(self, key: str):
+        return await self._call("get_with_ttl", key, lambda: self._backend.get_with_ttl(key))
+
+    async def get(self, key: str):
+        return await self._call("get", key, lambda: self._backend.get(key))
+
+    async def set(self, key: str, value: bytes, expire: Optional[int] = None) -> None:
+        return await self._call("set", key, lambda: self._backend.set(key, value, expire))
+
+    async def clear(self, namespace: Optional[str] = None, key: Optional[str] = None) -> int:
+        return await self._call("clear", key or namespace, lambda: self._backend.clear(namespace, key))
+
+
+def traced_backend(backend: Backend) -> Backend:
+    if _tracer is None:
+        return backend
+    return TracedBackend(backend)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    tracer = get_tracer()
+    if tracer is None:
+        return
+    operation = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else "SQL"
+    span = tracer.start_span(f"db.{operation}", kind=SpanKind.CLIENT, attributes={
+        "db.system": conn.dialect.name,
+        "db.operation": operation,
+        "db.statement": statement[:_STATEMENT_LENGTH],
+    })
+    conn.info.setdefault(_SPANS_KEY, []).append(span)
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    spans = conn.info.get(_SPANS_KEY)
+    if spans:
+        spans.pop().end()
+
+
+def _handle_error(context):
+    if context.connection is None:
+        return
+    spans = context.connection.info.get(_SPANS_KEY)
+    if spans:
+        span = spans.pop()
+        span.record_exception(context.original_exception)
+        span.set_status(Status(StatusCode.ERROR))
+        span.end()
+
+
+def trace_engine(engine) -> None:
+    sync_engine = getattr(engine, "sync_engine", engine)
+    if event.contains(sync_engine, "before_cursor_execute", _before_cursor_execute):
+        return
+    event.listen(sync_engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(sync_engine, "after_cursor_execute", _after_cursor_execute)
+    event.listen(sync_engine, "handle_error", _handle_error)
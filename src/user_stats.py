@@ -0,0 +1,187 @@
+import asyncio
+import logging
+import time
+from collections import Counter
+from datetime import datetime
+from typing import Optional
+
+from sqlalchemy import DateTime, bindparam, case, delete, func, literal, or_, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+
+from config import USER_STATS_FLUSH_INTERVAL, USER_STATS_RECONCILE_INTERVAL
+from models import Link, UserLinkStats
+
+
+logger = logging.getLogger(__name__)
+
+_COUNTERS = ("total_links", "active_links", "total_clicks")
+_RECONCILE_LOCK = 7301
+
+
+def _insert(session):
+    return postgresql.insert if session.get_bind().dialect.name == "postgresql" else sqlite.insert
+
+
+async def _lock_shared(session) -> None:
+    # Counter updates hold the reconcile lock shared until they commit, so a
+    # reconciliation never overwrites a row with a total read before them.
+    if session.get_bind().dialect.name == "postgresql":
+        await session.execute(select(func.pg_advisory_xact_lock_shared(_RECONCILE_LOCK)))
+
+
+async def update_user_stats(
+    session,
+    owner_id,
+    links: int = 0,
+    expires_at: Optional[datetime] = None,
+    clicks: int = 0
+) -> None:
+    # Runs in the caller's transaction, so the counters change together with
+    # the link row. active_links counts the links that had not expired at
+    # reconciled_at, so a link is added to and removed from it by the same
+    # rule even if it expired in between.
+    await _lock_shared(session)
+    now = datetime.now()
+    active = expires_at is None or expires_at > now
+    query = _insert(session)(UserLinkStats).values(
+        owner_id=owner_id,
+        total_links=links,
+        active_links=links if active else 0,
+        total_clicks=clicks,
+        reconciled_at=now
+    )
+    counted = links
+    if expires_at is not None:
+        counted = case((literal(expires_at, DateTime) > UserLinkStats.reconciled_at, links), else_=0)
+    query = query.on_conflict_do_update(
+        index_elements=[UserLinkStats.owner_id],
+        set_={
+            "total_links": UserLinkStats.total_links + links,
+            "active_links": UserLinkStats.active_links + counted,
+            "total_clicks": UserLinkStats.total_clicks + clicks
+        }
+    )
+    await session.execute(query)
+
+
+class UserClicks:
+    # Redirects only bump an in-memory counter per link; the sums are written
+    # in one transaction per flush, so popular users' redirects never queue on
+    # their summary row lock. Each flush also moves the link's counted_clicks,
+    # the part of link.clicks that total_clicks already includes.
+    def __init__(self):
+        self._pending: Counter = Counter()
+
+    def add(self, link_id: int, clicks: int = 1) -> None:
+        self._pending[link_id] += clicks
+
+    async def flush(self, session_maker) -> int:
+        pending, self._pending = self._pending, Counter()
+        if not pending:
+            return 0
+        # A fixed order keeps workers flushing the same links from deadlocking.
+        link_ids = sorted(pending)
+        try:
+            async with session_maker() as session:
+                await _lock_shared(session)
+                links = Link.__table__
+                query = update(links).where(links.c.id == bindparam("link_id")).values(
+                    counted_clicks=links.c.counted_clicks + bindparam("new_clicks")
+                )
+                await session.execute(
+                    query, [{"link_id": link_id, "new_clicks": pending[link_id]} for link_id in link_ids]
+                )
+                # Links deleted in the meantime are gone here, and their
+                # clicks were never part of the owner's total.
+                result = await session.execute(select(Link.id, Link.owner_id).where(Link.id.in_(link_ids)))
+                totals = Counter()
+                for row in result:
+                    if row.owner_id is not None:
+                        totals[row.owner_id] += pending[row.id]
+                now = datetime.now()
+                for owner_id in sorted(totals, key=str):
+                    query = _insert(session)(UserLinkStats).values(
+                        owner_id=owner_id, total_clicks=totals[owner_id], reconciled_at=now
+                    )
+                    query = query.on_conflict_do_update(
+                        index_elements=[UserLinkStats.owner_id],
+                        set_={"total_clicks": UserLinkStats.total_clicks + query.excluded.total_clicks}
+                    )
+                    await session.execute(query)
+                await session.commit()
+        except Exception:
+            self._pending.update(pending)
+            raise
+        return len(totals)
+
+
+user_clicks = UserClicks()
+
+
+async def reconcile_user_stats(session_maker) -> int:
+    # Recomputes every summary row from the link table. This moves links
+    # that expired since the last run out of active_links. Clicks are summed
+    # from counted_clicks, so clicks still buffered by any worker are added
+    # by their own flush and not twice.
+    now = datetime.now()
+    active = or_(Link.expires_at.is_(None), Link.expires_at > now)
+    totals = select(
+        Link.owner_id,
+        func.count().label("total_links"),
+        func.coalesce(func.sum(case((active, 1), else_=0)), 0).label("active_links"),
+        func.coalesce(func.sum(Link.counted_clicks), 0).label("total_clicks"),
+        literal(now, DateTime).label("reconciled_at")
+    ).where(Link.owner_id.is_not(None)).group_by(Link.owner_id)
+    owners = select(Link.owner_id).where(Link.owner_id.is_not(None))
+
+    async with session_maker() as session:
+        if session.get_bind().dialect.name == "postgresql":
+            # One worker reconciles at a time, after every counter update in
+            # flight has committed; the others skip this round.
+            if not await session.scalar(select(func.pg_try_advisory_xact_lock(_RECONCILE_LOCK))):
+                return 0
+        await session.execute(delete(UserLinkStats).where(UserLinkStats.owner_id.not_in(owners)))
+        query = _insert(session)(UserLinkStats).from_select(
+            ["owner_id", *_COUNTERS, "reconciled_at"], totals
+        )
+        query = query.on_conflict_do_update(
+            index_elements=[UserLinkStats.owner_id],
+            set_={name: getattr(query.excluded, name) for name in (*_COUNTERS, "reconciled_at")}
+        )
+        result = await session.execute(query)
+        await session.commit()
+    logger.info("Reconciled link stats of %s users", result.rowcount)
+    return result.rowcount
+
+
+async def load_user_stats(session, owner_id) -> dict:
+    query = select(
+        UserLinkStats.total_links,
+        UserLinkStats.active_links,
+        UserLinkStats.total_clicks,
+        UserLinkStats.reconciled_at
+    ).where(UserLinkStats.owner_id == owner_id)
+    row = (await session.execute(query)).mappings().first()
+    if row is None:
+        return {"total_links": 0, "active_links": 0, "total_clicks": 0, "reconciled_at": None}
+    return dict(row)
+
+
+async def run_user_stats(
+    session_maker,
+    flush_interval: float = USER_STATS_FLUSH_INTERVAL,
+    reconcile_interval: float = USER_STATS_RECONCILE_INTERVAL
+) -> None:
+    reconciled = time.monotonic()
+    while True:
+        await asyncio.sleep(flush_interval)
+        try:
+            await user_clicks.flush(session_maker)
+        except Exception:
+            logger.warning("Cannot flush user click counters", exc_info=True)
+        if reconcile_interval > 0 and time.monotonic() - reconciled >= reconcile_interval:
+            reconciled = time.monotonic()
+            try:
+                await reconcile_user_stats(session_maker)
+            except Exception:
+                logger.warning("User link stats reconciliation failed", exc_info=True)
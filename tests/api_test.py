@@ -1,8 +1,31 @@
+import io
+import json
+import logging
+import uuid
 import pytest
 from datetime import datetime, timedelta
 from fastapi import status
+from fastapi_cache import FastAPICache
+from sqlalchemy import select, update
 from src.auth.users import current_active_user
-from tests.conftest import standard_user
+from src.link_cache import warm_up_cache, link_cache_key
+from src.link_table import link_table
+from src.models import Link, Domain, Query, UserLinkStats
+from src.domains import domain_table
+from src.enrichment import enrich_pending
+from src.user_stats import reconcile_user_stats, user_clicks
+from src.auth.passwords import password_helper
+from src.log_config import setup_logging, shutdown_logging
+from src.database import get_async_session
+from src.profiling import attach_profile, profile_engine
+import src.profiling as profiling
+from src.tracing import setup_tracing, shutdown_tracing, trace_engine, TracedBackend
+from opentelemetry.sdk.trace.export.in_memory_span_exporter import InMemorySpanExporter
+from src.rate_limit import RateLimitMiddleware
+from src.load_shedding import AIMDLimiter, LoadSheddingMiddleware
+from httpx import AsyncClient, ASGITransport
+from metrics import REGISTRY
+from tests.conftest import standard_user, TestAsyncSessionMaker, test_engine
 
 
 @pytest.mark.asyncio
@@ -196,6 +219,28 @@ async def test_expired_stats_success(standard_client):
     assert response.status_code == status.HTTP_200_OK
 
 
+@pytest.mark.asyncio
+async def test_expired_stats_cached_body(standard_client):
+    expires_at = (datetime.now() + timedelta(days=-1)).strftime("%Y-%m-%d %H:%M")
+    payload = {
+        "original_link": "https://www.google.com",
+        "custom_alias": "example",
+        "expires_at": expires_at
+    }
+    response = await standard_client.post("/links/shorten", json=payload)
+    assert response.status_code == status.HTTP_200_OK
+
+    response = await standard_client.get("/links/expired_stats")
+    assert response.status_code == status.HTTP_200_OK
+    data = response.json()["data"]
+    assert data[0]["short_url"] == "http://localhost/links/example"
+    assert data[0]["expires_at"] == datetime.fromisoformat(expires_at).isoformat()
+
+    cached_response = await standard_client.get("/links/expired_stats")
+    assert cached_response.status_code == status.HTTP_200_OK
+    assert cached_response.content == response.content
+
+
 @pytest.mark.asyncio
 async def test_redirect_success(anon_client):
     payload = {
@@ -240,6 +285,629 @@ async def test_redirect_expired(anon_client):
     assert response.status_code == status.HTTP_410_GONE
 
 
+@pytest.mark.asyncio
+async def test_redirect_cached_counts_clicks(anon_client, db_session):
+    payload = {
+        "original_link": "https://www.google.com",
+        "custom_alias": "example"
+    }
+    response = await anon_client.post("/links/shorten", json=payload)
+    assert response.status_code == status.HTTP_200_OK
+
+    short_code = "example"
+    for _ in range(3):
+        response = await anon_client.get(f"/links/{short_code}", follow_redirects=False)
+        assert response.status_code == status.HTTP_307_TEMPORARY_REDIRECT
+
+    result = await db_session.execute(select(Link.clicks).where(Link.short_code == short_code))
+    assert result.scalar() == 3
+
+
+@pytest.mark.asyncio
+async def test_metrics_route_templates(anon_client):
+    payload = {
+        "original_link": "https://www.google.com",
+        "custom_alias": "example"
+    }
+    response = await anon_client.post("/links/shorten", json=payload)
+    assert response.status_code == status.HTTP_200_OK
+    response = await anon_client.get("/links/example", follow_redirects=False)
+    assert response.status_code == status.HTTP_307_TEMPORARY_REDIRECT
+
+    response = await anon_client.get("/metrics")
+    assert response.status_code == status.HTTP_200_OK
+    assert 'http_request_duration_seconds_count{method="GET",route="/links/{short_url}",status="307"}' in response.text
+    assert 'cache_requests_total{cache="link",result="miss"}' in response.text
+    assert 'route="/links/example"' not in response.text
+
+
+@pytest.mark.asyncio
+async def test_query_profile_server_timing(anon_client, test_app, monkeypatch, caplog):
+    async def _get_profiled_session():
+        async with TestAsyncSessionMaker() as session:
+            attach_profile(session)
+            yield session
+
+    profile_engine(test_engine)
+    monkeypatch.setattr(profiling, "QUERY_PROFILING", "header")
+    monkeypatch.setattr(profiling, "QUERY_PROFILING_SECRET", "profile-secret")
+    monkeypatch.setattr(profiling, "SLOW_QUERY_MS", 0)
+    previous = test_app.dependency_overrides[get_async_session]
+    test_app.dependency_overrides[get_async_session] = _get_profiled_session
+    try:
+        response = await anon_client.post("/links/shorten", json={"original_link": "https://www.google.com", "custom_alias": "example"})
+        assert "server-timing" not in response.headers
+        response = await anon_client.get("/links/example", follow_redirects=False, headers={"X-Query-Profile": "1"})
+        assert "server-timing" not in response.headers
+
+        with caplog.at_level("INFO", logger=profiling.logger.name):
+            response = await anon_client.get("/links/example", follow_redirects=False, headers={"X-Query-Profile": "profile-secret"})
+    finally:
+        test_app.dependency_overrides[get_async_session] = previous
+
+    assert response.status_code == status.HTTP_307_TEMPORARY_REDIRECT
+    assert response.headers["server-timing"].startswith("db;dur=")
+    profile = next(record for record in caplog.records if getattr(record, "event", None) == "query_profile")
+    assert profile.route == "/links/{short_url}"
+    assert profile.query_count >= 2
+    assert any(slow.get("plan") for slow in profile.slow)
+
+
+@pytest.mark.asyncio
+async def test_tracing_spans(anon_client, test_app, monkeypatch):
+    async def _get_traced_session():
+        async with TestAsyncSessionMaker() as session:
+            yield session
+
+    exporter = InMemorySpanExporter()
+    setup_tracing(exporter, sample_rate=1.0, slow_ms=0, batch=False)
+    trace_engine(test_engine)
+    monkeypatch.setattr(FastAPICache, "_backend", TracedBackend(FastAPICache.get_backend()))
+    monkeypatch.setitem(test_app.dependency_overrides, get_async_session, _get_traced_session)
+    try:
+        response = await anon_client.post("/links/shorten", json={"original_link": "https://www.google.com", "custom_alias": "example"})
+        assert response.status_code == status.HTTP_200_OK
+        response = await anon_client.get("/links/example", follow_redirects=False)
+        assert response.status_code == status.HTTP_307_TEMPORARY_REDIRECT
+    finally:
+        shutdown_tracing()
+
+    spans = exporter.get_finished_spans()
+    root = next(span for span in spans if span.name == "GET /links/{short_url}")
+    assert root.attributes["http.status_code"] == 307
+    children = {span.name for span in spans if span.parent and span.parent.span_id == root.context.span_id}
+    assert {"auth.current_user", "cache.get", "db.SELECT", "db.UPDATE", "db.INSERT"} <= children
+
+
+@pytest.mark.asyncio
+async def test_rate_limit_sheds_before_session(anon_client, test_app, monkeypatch):
+    opened = 0
+
+    async def _counting_session():
+        nonlocal opened
+        opened += 1
+        async with TestAsyncSessionMaker() as session:
+            yield session
+
+    monkeypatch.setitem(test_app.dependency_overrides, get_async_session, _counting_session)
+    limited = RateLimitMiddleware(test_app, enabled=True, route_limits="POST /links/shorten=anonymous:2/60", default_limits="")
+    async with AsyncClient(transport=ASGITransport(app=limited), base_url="http://testserver") as client:
+        responses = [await client.post("/links/shorten", json={"original_link": "https://www.google.com"}) for _ in range(4)]
+        search = await client.get("/links/search", params={"original_url": "https://www.google.com"})
+
+    assert [response.status_code for response in responses] == [200, 200, 429, 429]
+    assert int(responses[-1].headers["retry-after"]) >= 1
+    assert search.status_code == status.HTTP_200_OK
+    assert opened == 3
+
+
+@pytest.mark.asyncio
+async def test_load_shedding_prefers_redirects(anon_client, test_app):
+    response = await anon_client.post("/links/shorten", json={"original_link": "https://www.google.com", "custom_alias": "example"})
+    assert response.status_code == status.HTTP_200_OK
+
+    limiter = AIMDLimiter(initial=2, min_limit=1, critical_min_limit=0, queue_timeout_ms=10)
+    shedding = LoadSheddingMiddleware(test_app, enabled=True, limiter=limiter)
+    limiter.in_flight = 1
+    async with AsyncClient(transport=ASGITransport(app=shedding), base_url="http://testserver") as client:
+        stats = await client.get("/links/example/stats")
+        redirect = await client.get("/links/example", follow_redirects=False)
+        limiter.in_flight = limiter.limit
+        queued = await client.get("/links/example", follow_redirects=False)
+
+    assert stats.status_code == status.HTTP_503_SERVICE_UNAVAILABLE
+    assert stats.headers["retry-after"] == "1"
+    assert redirect.status_code == status.HTTP_307_TEMPORARY_REDIRECT
+    assert queued.status_code == status.HTTP_503_SERVICE_UNAVAILABLE
+
+
+@pytest.mark.asyncio
+async def test_redirect_modes(anon_client):
+    payload = {
+        "original_link": "https://www.google.com",
+        "custom_alias": "permanent",
+        "redirect_mode": "permanent"
+    }
+    response = await anon_client.post("/links/shorten", json=payload)
+    assert response.status_code == status.HTTP_200_OK
+    response = await anon_client.post("/links/shorten", json={"original_link": "https://www.google.com", "custom_alias": "tracked"})
+    assert response.status_code == status.HTTP_200_OK
+    response = await anon_client.post("/links/shorten", json={"original_link": "https://www.google.com", "redirect_mode": "sometimes"})
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+    response = await anon_client.get("/links/permanent", follow_redirects=False)
+    assert response.status_code == status.HTTP_301_MOVED_PERMANENTLY
+    assert response.headers["cache-control"].startswith("public, max-age=")
+    assert 0 < int(response.headers["cache-control"].split("=")[1]) <= 86400
+
+    response = await anon_client.get("/links/tracked", follow_redirects=False)
+    assert response.status_code == status.HTTP_307_TEMPORARY_REDIRECT
+    assert response.headers["cache-control"] == "no-store"
+
+
+@pytest.mark.asyncio
+async def test_link_snapshot_serves_redirects(standard_client):
+    for alias in ("snapshot", "renamed"):
+        response = await standard_client.post("/links/shorten", json={"original_link": "https://www.google.com", "custom_alias": alias})
+        assert response.status_code == status.HTTP_200_OK
+
+    def snapshot_hits():
+        return REGISTRY.get_sample_value("cache_requests_total", {"cache": "snapshot", "result": "hit"}) or 0
+
+    await link_table.start(TestAsyncSessionMaker)
+    try:
+        assert link_table.snapshot.count == 2
+        hits = snapshot_hits()
+        response = await standard_client.get("/links/snapshot", follow_redirects=False)
+        assert response.status_code == status.HTTP_307_TEMPORARY_REDIRECT
+        assert response.headers["location"] == "https://www.google.com"
+        assert snapshot_hits() == hits + 1
+
+        response = await standard_client.delete("/links/renamed")
+        assert response.status_code == status.HTTP_200_OK
+        response = await standard_client.put("/links/snapshot", params={"new_alias": "renamed"})
+        assert response.status_code == status.HTTP_200_OK
+        response = await standard_client.get("/links/snapshot", follow_redirects=False)
+        assert response.status_code == status.HTTP_404_NOT_FOUND
+        response = await standard_client.get("/links/renamed", follow_redirects=False)
+        assert response.status_code == status.HTTP_307_TEMPORARY_REDIRECT
+        assert link_table.get("renamed")["original_url"] == "https://www.google.com"
+    finally:
+        await link_table.stop()
+
+
+@pytest.mark.asyncio
+async def test_resolve_short_codes(standard_client):
+    response = await standard_client.post("/links/shorten", json={"original_link": "https://www.google.com", "custom_alias": "live"})
+    assert response.status_code == status.HTTP_200_OK
+    payload = {
+        "original_link": "https://www.google.com",
+        "custom_alias": "old",
+        "expires_at": (datetime.now() - timedelta(days=1)).strftime("%Y-%m-%d %H:%M")
+    }
+    response = await standard_client.post("/links/shorten", json=payload)
+    assert response.status_code == status.HTTP_200_OK
+    await standard_client.get("/links/live", follow_redirects=False)
+
+    response = await standard_client.post("/links/resolve", json={"short_codes": ["live", "old", "nothing", "live"]})
+    assert response.status_code == status.HTTP_200_OK
+    data = response.json()["data"]
+    assert [(item["short_code"], item["status"]) for item in data] == [("live", "ok"), ("old", "expired"), ("nothing", "missing")]
+    assert data[0]["original_url"] == "https://www.google.com"
+    response = await standard_client.get("/links/live/stats")
+    assert response.json()["data"]["clicks"] == 1
+
+    response = await standard_client.post("/links/resolve", json={"short_codes": ["live", "old"], "count_clicks": True})
+    assert response.status_code == status.HTTP_200_OK
+    response = await standard_client.get("/links/live/stats")
+    assert response.json()["data"]["clicks"] == 2
+    response = await standard_client.get("/links/old/stats")
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+
+    response = await standard_client.post("/links/resolve", json={"short_codes": ["x"] * 100000})
+    assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+
+
+@pytest.mark.asyncio
+async def test_list_my_links_pages(standard_client):
+    for index in range(5):
+        payload = {"original_link": f"https://www.google.com/{index}", "custom_alias": f"mine{index}"}
+        if index == 0:
+            payload["expires_at"] = (datetime.now() - timedelta(days=1)).strftime("%Y-%m-%d %H:%M")
+        response = await standard_client.post("/links/shorten", json=payload)
+        assert response.status_code == status.HTTP_200_OK
+    await standard_client.get("/links/mine4", follow_redirects=False)
+
+    seen = []
+    cursor = None
+    for _ in range(3):
+        params = {"limit": 2, **({"cursor": cursor} if cursor else {})}
+        response = await standard_client.get("/links/mine", params=params)
+        assert response.status_code == status.HTTP_200_OK
+        seen += [item["short_url"].rsplit("/", 1)[1] for item in response.json()["data"]]
+        cursor = response.json()["next_cursor"]
+    assert seen == ["mine4", "mine3", "mine2", "mine1", "mine0"]
+    assert cursor is None
+
+    response = await standard_client.get("/links/mine", params={"order": "asc", "status": "active"})
+    assert [item["short_url"].rsplit("/", 1)[1] for item in response.json()["data"]] == ["mine1", "mine2", "mine3", "mine4"]
+    response = await standard_client.get("/links/mine", params={"status": "expired"})
+    assert [item["original_url"] for item in response.json()["data"]] == ["https://www.google.com/0"]
+    response = await standard_client.get("/links/mine", params={"min_clicks": 1})
+    assert [item["clicks"] for item in response.json()["data"]] == [1]
+
+    response = await standard_client.get("/links/mine", params={"cursor": "not-a-cursor"})
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+    response = await standard_client.get("/links/mine", params={"limit": 0})
+    assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+
+
+@pytest.mark.asyncio
+async def test_list_my_links_anon(anon_client):
+    response = await anon_client.get("/links/mine")
+    assert response.status_code == status.HTTP_403_FORBIDDEN
+
+
+@pytest.mark.asyncio
+async def test_my_link_stats(standard_client, standard_user):
+    for index in range(3):
+        payload = {"original_link": f"https://www.google.com/{index}", "custom_alias": f"count{index}"}
+        if index == 0:
+            payload["expires_at"] = (datetime.now() - timedelta(days=1)).strftime("%Y-%m-%d %H:%M")
+        response = await standard_client.post("/links/shorten", json=payload)
+        assert response.status_code == status.HTTP_200_OK
+    for _ in range(2):
+        await standard_client.get("/links/count1", follow_redirects=False)
+    await standard_client.post("/links/resolve", json={"short_codes": ["count2"], "count_clicks": True})
+
+    response = await standard_client.get("/links/mine/stats")
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json()["data"]["total_links"] == 3
+    assert response.json()["data"]["active_links"] == 2
+    assert response.json()["data"]["total_clicks"] == 0
+
+    await user_clicks.flush(TestAsyncSessionMaker)
+    response = await standard_client.get("/links/mine/stats")
+    assert response.json()["data"]["total_clicks"] == 3
+
+    response = await standard_client.delete("/links/count1")
+    assert response.status_code == status.HTTP_200_OK
+    response = await standard_client.get("/links/mine/stats")
+    assert response.json()["data"]["total_links"] == 2
+    assert response.json()["data"]["active_links"] == 1
+    assert response.json()["data"]["total_clicks"] == 1
+
+    async with TestAsyncSessionMaker() as session:
+        await session.execute(update(Link).where(Link.short_code == "count2").values(expires_at=datetime.now() - timedelta(hours=1)))
+        await session.commit()
+    assert await reconcile_user_stats(TestAsyncSessionMaker) >= 1
+    response = await standard_client.get("/links/mine/stats")
+    data = response.json()["data"]
+    assert (data["total_links"], data["active_links"], data["total_clicks"]) == (2, 0, 1)
+    assert data["reconciled_at"] is not None
+
+
+@pytest.mark.asyncio
+async def test_my_link_stats_buffered_clicks(standard_client, standard_user):
+    for index in range(2):
+        payload = {"original_link": f"https://www.google.com/{index}", "custom_alias": f"buffer{index}"}
+        response = await standard_client.post("/links/shorten", json=payload)
+        assert response.status_code == status.HTTP_200_OK
+    await standard_client.get("/links/buffer0", follow_redirects=False)
+    await user_clicks.flush(TestAsyncSessionMaker)
+    for _ in range(2):
+        await standard_client.get("/links/buffer0", follow_redirects=False)
+    await standard_client.get("/links/buffer1", follow_redirects=False)
+
+    # Clicks still buffered are neither counted by the reconciliation nor
+    # added twice by the flush that follows it.
+    await reconcile_user_stats(TestAsyncSessionMaker)
+    response = await standard_client.get("/links/mine/stats")
+    assert response.json()["data"]["total_clicks"] == 1
+    await user_clicks.flush(TestAsyncSessionMaker)
+    response = await standard_client.get("/links/mine/stats")
+    assert response.json()["data"]["total_clicks"] == 4
+
+    await standard_client.get("/links/buffer1", follow_redirects=False)
+    response = await standard_client.delete("/links/buffer1")
+    assert response.status_code == status.HTTP_200_OK
+    await user_clicks.flush(TestAsyncSessionMaker)
+    response = await standard_client.get("/links/mine/stats")
+    assert response.json()["data"]["total_clicks"] == 3
+
+    # A link that expired after the last reconciliation is still counted as
+    # active, so deleting it takes it out of active_links.
+    async with TestAsyncSessionMaker() as session:
+        await session.execute(update(UserLinkStats).values(reconciled_at=datetime.now() - timedelta(hours=2)))
+        await session.execute(update(Link).where(Link.short_code == "buffer0").values(expires_at=datetime.now() - timedelta(hours=1)))
+        await session.commit()
+    response = await standard_client.delete("/links/buffer0")
+    assert response.status_code == status.HTTP_200_OK
+    data = (await standard_client.get("/links/mine/stats")).json()["data"]
+    assert (data["total_links"], data["active_links"], data["total_clicks"]) == (0, 0, 0)
+
+
+@pytest.mark.asyncio
+async def test_my_link_stats_anon(anon_client):
+    response = await anon_client.get("/links/mine/stats")
+    assert response.status_code == status.HTTP_403_FORBIDDEN
+
+
+@pytest.mark.asyncio
+async def test_stats_conditional_requests(standard_client):
+    payload = {
+        "original_link": "https://www.google.com",
+        "custom_alias": "example"
+    }
+    response = await standard_client.post("/links/shorten", json=payload)
+    assert response.status_code == status.HTTP_200_OK
+
+    response = await standard_client.get("/links/example/stats")
+    assert response.status_code == status.HTTP_200_OK
+    etag = response.headers["etag"]
+
+    response = await standard_client.get("/links/example/stats", headers={"If-None-Match": etag})
+    assert response.status_code == status.HTTP_304_NOT_MODIFIED
+    assert response.content == b""
+
+    response = await standard_client.get("/links/example", follow_redirects=False)
+    assert response.status_code == status.HTTP_307_TEMPORARY_REDIRECT
+
+    response = await standard_client.get("/links/example/stats", headers={"If-None-Match": etag})
+    assert response.status_code == status.HTTP_200_OK
+    assert response.headers["etag"] != etag
+    assert response.json()["data"]["clicks"] == 1
+
+    # Clicks within the same minute do not move last_accessed, so dates are
+    # not offered as validators and If-Modified-Since is ignored.
+    assert "last-modified" not in response.headers
+    await standard_client.get("/links/example", follow_redirects=False)
+    response = await standard_client.get("/links/example/stats", headers={"If-Modified-Since": "Fri, 01 Jan 2100 00:00:00 GMT"})
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json()["data"]["clicks"] == 2
+    response = await standard_client.get("/links/example/stats", headers={"If-Modified-Since": "Fri, 01 Jan 2100 00:00:00 GMT"})
+    assert response.status_code == status.HTTP_200_OK
+
+
+@pytest.mark.asyncio
+async def test_premium_queries_conditional_requests(premium_client):
+    payload = {
+        "original_link": "https://www.google.com",
+        "custom_alias": "example"
+    }
+    response = await premium_client.post("/links/shorten", json=payload)
+    assert response.status_code == status.HTTP_200_OK
+    response = await premium_client.get("/links/example", follow_redirects=False)
+    assert response.status_code == status.HTTP_307_TEMPORARY_REDIRECT
+
+    response = await premium_client.get("/premium/example/queries")
+    assert response.status_code == status.HTTP_200_OK
+    etag = response.headers["etag"]
+    response = await premium_client.get("/premium/example/queries", headers={"If-None-Match": etag})
+    assert response.status_code == status.HTTP_304_NOT_MODIFIED
+
+    response = await premium_client.get("/links/example", follow_redirects=False)
+    response = await premium_client.get("/premium/example/queries", headers={"If-None-Match": etag})
+    assert response.status_code == status.HTTP_200_OK
+    assert len(response.json()["data"]) == 2
+
+
+@pytest.mark.asyncio
+async def test_custom_domain_namespaces(premium_client):
+    response = await premium_client.post("/premium/domains", json={"host": "Go.Brand.com"})
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json()["domain"] == "go.brand.com"
+    response = await premium_client.post("/premium/domains", json={"host": "go.brand.com"})
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+    response = await premium_client.post("/premium/domains", json={"host": "not a host"})
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+    payload = {"original_link": "https://brand.com", "custom_alias": "example", "domain": "go.brand.com"}
+    response = await premium_client.post("/links/shorten", json=payload)
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json()["short_url"] == "http://go.brand.com/links/example"
+
+    payload = {"original_link": "https://www.google.com", "custom_alias": "example"}
+    response = await premium_client.post("/links/shorten", json=payload)
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json()["short_url"] == "http://localhost/links/example"
+    response = await premium_client.post("/links/shorten", json=payload)
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+    response = await premium_client.post("/links/shorten", json={**payload, "domain": "unknown.com"})
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+    response = await premium_client.get("/links/example", headers={"Host": "go.brand.com:443"}, follow_redirects=False)
+    assert response.status_code == status.HTTP_307_TEMPORARY_REDIRECT
+    assert response.headers["location"] == "https://brand.com"
+    response = await premium_client.get("/links/example", follow_redirects=False)
+    assert response.status_code == status.HTTP_307_TEMPORARY_REDIRECT
+    assert response.headers["location"] == "https://www.google.com"
+
+    response = await premium_client.get("/links/search", params={"original_url": "https://brand.com"})
+    assert response.json()["data"] == [{"short_url": "http://go.brand.com/links/example"}]
+
+
+@pytest.mark.asyncio
+async def test_domain_added_by_other_worker(premium_client, db_session):
+    payload = {"original_link": "https://brand.com", "custom_alias": "example", "domain": "unknown.com"}
+    response = await premium_client.post("/links/shorten", json=payload)
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+    # Rows inserted without invalidating this worker's table, as another
+    # worker would have done.
+    db_session.add_all([Domain(host="go.other.com"), Domain(host="unknown.com")])
+    await db_session.commit()
+
+    response = await premium_client.post("/links/shorten", json={**payload, "domain": "go.other.com"})
+    assert response.status_code == status.HTTP_200_OK
+    response = await premium_client.get("/links/example", headers={"Host": "go.other.com"}, follow_redirects=False)
+    assert response.status_code == status.HTTP_307_TEMPORARY_REDIRECT
+    assert response.headers["location"] == "https://brand.com"
+
+    # A recent miss is remembered for DOMAIN_MISS_TTL seconds.
+    response = await premium_client.post("/links/shorten", json=payload)
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+
+@pytest.mark.asyncio
+async def test_custom_domain_belongs_to_owner(premium_client, db_session):
+    response = await premium_client.post("/premium/domains", json={"host": "go.brand.com"})
+    assert response.status_code == status.HTTP_200_OK
+    await db_session.execute(update(Domain).values(owner_id=uuid.uuid4()))
+    await db_session.commit()
+    domain_table.invalidate()
+
+    payload = {"original_link": "https://brand.com", "domain": "go.brand.com"}
+    response = await premium_client.post("/links/shorten", json=payload)
+    assert response.status_code == status.HTTP_403_FORBIDDEN
+
+
+@pytest.mark.asyncio
+async def test_premium_breakdown_from_enriched_queries(premium_client, db_session):
+    payload = {
+        "original_link": "https://www.google.com",
+        "custom_alias": "example"
+    }
+    response = await premium_client.post("/links/shorten", json=payload)
+    assert response.status_code == status.HTTP_200_OK
+
+    iphone = "Mozilla/5.0 (iPhone; CPU iPhone OS 17_0 like Mac OS X) AppleWebKit/605.1.15 Version/17.0 Mobile/15E148 Safari/604.1"
+    for headers in (
+        {"User-Agent": iphone, "Referer": "https://www.twitter.com/post/1", "X-Forwarded-For": "203.0.113.7"},
+        {"User-Agent": iphone},
+    ):
+        response = await premium_client.get("/links/example", headers=headers, follow_redirects=False)
+        assert response.status_code == status.HTTP_307_TEMPORARY_REDIRECT
+
+    result = await db_session.execute(select(Query.ip, Query.user_agent, Query.device).order_by(Query.id))
+    first = result.first()
+    # X-Forwarded-For is ignored unless RATE_LIMIT_TRUST_FORWARDED is set.
+    assert first.ip == "127.0.0.1"
+    assert first.user_agent == iphone
+    assert first.device is None
+
+    assert await enrich_pending(TestAsyncSessionMaker) == 2
+    assert await enrich_pending(TestAsyncSessionMaker) == 0
+
+    response = await premium_client.get("/premium/example/breakdown")
+    assert response.status_code == status.HTTP_200_OK
+    data = response.json()["data"]
+    assert data["device"] == [{"value": "mobile", "clicks": 2}]
+    assert data["os"] == [{"value": "iOS", "clicks": 2}]
+    assert data["browser"] == [{"value": "Safari", "clicks": 2}]
+    assert data["country"] == [{"value": "unknown", "clicks": 2}]
+    assert sorted(data["referrer"], key=lambda item: item["value"]) == [
+        {"value": "direct", "clicks": 1}, {"value": "twitter.com", "clicks": 1}
+    ]
+
+
+@pytest.mark.asyncio
+async def test_register_and_login_hash_in_pool(anon_client, monkeypatch):
+    calls = []
+    submit = password_helper.executor.submit
+
+    def tracking_submit(fn, *args):
+        calls.append(fn.__name__)
+        return submit(fn, *args)
+
+    monkeypatch.setattr(password_helper.executor, "submit", tracking_submit)
+
+    response = await anon_client.post("/auth/register", json={"email": "pool@example.com", "password": "secret-password"})
+    assert response.status_code == status.HTTP_201_CREATED
+
+    response = await anon_client.post("/auth/jwt/login", data={"username": "pool@example.com", "password": "secret-password"})
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json()["access_token"]
+
+    response = await anon_client.post("/auth/jwt/login", data={"username": "pool@example.com", "password": "wrong"})
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+    response = await anon_client.post("/auth/jwt/login", data={"username": "nobody@example.com", "password": "wrong"})
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+    assert calls == ["_hash", "_verify_and_update", "_verify_and_update", "_hash"]
+
+
+@pytest.mark.asyncio
+async def test_structured_logs_carry_request_id(anon_client):
+    stream = io.StringIO()
+    root_level = logging.getLogger().level
+    setup_logging("INFO", "json", "access.redirect=0", stream)
+    try:
+        payload = {
+            "original_link": "https://www.google.com",
+            "custom_alias": "example"
+        }
+        response = await anon_client.post("/links/shorten", json=payload, headers={"X-Request-ID": "shorten-1"})
+        assert response.headers["x-request-id"] == "shorten-1"
+        response = await anon_client.get("/links/example", follow_redirects=False)
+        assert response.status_code == status.HTTP_307_TEMPORARY_REDIRECT
+        assert len(response.headers["x-request-id"]) == 32
+        response = await anon_client.post(
+            "/auth/register",
+            json={"email": "logs@example.com", "password": "secret-password"},
+            headers={"X-Request-ID": "register 1"}
+        )
+        assert response.status_code == status.HTTP_201_CREATED
+        register_id = response.headers["x-request-id"]
+        assert register_id != "register 1"
+    finally:
+        shutdown_logging()
+        logging.getLogger().setLevel(root_level)
+
+    lines = [json.loads(line) for line in stream.getvalue().splitlines()]
+    access = [line for line in lines if line["logger"].startswith("access")]
+    assert [(line["route"], line["status"], line["request_id"]) for line in access] == [
+        ("/links/shorten", 200, "shorten-1"),
+        ("/auth/register", 201, register_id),
+    ]
+    registered = next(line for line in lines if line["message"] == "User registered")
+    assert registered["request_id"] == register_id
+    assert registered["user_id"]
+
+
+@pytest.mark.asyncio
+async def test_redirect_deleted_cached_link(standard_client):
+    payload = {
+        "original_link": "https://www.google.com",
+        "custom_alias": "example"
+    }
+    response = await standard_client.post("/links/shorten", json=payload)
+    assert response.status_code == status.HTTP_200_OK
+
+    short_code = "example"
+    response = await standard_client.get(f"/links/{short_code}", follow_redirects=False)
+    assert response.status_code == status.HTTP_307_TEMPORARY_REDIRECT
+
+    response = await standard_client.delete(f"/links/{short_code}")
+    assert response.status_code == status.HTTP_200_OK
+
+    response = await standard_client.get(f"/links/{short_code}", follow_redirects=False)
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+
+
+@pytest.mark.asyncio
+async def test_warm_up_cache_hottest_links(db_session):
+    now = datetime.now()
+    db_session.add_all([
+        Link(short_code="hot", original_url="https://hot.com", created_at=now,
+             expires_at=now + timedelta(days=1), clicks=10, last_accessed=now),
+        Link(short_code="cold", original_url="https://cold.com", created_at=now,
+             expires_at=now + timedelta(days=1), clicks=1, last_accessed=now - timedelta(days=1)),
+        Link(short_code="expired", original_url="https://expired.com", created_at=now,
+             expires_at=now - timedelta(days=1), clicks=100, last_accessed=now)
+    ])
+    await db_session.commit()
+
+    loaded = await warm_up_cache(TestAsyncSessionMaker, limit=1)
+    assert loaded == 1
+
+    backend = FastAPICache.get_backend()
+    assert await backend.get(link_cache_key("hot")) is not None
+    assert await backend.get(link_cache_key("cold")) is None
+    assert await backend.get(link_cache_key("expired")) is None
+
+
 @pytest.mark.asyncio
 async def test_check_stats_anon(anon_client):
     payload = {
@@ -328,6 +996,45 @@ async def test_update_alias_success(standard_client):
     response = await standard_client.put("/links/example", params=payload)
     assert response.status_code == status.HTTP_200_OK
     
+@pytest.mark.asyncio
+async def test_update_alias_keeps_old_alias(standard_client, db_session):
+    payload = {
+        "original_link": "https://www.google.com",
+        "custom_alias": "example"
+    }
+    response = await standard_client.post("/links/shorten", json=payload)
+    assert response.status_code == status.HTTP_200_OK
+    response = await standard_client.get("/links/example", follow_redirects=False)
+    assert response.status_code == status.HTTP_307_TEMPORARY_REDIRECT
+
+    response = await standard_client.put("/links/example", params={"new_alias": "renamed", "keep_old_alias": True})
+    assert response.status_code == status.HTTP_200_OK
+
+    for short_code in ("example", "renamed"):
+        response = await standard_client.get(f"/links/{short_code}", follow_redirects=False)
+        assert response.status_code == status.HTTP_307_TEMPORARY_REDIRECT
+        assert response.headers["location"] == "https://www.google.com"
+    result = await db_session.execute(select(Link.clicks, Link.short_code))
+    assert result.one() == (3, "renamed")
+    result = await db_session.execute(select(Query.short_code).order_by(Query.id))
+    assert result.scalars().all() == ["example", "example", "renamed"]
+
+    response = await standard_client.post("/links/shorten", json=payload)
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+    response = await standard_client.put("/links/renamed", params={"new_alias": "example"})
+    assert response.status_code == status.HTTP_200_OK
+    response = await standard_client.get("/links/renamed", follow_redirects=False)
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+
+    response = await standard_client.put("/links/example", params={"new_alias": "other", "keep_old_alias": True})
+    assert response.status_code == status.HTTP_200_OK
+    response = await standard_client.delete("/links/other")
+    assert response.status_code == status.HTTP_200_OK
+    response = await standard_client.get("/links/example", follow_redirects=False)
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+
+
 @pytest.mark.asyncio
 async def test_update_alias_not_found(standard_client):
     payload = {
@@ -0,0 +1,117 @@
+import asyncio
+import tracemalloc
+from datetime import datetime, timedelta
+
+import pytest
+from httpx import AsyncClient, ASGITransport
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from src.database import get_async_session
+from src.main import app
+from src.models import Base, Link
+from src.routers.user import is_valid_url, is_valid_short_code, is_valid_date_format, generate_short_code
+
+pytest.importorskip("pytest_benchmark")
+
+
+def _allocations(fn, *args, **kwargs):
+    tracemalloc.start()
+    try:
+        fn(*args, **kwargs)
+        before = tracemalloc.take_snapshot()
+        tracemalloc.reset_peak()
+        fn(*args, **kwargs)
+        after = tracemalloc.take_snapshot()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    blocks = sum(stat.count_diff for stat in after.compare_to(before, "filename") if stat.count_diff > 0)
+    return {"allocated_blocks": blocks, "peak_bytes": peak}
+
+
+def _run(benchmark, fn, *args, **kwargs):
+    benchmark.extra_info.update(_allocations(fn, *args, **kwargs))
+    return benchmark(fn, *args, **kwargs)
+
+
+@pytest.fixture(scope="module")
+def bench_app():
+    loop = asyncio.new_event_loop()
+    engine = create_async_engine("sqlite+aiosqlite://", poolclass=StaticPool)
+    session_maker = async_sessionmaker(engine, expire_on_commit=False)
+
+    async def setup():
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        async with session_maker() as session:
+            now = datetime.now()
+            session.add(Link(short_code="bench", original_url="https://www.google.com", created_at=now,
+                             expires_at=now + timedelta(days=30), clicks=0))
+            await session.commit()
+
+    async def get_bench_session():
+        async with session_maker() as session:
+            yield session
+
+    loop.run_until_complete(setup())
+    previous = app.dependency_overrides.get(get_async_session)
+    app.dependency_overrides[get_async_session] = get_bench_session
+    client = AsyncClient(transport=ASGITransport(app=app), base_url="http://bench")
+
+    def request(method, url, **kwargs):
+        return loop.run_until_complete(client.request(method, url, **kwargs))
+
+    yield request
+
+    loop.run_until_complete(client.aclose())
+    loop.run_until_complete(engine.dispose())
+    loop.close()
+    if previous is None:
+        app.dependency_overrides.pop(get_async_session, None)
+    else:
+        app.dependency_overrides[get_async_session] = previous
+
+
+@pytest.mark.benchmark(group="validators")
+def test_bench_is_valid_url(benchmark):
+    assert _run(benchmark, is_valid_url, "https://www.google.com/search?q=shorten")
+
+
+@pytest.mark.benchmark(group="validators")
+def test_bench_is_valid_short_code(benchmark):
+    assert _run(benchmark, is_valid_short_code, "valid_name-123")
+
+
+@pytest.mark.benchmark(group="validators")
+def test_bench_is_valid_date_format(benchmark):
+    assert _run(benchmark, is_valid_date_format, "2023-12-31")
+
+
+@pytest.mark.benchmark(group="validators")
+def test_bench_generate_short_code(benchmark):
+    assert len(_run(benchmark, generate_short_code)) == 8
+
+
+@pytest.mark.benchmark(group="handlers")
+def test_bench_url_redirect(benchmark, bench_app):
+    response = _run(benchmark, bench_app, "GET", "/links/bench", follow_redirects=False)
+    assert response.status_code == 307
+
+
+@pytest.mark.benchmark(group="handlers")
+def test_bench_url_redirect_not_found(benchmark, bench_app):
+    response = _run(benchmark, bench_app, "GET", "/links/missing", follow_redirects=False)
+    assert response.status_code == 404
+
+
+@pytest.mark.benchmark(group="handlers")
+def test_bench_search_short_url(benchmark, bench_app):
+    response = _run(benchmark, bench_app, "GET", "/links/search", params={"original_url": "https://www.google.com"})
+    assert response.status_code == 200
+
+
+@pytest.mark.benchmark(group="handlers")
+def test_bench_shorten_link(benchmark, bench_app):
+    response = _run(benchmark, bench_app, "POST", "/links/shorten", json={"original_link": "https://www.google.com"})
+    assert response.status_code == 200
@@ -10,10 +10,14 @@ import random
 from sqlalchemy import delete
 from httpx import AsyncClient, ASGITransport
 
-from src.models import User, Link, Query, Base
+from src.models import User, Link, LinkAlias, Query, QueryRollup, Domain, UserLinkStats, Base
 from src.database import get_async_session
 from src.main import app
 from src.auth.users import current_active_user
+from src.caching import request_key_builder
+from src.coders import default_coder
+from src.domains import domain_table
+from src.user_stats import user_clicks
 
 os.environ["DATABASE_URL"] = "sqlite+aiosqlite:///test.db"
 
@@ -72,7 +76,10 @@ class InMemoryBackend:
         self.store.pop(key, None)
 
     async def clear(self, namespace=None, key=None):
-        self.store.clear()
+        if key:
+            self.store.pop(key, None)
+        else:
+            self.store.clear()
 
     async def get_with_ttl(self, key):
         return None, self.store.get(key)
@@ -81,7 +88,7 @@ class InMemoryBackend:
 @pytest_asyncio.fixture(scope="session", autouse=True)
 def override_cache():
     in_memory_backend = InMemoryBackend()
-    FastAPICache.init(in_memory_backend, prefix="fastapi-cache-test")
+    FastAPICache.init(in_memory_backend, prefix="fastapi-cache-test", coder=default_coder, key_builder=request_key_builder)
 
 
 transport = None
@@ -103,10 +110,17 @@ async def db_session():
 @pytest_asyncio.fixture(autouse=True)
 async def cleanup_db(db_session):
     yield
+    await user_clicks.flush(TestAsyncSessionMaker)
+    await db_session.execute(delete(UserLinkStats))
     await db_session.execute(delete(User))
     await db_session.execute(delete(Query))
+    await db_session.execute(delete(QueryRollup))
+    await db_session.execute(delete(LinkAlias))
     await db_session.execute(delete(Link))
+    await db_session.execute(delete(Domain))
     await db_session.commit()
+    await FastAPICache.clear()
+    domain_table.invalidate()
 
 
 @pytest_asyncio.fixture
@@ -1,5 +1,37 @@
+import time
+import asyncio
+import uuid
 import pytest
+from datetime import datetime
+from types import SimpleNamespace
+from fastapi.encoders import jsonable_encoder
 from src.routers.user import is_valid_url, is_valid_short_code, is_valid_date_format
+from src.caching import SingleFlight, CachePolicy, cached, request_key_builder
+from src.coders import CODERS, OrjsonCoder, MsgpackCoder, build_coder
+from benchmarks.coders import run as run_coder_benchmark
+from src.responses import rows_response
+from metrics import REGISTRY, instrument_engine
+from src.tracing import TailSamplingProcessor
+from src.load_shedding import AIMDLimiter, LoadSheddingMiddleware, CRITICAL, ANALYTICS
+from src.rate_limit import Limit, RateLimiter, client_identity, client_ip, parse_route_limits
+from src.enrichment import capture_access, parse_user_agent, referrer_host
+from src.auth.passwords import PooledPasswordHelper
+from src.loop_monitor import LoopMonitor
+from src.log_config import SamplingFilter, parse_sampling
+from src.link_table import LinkSnapshot, LinkTable, build_snapshot, snapshot_key
+from src.redis_cache import PipelinedBackend
+from src.circuit_breaker import BreakerBackend, CircuitBreaker, CircuitOpenError, CLOSED, HALF_OPEN, OPEN
+from src.database import db_breaker, get_async_session
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from fastapi import HTTPException
+from src.config import SECRET
+from fastapi_users.jwt import generate_jwt
+from opentelemetry.sdk.trace import TracerProvider
+from opentelemetry.sdk.trace.export import SimpleSpanProcessor
+from opentelemetry.sdk.trace.export.in_memory_span_exporter import InMemorySpanExporter
+from opentelemetry.trace import Status, StatusCode
+from sqlalchemy import create_engine, text
 
 
 @pytest.mark.parametrize("url, expected", [
@@ -37,4 +69,572 @@ def test_short_name_validation(name, expected):
     ("not-a-date", False)
 ])
 def test_date_validation(date_str, expected):
-    assert is_valid_date_format(date_str) == expected
\ No newline at end of file
+    assert is_valid_date_format(date_str) == expected
+
+
+@pytest.mark.asyncio
+async def test_single_flight_coalesces_concurrent_calls():
+    flight = SingleFlight()
+    calls = 0
+
+    async def fetch():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        return "value"
+
+    results = await asyncio.gather(*[flight.do("key", fetch) for _ in range(10)])
+    assert results == ["value"] * 10
+    assert calls == 1
+    assert not flight.in_flight("key")
+
+
+@pytest.mark.asyncio
+async def test_single_flight_shares_errors():
+    flight = SingleFlight()
+
+    async def fetch():
+        await asyncio.sleep(0.01)
+        raise ValueError("db is down")
+
+    results = await asyncio.gather(*[flight.do("key", fetch) for _ in range(3)], return_exceptions=True)
+    assert all(isinstance(r, ValueError) for r in results)
+
+
+def test_request_key_builder_uses_user_id():
+    def handler():
+        pass
+
+    user = SimpleNamespace(id=1, email="first@example.com")
+    same_user = SimpleNamespace(id=1, email="second@example.com")
+    other_user = SimpleNamespace(id=2, email="first@example.com")
+
+    key = request_key_builder(handler, "ns", kwargs={"short_url": "abc", "current_user": user})
+    assert key == request_key_builder(handler, "ns", kwargs={"short_url": "abc", "current_user": same_user})
+    assert key != request_key_builder(handler, "ns", kwargs={"short_url": "abc", "current_user": other_user})
+    assert key != request_key_builder(handler, "ns", kwargs={"short_url": "abd", "current_user": user})
+
+
+def test_cache_policy_jittered_ttls():
+    policy = CachePolicy(soft_ttl=100, hard_ttl=200, jitter=0.1)
+    for _ in range(100):
+        soft_ttl, hard_ttl = policy.ttls()
+        assert 90 <= soft_ttl <= 110
+        assert 180 <= hard_ttl <= 220
+        assert hard_ttl >= soft_ttl
+
+
+@pytest.mark.asyncio
+async def test_cached_serves_stale_on_error():
+    fail = False
+
+    @cached(CachePolicy(soft_ttl=0, hard_ttl=60, jitter=0, refresh_ahead=False, namespace="stale-on-error"))
+    async def handler(value: int):
+        if fail:
+            raise RuntimeError("db is down")
+        return {"value": value}
+
+    assert await handler(value=1) == {"value": 1}
+    await asyncio.sleep(0.01)
+    fail = True
+    assert await handler(value=1) == {"value": 1}
+    with pytest.raises(RuntimeError):
+        await handler(value=2)
+
+
+@pytest.mark.asyncio
+async def test_cached_refreshes_stale_value_in_background():
+    calls = 0
+
+    @cached(CachePolicy(soft_ttl=0, hard_ttl=60, jitter=0, namespace="refresh-ahead"))
+    async def handler():
+        nonlocal calls
+        calls += 1
+        return {"calls": calls}
+
+    assert await handler() == {"calls": 1}
+    await asyncio.sleep(0.01)
+    assert await handler() == {"calls": 1}
+    await asyncio.sleep(0.01)
+    assert calls == 2
+    assert await handler() == {"calls": 2}
+
+
+def _coder_payload():
+    return {"status": "success", "data": [{
+        "user_id": uuid.uuid4(),
+        "short_code": "example",
+        "accessed_at": datetime(2025, 3, 28, 0, 34, 31, 557522),
+        "last_accessed": None,
+        "clicks": i
+    } for i in range(100)]}
+
+
+@pytest.mark.parametrize("coder", [
+    OrjsonCoder,
+    MsgpackCoder,
+    build_coder("orjson", "zlib", min_bytes=0),
+    build_coder("msgpack", "zlib", min_bytes=0),
+    build_coder("orjson", "zlib", min_bytes=10 ** 9)
+])
+def test_coder_renders_same_json(coder):
+    payload = _coder_payload()
+    assert jsonable_encoder(coder.decode(coder.encode(payload))) == jsonable_encoder(payload)
+
+
+def test_msgpack_coder_keeps_types():
+    payload = _coder_payload()
+    assert MsgpackCoder.decode(MsgpackCoder.encode(payload)) == payload
+
+
+def test_compressed_coder_is_smaller():
+    payload = _coder_payload()
+    assert len(build_coder("orjson", "zlib", min_bytes=0).encode(payload)) < len(OrjsonCoder.encode(payload))
+
+
+def test_build_coder_unknown():
+    with pytest.raises(ValueError):
+        build_coder("yaml")
+    with pytest.raises(ValueError):
+        build_coder("orjson", "brotli")
+
+
+def test_rows_response_renders_row_mappings():
+    engine = create_engine("sqlite://")
+    with engine.connect() as conn:
+        rows = conn.execute(text("SELECT 1 AS id, 'example' AS short_code")).mappings().all()
+    response = rows_response(rows)
+    assert response.body == b'{"status":"success","data":[{"id":1,"short_code":"example"}]}'
+
+
+def test_instrument_engine_counts_queries():
+    engine = create_engine("sqlite://")
+    instrument_engine(engine)
+    instrument_engine(engine)
+    count = lambda: REGISTRY.get_sample_value("db_query_duration_seconds_count", {"operation": "SELECT"}) or 0
+    before = count()
+    with engine.connect() as conn:
+        conn.execute(text("SELECT 1"))
+        conn.execute(text("SELECT 2"))
+    assert count() == before + 2
+
+
+def test_tail_sampling_keeps_slow_and_failed_traces():
+    exporter = InMemorySpanExporter()
+    provider = TracerProvider()
+    provider.add_span_processor(TailSamplingProcessor(SimpleSpanProcessor(exporter), sample_rate=0.0, slow_ms=50))
+    tracer = provider.get_tracer("test")
+
+    with tracer.start_as_current_span("fast"):
+        with tracer.start_as_current_span("fast-child"):
+            pass
+    with tracer.start_as_current_span("slow", start_time=time.time_ns() - 100_000_000):
+        with tracer.start_as_current_span("slow-child"):
+            pass
+    with tracer.start_as_current_span("failed") as span:
+        span.set_status(Status(StatusCode.ERROR))
+
+    assert sorted(span.name for span in exporter.get_finished_spans()) == ["failed", "slow", "slow-child"]
+
+
+def test_parse_route_limits():
+    limits = parse_route_limits("POST /links/shorten=anonymous:10/60,premium:100/60; GET /links/{short_url}=free:5/1")
+    assert limits[("POST", "/links/shorten")]["anonymous"] == Limit(10, 60)
+    assert limits[("POST", "/links/shorten")]["premium"].rate == 100 / 60
+    assert limits[("GET", "/links/{short_url}")] == {"free": Limit(5, 1)}
+    with pytest.raises(ValueError):
+        parse_route_limits("GET /links=gold:1/1")
+
+
+def test_local_token_bucket_refills():
+    limiter = RateLimiter(max_keys=1)
+    limit = Limit(2, 1)
+    assert limiter.take_local("a", limit, 100.0) == 0
+    assert limiter.take_local("a", limit, 100.0) == 0
+    assert limiter.take_local("a", limit, 100.0) == pytest.approx(0.5)
+    assert limiter.take_local("a", limit, 100.5) == 0
+    limiter.take_local("b", limit, 100.5)
+    assert list(limiter._buckets) == ["b"]
+
+
+def test_client_identity_uses_token_tier():
+    token = generate_jwt({"sub": "42", "aud": ["fastapi-users:auth"], "premium": True}, SECRET, 60)
+    scope = {"headers": [(b"authorization", f"Bearer {token}".encode())], "client": ("10.0.0.1", 1234)}
+    assert client_identity(scope) == ("premium", "user:42")
+    scope["headers"] = [(b"authorization", b"Bearer broken")]
+    assert client_identity(scope) == ("anonymous", "ip:10.0.0.1")
+
+
+def test_client_ip_trusts_forwarded_only_when_configured():
+    client = ("10.0.0.1", 1234)
+    assert client_ip("203.0.113.7, 10.0.0.2", client) == "10.0.0.1"
+    assert client_ip("203.0.113.7, 10.0.0.2", client, trust_forwarded=True) == "203.0.113.7"
+    assert client_ip(None, None, trust_forwarded=True) is None
+    access = capture_access({"x-forwarded-for": "203.0.113.7"}, client)
+    assert access["ip"] == "10.0.0.1"
+
+
+def test_aimd_limiter_adjusts_limit():
+    limiter = AIMDLimiter(initial=10, min_limit=2, max_limit=11, target_ms=100, backoff=0.5)
+    limiter.on_sample(0.05, overloaded=False)
+    assert limiter.limit == 10
+    limiter.latency[None] = 0.5
+    limiter.on_sample(0.5, overloaded=False)
+    assert limiter.limit == 5
+    limiter.on_sample(0.5, overloaded=False)
+    assert limiter.limit == 5
+    limiter.latency[None] = 0.01
+    limiter.in_flight = 5
+    limiter.on_sample(0.01, overloaded=False)
+    assert limiter.limit == pytest.approx(5.2)
+    limiter._last_decrease = 0.0
+    limiter.on_sample(0.5, overloaded=False)
+    assert limiter.limit > 5.2
+
+
+def test_aimd_limiter_ignores_steady_latency():
+    # A database that is just slow is not queueing: latency far above the
+    # target but close to the baseline keeps the limit.
+    limiter = AIMDLimiter(initial=10, min_limit=2, target_ms=100, backoff=0.5)
+    for _ in range(20):
+        limiter.on_sample(0.3, overloaded=False)
+    assert limiter.limit == 10
+
+    # Baselines are per route: fast redirects do not make a slow search look
+    # like queueing, and the search does not hide queueing of the redirects.
+    limiter = AIMDLimiter(initial=10, min_limit=2, target_ms=100, backoff=0.5)
+    limiter.on_sample(0.01, overloaded=False, route="url_redirect")
+    for _ in range(20):
+        limiter.on_sample(0.3, overloaded=False, route="search_short_url")
+    assert limiter.limit == 10
+    for _ in range(20):
+        limiter.on_sample(0.3, overloaded=False, route="url_redirect")
+    assert limiter.limit == 5
+
+    limiter = AIMDLimiter(initial=2, min_limit=1, critical_min_limit=4)
+    limiter.limit = 1
+    assert [limiter.try_acquire(CRITICAL) for _ in range(5)] == [True, True, True, True, False]
+    assert not limiter.try_acquire(ANALYTICS)
+
+
+@pytest.mark.asyncio
+async def test_load_shedding_skips_other_503s():
+    async def unavailable(scope, receive, send):
+        await send({"type": "http.response.start", "status": 503, "headers": []})
+        await send({"type": "http.response.body", "body": b""})
+
+    limiter = AIMDLimiter(initial=10)
+    shedding = LoadSheddingMiddleware(unavailable, enabled=True, limiter=limiter)
+    shedding._routes = []
+    messages = []
+
+    async def send(message):
+        messages.append(message)
+
+    await shedding({"type": "http", "method": "GET", "path": "/links/example"}, None, send)
+    assert messages[0]["status"] == 503
+    assert limiter.latency == {}
+    assert limiter.limit == 10
+
+
+@pytest.mark.asyncio
+async def test_aimd_limiter_hands_slot_to_critical_waiter():
+    limiter = AIMDLimiter(initial=2, critical_min_limit=0, queue_timeout_ms=1000)
+    assert limiter.try_acquire(ANALYTICS)
+    assert not limiter.try_acquire(ANALYTICS)
+    assert limiter.try_acquire(CRITICAL)
+
+    waiter = asyncio.ensure_future(limiter.acquire(CRITICAL))
+    await asyncio.sleep(0)
+    assert not waiter.done()
+    limiter.release()
+    assert await waiter
+    assert limiter.in_flight == 2
+
+
+@pytest.mark.parametrize("user_agent, expected", [
+    ("Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/126.0 Safari/537.36", ("desktop", "Chrome", "Windows")),
+    ("Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/126.0 Safari/537.36 Edg/126.0", ("desktop", "Edge", "Windows")),
+    ("Mozilla/5.0 (Linux; Android 14; Pixel 8) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/126.0 Mobile Safari/537.36", ("mobile", "Chrome", "Android")),
+    ("Mozilla/5.0 (iPad; CPU OS 17_0 like Mac OS X) AppleWebKit/605.1.15 Version/17.0 Mobile/15E148 Safari/604.1", ("tablet", "Safari", "iOS")),
+    ("Mozilla/5.0 (Macintosh; Intel Mac OS X 14_0; rv:127.0) Gecko/20100101 Firefox/127.0", ("desktop", "Firefox", "macOS")),
+    ("Mozilla/5.0 (compatible; Googlebot/2.1; +http://www.google.com/bot.html)", ("bot", "Other", "Other")),
+    (None, ("unknown", "unknown", "unknown")),
+])
+def test_parse_user_agent(user_agent, expected):
+    assert parse_user_agent(user_agent) == expected
+
+
+@pytest.mark.parametrize("referrer, expected", [
+    ("https://www.twitter.com/post/1", "twitter.com"),
+    ("android-app://com.slack", "com.slack"),
+    ("not a url", None),
+    (None, None),
+])
+def test_referrer_host(referrer, expected):
+    assert referrer_host(referrer) == expected
+
+
+@pytest.mark.asyncio
+async def test_pooled_password_helper_hashes_off_loop():
+    executor = ThreadPoolExecutor(max_workers=2)
+    helper = PooledPasswordHelper(executor, max_pending=2)
+    hashed = await helper.hash_async("secret")
+    assert await helper.verify_and_update_async("secret", hashed) == (True, None)
+    assert (await helper.verify_and_update_async("other", hashed))[0] is False
+
+    helper.pending = 2
+    with pytest.raises(HTTPException) as error:
+        await helper.hash_async("secret")
+    assert error.value.status_code == 503
+    assert error.value.headers["Retry-After"]
+    executor.shutdown()
+
+
+def _block_loop(seconds):
+    time.sleep(seconds)
+
+
+@pytest.mark.asyncio
+async def test_loop_monitor_samples_blocking_call():
+    lag_count = REGISTRY.get_sample_value("event_loop_lag_seconds_count") or 0
+    monitor = LoopMonitor(interval=0.01, threshold_ms=50, sample_ms=10)
+    monitor.start()
+    try:
+        await asyncio.sleep(0.05)
+        _block_loop(0.2)
+        await asyncio.sleep(0.1)
+    finally:
+        monitor.stop()
+
+    assert len(monitor.reports) == 1
+    report = monitor.reports[0]
+    assert report.blocked_ms >= 100
+    assert report.samples >= 5
+    assert "_block_loop" in report.stacks[0][0]
+    assert REGISTRY.get_sample_value("event_loop_lag_seconds_count") > lag_count
+
+
+def test_sampling_filter_keeps_warnings():
+    sampling = SamplingFilter(parse_sampling("access.redirect=0, access=1"))
+    assert not sampling.filter(logging.makeLogRecord({"name": "access.redirect", "levelno": logging.INFO}))
+    assert sampling.filter(logging.makeLogRecord({"name": "access.redirect", "levelno": logging.WARNING}))
+    assert sampling.filter(logging.makeLogRecord({"name": "access", "levelno": logging.INFO}))
+    assert sampling.filter(logging.makeLogRecord({"name": "link_cache", "levelno": logging.INFO}))
+
+
+def test_link_snapshot_lookup(tmp_path):
+    expires_at = datetime(2030, 1, 1, 12, 30)
+    rows = [
+        SimpleNamespace(id=index, domain="", short_code=f"code{index}", original_url=f"https://example.com/{index}",
+                        expires_at=expires_at, redirect_mode="tracked")
+        for index in range(100)
+    ]
+    rows.append(SimpleNamespace(id=100, domain="go.example.com", short_code="code1", original_url="https://example.org",
+                                expires_at=None, redirect_mode="permanent"))
+    data = build_snapshot(rows, time.time())
+
+    path = tmp_path / "links.snapshot"
+    path.write_bytes(data)
+    for snapshot in (LinkSnapshot(data), LinkSnapshot.open(str(path))):
+        assert snapshot.count == 101
+        assert snapshot.lookup(snapshot_key("code42")) == (42, "https://example.com/42", expires_at.timestamp(), 0)
+        assert snapshot.lookup(snapshot_key("code1", "go.example.com"))[:2] == (100, "https://example.org")
+        assert snapshot.lookup(snapshot_key("missing")) is None
+        snapshot.close()
+
+    table = LinkTable()
+    table.snapshot = LinkSnapshot(data)
+    assert table.get("code7") == {
+        "id": 7, "original_url": "https://example.com/7", "expires_at": expires_at, "redirect_mode": "tracked"
+    }
+    assert table.get("code1", "go.example.com")["expires_at"] is None
+    table.discard("code7")
+    assert table.get("code7") is None
+    table.put("new", "", rows[3])
+    assert table.get("new")["id"] == 3
+
+
+class _FakePipeline:
+    def __init__(self, redis):
+        self.redis = redis
+        self.commands = []
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    def get(self, key):
+        self.commands.append(lambda: self.redis.store.get(key))
+
+    def set(self, key, value, ex=None):
+        self.commands.append(lambda: self.redis.store.__setitem__(key, value) or True)
+
+    def delete(self, key):
+        self.commands.append(lambda: 1 if self.redis.store.pop(key, None) is not None else 0)
+
+    async def execute(self, raise_on_error=True):
+        self.redis.round_trips.append(len(self.commands))
+        return [command() for command in self.commands]
+
+
+class _FakeRedis:
+    def __init__(self):
+        self.store = {}
+        self.round_trips = []
+
+    def pipeline(self, transaction=True):
+        return _FakePipeline(self)
+
+
+@pytest.mark.asyncio
+async def test_pipelined_backend_batches_concurrent_commands():
+    redis = _FakeRedis()
+    backend = PipelinedBackend(redis, max_batch=2)
+
+    await asyncio.gather(backend.set("a", b"1", 10), backend.set("b", b"2", 10))
+    assert redis.round_trips == [2]
+
+    results = await asyncio.gather(*(backend.get("a") for _ in range(5)), backend.get("b"))
+    assert results == [b"1"] * 5 + [b"2"]
+    assert redis.round_trips == [2, 2]
+
+    results = await asyncio.gather(*(backend.get(key) for key in "abcde"))
+    assert results == [b"1", b"2", None, None, None]
+    assert redis.round_trips == [2, 2, 2, 2, 1]
+
+
+@pytest.mark.asyncio
+async def test_pipelined_backend_orders_clear_after_queued_set():
+    redis = _FakeRedis()
+    backend = PipelinedBackend(redis)
+    await backend.set("link", b"old", 10)
+
+    stale = asyncio.ensure_future(backend.set("link", b"stale", 10))
+    read = asyncio.ensure_future(backend.get("link"))
+    await asyncio.sleep(0)
+    assert await backend.clear(key="link") == 1
+    await stale
+    assert await read == b"stale"
+    assert "link" not in redis.store
+    assert await backend.get("link") is None
+
+
+@pytest.mark.asyncio
+async def test_circuit_breaker_opens_and_probes():
+    breaker = CircuitBreaker("test", failure_threshold=2, reset_timeout=0.05, call_timeout=0.01)
+
+    async def stalled():
+        await asyncio.sleep(1)
+
+    async def healthy():
+        return "ok"
+
+    for _ in range(2):
+        with pytest.raises(asyncio.TimeoutError):
+            await breaker.call(stalled)
+    assert breaker.state == OPEN
+    assert REGISTRY.get_sample_value("circuit_breaker_state", {"name": "test"}) == 2
+    with pytest.raises(CircuitOpenError):
+        await breaker.call(healthy)
+
+    await asyncio.sleep(0.05)
+    assert breaker.allow()
+    assert breaker.state == HALF_OPEN
+    assert not breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == OPEN
+
+    await asyncio.sleep(0.05)
+    assert await breaker.call(healthy) == "ok"
+    assert breaker.state == CLOSED
+    assert REGISTRY.get_sample_value("circuit_breaker_state", {"name": "test"}) == 0
+
+
+class _StalledBackend:
+    redis = object()
+
+    async def get(self, key):
+        await asyncio.sleep(1)
+
+    async def set(self, key, value, expire=None):
+        await asyncio.sleep(1)
+
+
+@pytest.mark.asyncio
+async def test_breaker_backend_falls_back_to_local_cache():
+    backend = BreakerBackend(_StalledBackend(), CircuitBreaker("stalled-cache", 2, 30, 0.01))
+    assert backend.redis is _StalledBackend.redis
+
+    started = time.perf_counter()
+    await backend.set("key", b"value", 10)
+    assert await backend.get("key") == b"value"
+    assert backend.breaker.state == OPEN
+    assert backend.redis is None
+    assert await backend.get("missing") is None
+    assert time.perf_counter() - started < 0.5
+
+
+class _FlakyBackend:
+    def __init__(self):
+        self.down = False
+        self.data = {}
+
+    async def _check(self):
+        if self.down:
+            raise ConnectionError("redis is down")
+
+    async def get(self, key):
+        await self._check()
+        return self.data.get(key)
+
+    async def set(self, key, value, expire=None):
+        await self._check()
+        self.data[key] = value
+
+    async def clear(self, namespace=None, key=None):
+        await self._check()
+        return 1 if self.data.pop(key, None) is not None else 0
+
+
+@pytest.mark.asyncio
+async def test_breaker_backend_replays_invalidations():
+    redis = _FlakyBackend()
+    backend = BreakerBackend(redis, CircuitBreaker("flaky-cache", 1, 0.01))
+    await backend.set("link", b"old")
+    # Values written while Redis works are not copied locally.
+    assert backend.local.get("link") is None
+
+    redis.down = True
+    assert await backend.clear(key="link") == 0
+    assert backend.breaker.state == OPEN
+    await backend.set("other", b"local")
+    assert await backend.get("other") == b"local"
+    assert await backend.get("link") is None
+
+    redis.down = False
+    await asyncio.sleep(0.02)
+    assert await backend.get("link") is None
+    assert backend.breaker.state == CLOSED
+    assert "link" not in redis.data
+
+
+@pytest.mark.asyncio
+async def test_database_breaker_fails_fast():
+    for _ in range(db_breaker.failure_threshold):
+        db_breaker.record_failure()
+    try:
+        with pytest.raises(HTTPException) as error:
+            await anext(get_async_session())
+        assert error.value.status_code == 503
+        assert "Retry-After" in error.value.headers
+    finally:
+        db_breaker.record_success()
+
+
+def test_coder_benchmark_covers_registry():
+    results = run_coder_benchmark(rows=3, number=1)
+    assert {result["coder"] for result in results} == set(CODERS)
+    assert all(result["bytes"] > 0 for result in results)